@@ -8,3 +8,6 @@ __pycache__/
 
 # Временные файлы
 *.log
+
+# Локальные данные бота (кэш, черновики)
+data/
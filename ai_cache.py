@@ -0,0 +1,144 @@
+"""
+Постоянный кэш результатов GPT и DALL-E.
+
+Записи адресуются по содержимому: ключ — SHA-256 от параметров запроса
+(модель, системный промт, заголовок, текст или промт DALL-E). Хранилище —
+локальный файл SQLite, поэтому готовый черновик переживает перезапуск.
+Каждая запись имеет срок жизни, а при превышении лимита вытесняются записи,
+к которым дольше всего не обращались (LRU).
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 2000
+
+
+def cache_key(*parts):
+    """Строит ключ кэша из частей запроса."""
+    payload = json.dumps(parts, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AICache:
+    """Кэш на SQLite с TTL и LRU-вытеснением. Безопасен для вызова из разных потоков."""
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at);
+            CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires_at);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def _count(self, name):
+        self._conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+
+    def get(self, key, kind):
+        """Возвращает сохранённое значение или None (промах или истёкшая запись)."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM entries WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self._count(f"{kind}_misses")
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._count(f"{kind}_hits")
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, kind, value, ttl):
+        """Сохраняет значение на ttl секунд и вытесняет лишние записи."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, kind, value, created_at, accessed_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, json.dumps(value, ensure_ascii=False), now, now, now + ttl)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        (total,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        overflow = total - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,)
+            )
+
+    def purge(self, kind=None):
+        """Удаляет все записи (или только записи одного вида). Возвращает число удалённых."""
+        with self._lock:
+            if kind:
+                cursor = self._conn.execute("DELETE FROM entries WHERE kind = ?", (kind,))
+            else:
+                cursor = self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self):
+        """Возвращает {kind: {'entries', 'hits', 'misses', 'hit_rate'}} по всем видам записей."""
+        now = time.time()
+        with self._lock:
+            entries = dict(self._conn.execute(
+                "SELECT kind, COUNT(*) FROM entries WHERE expires_at > ? GROUP BY kind", (now,)
+            ).fetchall())
+            counters = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+
+        kinds = set(entries)
+        for name in counters:
+            kinds.add(name.rsplit('_', 1)[0])
+
+        result = {}
+        for kind in sorted(kinds):
+            hits = counters.get(f"{kind}_hits", 0)
+            misses = counters.get(f"{kind}_misses", 0)
+            lookups = hits + misses
+            result[kind] = {
+                'entries': entries.get(kind, 0),
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+            }
+        return result
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,102 @@
+"""
+Бенчмарк индекса почти-дубликатов (dedup.py).
+
+Наполняет индекс N подписями (для скорости — случайными, как у попарно
+непохожих статей) и M подписями синтетических статей, затем для каждой статьи
+строит перепечатку (новый вступительный абзац, обрезанный конец, правки
+отдельных слов) и измеряет:
+- время minhash() для текста статьи и время find() в индексе (p50/p95/max);
+- долю найденных перепечаток и ложные срабатывания на новых статьях.
+
+Запуск:
+    python benchmarks/bench_dedup.py [--signatures N] [--articles M] [--words W]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dedup  # noqa: E402
+from metrics import percentile  # noqa: E402
+
+INTRO = (
+    "Наш корреспондент сообщает, что сегодня на пресс-конференции компания "
+    "сделала заявление, которое приводим с небольшими сокращениями."
+).split()
+
+
+def make_vocabulary(rng, size=5000):
+    letters = "абвгдежзиклмнопрстуфхцчшщэюя"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+
+def make_article(rng, vocabulary, words):
+    # Частые слова встречаются чаще (как в живом тексте), поэтому и у разных статей есть общие шинглы
+    return [vocabulary[min(int(rng.paretovariate(1.0)) - 1, len(vocabulary) - 1)] for _ in range(words)]
+
+
+def make_reprint(rng, words):
+    words = INTRO + words[:int(len(words) * 0.85)]
+    for _ in range(len(words) // 50):
+        words[rng.randrange(len(words))] = "правка"
+    return words
+
+
+def timings_ms(values):
+    values = sorted(value * 1000 for value in values)
+    return f"p50 {percentile(values, 0.5):.3f} мс, p95 {percentile(values, 0.95):.3f} мс, max {values[-1]:.3f} мс"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--signatures', type=int, default=100_000, help="случайных подписей в индексе")
+    parser.add_argument('--articles', type=int, default=300, help="синтетических статей в индексе")
+    parser.add_argument('--words', type=int, default=600, help="слов в статье")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng)
+    path = os.path.join(tempfile.mkdtemp(prefix='bench-dedup-'), 'dedup.sqlite3')
+    index = dedup.DuplicateIndex(path)
+
+    started = time.perf_counter()
+    for _ in range(args.signatures):
+        index.add(tuple(rng.getrandbits(32) for _ in range(dedup.SIGNATURE_SIZE)))
+    articles = [make_article(rng, vocabulary, args.words) for _ in range(args.articles)]
+    for number, words in enumerate(articles):
+        index.add(dedup.minhash(" ".join(words)), title=f"статья {number}", draft_id=number)
+    print(f"Индекс: {len(index)} подписей, наполнение {time.perf_counter() - started:.1f} с")
+
+    started = time.perf_counter()
+    dedup.DuplicateIndex(path).close()
+    print(f"Загрузка индекса с диска: {time.perf_counter() - started:.2f} с, файл {os.path.getsize(path) / 2**20:.1f} МБ")
+
+    signing, lookups, found, false_positives = [], [], 0, 0
+    for number, words in enumerate(articles):
+        for text, expected in ((" ".join(make_reprint(rng, words)), number),
+                               (" ".join(make_article(rng, vocabulary, args.words)), None)):
+            t0 = time.perf_counter()
+            signature = dedup.minhash(text)
+            t1 = time.perf_counter()
+            match = index.find(signature)
+            t2 = time.perf_counter()
+            signing.append(t1 - t0)
+            lookups.append(t2 - t1)
+            if expected is None:
+                false_positives += match is not None
+            else:
+                found += match is not None and match['draft_id'] == expected
+
+    print(f"minhash: {timings_ms(signing)}")
+    print(f"find:    {timings_ms(lookups)}")
+    print(f"Найдено перепечаток: {found} из {len(articles)}; ложных срабатываний на новых статьях: {false_positives}")
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
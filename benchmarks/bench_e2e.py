@@ -0,0 +1,237 @@
+"""
+Сквозной бенчмарк конвейера без ключей и сети.
+
+Поднимает локальные заглушки OpenAI, Telegram Bot API и сайта со статьями
+(benchmarks/fakes.py), настраивает бота на них через переменные окружения
+(OPENAI_BASE_URL, TELEGRAM_API_URL) и прогоняет обработчики handle_url,
+handle_manual_text и publish_post с заданной параллельностью. Отчёт:
+пропускная способность, задержки обработчиков (p50/p95/max) и p50/p95 по
+этапам конвейера из metrics, а также число вызовов API.
+
+Ограничители частоты бота по умолчанию сняты, чтобы мерить сам конвейер;
+--real-limits оставляет боевые лимиты. Проверка почти-дубликатов тоже выключена
+(страницы корпуса повторяются); --dedup её включает.
+
+Запуск:
+    python benchmarks/bench_e2e.py [--requests N] [--concurrency C] [--scenarios url,manual,publish]
+                                   [--openai-latency S] [--dalle-latency S] [--site-latency S]
+                                   [--telegram-latency S] [--real-limits] [--dedup] [--json FILE]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import load_corpus  # noqa: E402
+from fakes import ArticleSite, FakeOpenAI, FakeTelegram  # noqa: E402
+
+ADMIN_ID = 1
+CHANNEL_ID = -1001000
+SCENARIOS = ('url', 'manual', 'publish')
+
+update_ids = itertools.count(1)
+
+
+def configure_env(args, openai, telegram):
+    """Переменные окружения для bot.py: до его импорта, т.к. он читает их при загрузке."""
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '1000:bench',
+        'OPENAI_API_KEY': 'sk-bench',
+        'OPENAI_BASE_URL': f"{openai.url}/v1",
+        'TELEGRAM_API_URL': telegram.url,
+        'ADMIN_ID': str(ADMIN_ID),
+        'CHANNEL_ID': str(CHANNEL_ID),
+        'WEBHOOK_URL': 'http://127.0.0.1/',
+        'DATA_DIR': tempfile.mkdtemp(prefix='bench-e2e-'),
+    })
+    if not args.real_limits:
+        os.environ.update({'TELEGRAM_RPS': '10000', 'OPENAI_TEXT_RPM': '1000000', 'OPENAI_IMAGE_RPM': '1000000'})
+    if not args.dedup:
+        os.environ['DEDUP_THRESHOLD'] = '0'
+
+
+def make_update(bot_module, update_id, text):
+    from telegram import Update
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': ADMIN_ID, 'type': 'private'},
+            'from': {'id': ADMIN_ID, 'is_bot': False, 'first_name': 'Admin'},
+            'text': text,
+        },
+    }, bot_module.app.bot)
+
+
+async def run_scenario(bot_module, handler, texts, concurrency, with_args=False):
+    """Прогоняет обработчик по всем текстам с ограниченной параллельностью."""
+    from telegram.ext import CallbackContext
+
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = []
+
+    async def one(text):
+        update = make_update(bot_module, next(update_ids), text)
+        context = CallbackContext.from_update(update, bot_module.app)
+        if with_args:
+            context.args = text.split()[1:]
+        async with slots:
+            started = time.perf_counter()
+            try:
+                await handler(update, context)
+            except Exception as e:
+                errors.append(repr(e))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(text) for text in texts))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(texts),
+        'concurrency': concurrency,
+        'wall_s': round(wall, 3),
+        'throughput_rps': round(len(texts) / wall, 3) if wall else None,
+        'latency_p50_s': round(statistics.median(latencies), 3),
+        'latency_p95_s': round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 3),
+        'latency_max_s': round(latencies[-1], 3),
+        'errors': errors[:10],
+    }
+
+
+def stage_report(metrics):
+    return {
+        stage: {
+            'count': item['count'],
+            'p50_s': round(item['p50'], 4),
+            'p95_s': round(item['p95'], 4),
+        }
+        for stage, item in sorted(metrics.stage_summary().items())
+    }
+
+
+def manual_text(index):
+    paragraph = (
+        "Astronomers observed an unexpected signal from a distant galaxy while testing a new "
+        "telescope array. The researchers say the data does not fit current models of neutron star "
+        "evolution, and further observations are planned for next year. "
+    )
+    return f"Manual article #{index}. " + paragraph * 5
+
+
+async def main_async(args):
+    pages = load_corpus(args.corpus)
+    site = ArticleSite(pages, latency=args.site_latency).start()
+    openai = FakeOpenAI(
+        first_token_latency=args.openai_latency,
+        token_interval=args.token_interval,
+        image_latency=args.dalle_latency,
+        image_url=f"{site.url}/images/dalle.png",
+    ).start()
+    telegram = FakeTelegram(latency=args.telegram_latency).start()
+    configure_env(args, openai, telegram)
+
+    import bot as bot_module
+    import metrics
+
+    bot_module.build_application()
+    await bot_module.app.initialize()
+    results = {}
+    try:
+        names = list(pages)
+        for scenario in args.scenarios:
+            metrics.registry.reset()
+            calls_before = len(telegram.calls), len(openai.calls)
+            if scenario == 'url':
+                texts = [f"{site.url}/article/{names[i % len(names)]}?n={i}" for i in range(args.requests)]
+                report = await run_scenario(bot_module, bot_module.handle_url, texts, args.concurrency)
+            elif scenario == 'manual':
+                texts = [manual_text(i) for i in range(args.requests)]
+                report = await run_scenario(bot_module, bot_module.handle_manual_text, texts, args.concurrency)
+            else:
+                # Публикуются черновики, созданные предыдущими сценариями
+                draft_ids = [draft['id'] for draft in bot_module.drafts.list()][:args.requests]
+                if not draft_ids:
+                    print("publish: нет черновиков — запустите перед ним url или manual")
+                    continue
+                texts = [f"/publish {draft_id}" for draft_id in draft_ids]
+                report = await run_scenario(bot_module, bot_module.publish_post, texts, args.concurrency, with_args=True)
+                report['published'] = telegram.count('sendPhoto', chat_id=CHANNEL_ID)
+
+            telegram_calls = telegram.calls[calls_before[0]:]
+            report['telegram_calls'] = {
+                method: sum(1 for call in telegram_calls if call['method'] == method)
+                for method in sorted({call['method'] for call in telegram_calls})
+            }
+            openai_calls = openai.calls[calls_before[1]:]
+            report['openai_calls'] = {
+                f"{kind}:{model}": sum(1 for call in openai_calls if call[:2] == (kind, model))
+                for kind, model in sorted({call[:2] for call in openai_calls})
+            }
+            report['stages'] = stage_report(metrics)
+            results[scenario] = report
+            print_report(scenario, report)
+    finally:
+        await bot_module.app.shutdown()
+        await bot_module.shutdown_clients(bot_module.app)
+        for server in (site, openai, telegram):
+            await server.stop()
+    return results
+
+
+def print_report(scenario, report):
+    print(f"\n== {scenario}: {report['requests']} запросов, параллельно {report['concurrency']}")
+    print(
+        f"   {report['wall_s']:.2f} с, {report['throughput_rps']:.2f} запр/с; "
+        f"задержка p50 {report['latency_p50_s']:.2f} с, p95 {report['latency_p95_s']:.2f} с, max {report['latency_max_s']:.2f} с"
+    )
+    if report['errors']:
+        print(f"   ошибки: {report['errors']}")
+    print(f"   Telegram: {report['telegram_calls']}")
+    print(f"   OpenAI: {report['openai_calls']}")
+    print(f"   {'этап':<20}{'замеров':>9}{'p50, с':>10}{'p95, с':>10}")
+    for stage, item in report['stages'].items():
+        print(f"   {stage:<20}{item['count']:>9}{item['p50_s']:>10.3f}{item['p95_s']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20, help="запросов в каждом сценарии")
+    parser.add_argument('--concurrency', type=int, default=5)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="через запятую: url, manual, publish")
+    parser.add_argument('--corpus', help="каталог с сохранёнными страницами *.html")
+    parser.add_argument('--openai-latency', type=float, default=0.5, help="задержка до первого токена, с")
+    parser.add_argument('--token-interval', type=float, default=0.02, help="пауза между фрагментами потока, с")
+    parser.add_argument('--dalle-latency', type=float, default=3.0)
+    parser.add_argument('--site-latency', type=float, default=0.1)
+    parser.add_argument('--telegram-latency', type=float, default=0.05)
+    parser.add_argument('--real-limits', action='store_true', help="не снимать ограничители частоты бота")
+    parser.add_argument('--dedup', action='store_true', help="не выключать проверку почти-дубликатов")
+    parser.add_argument('--json', help="куда записать результаты в JSON")
+    args = parser.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+    results = asyncio.run(main_async(args))
+
+    if args.json:
+        config = {key: value for key, value in vars(args).items() if key != 'json'}
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'config': config, 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты записаны в {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Бенчмарк извлечения статьи: старый путь против нового.
+
+Старый путь (как было в bot.py): два полных разбора страницы html.parser —
+один в parse_article ради заголовка и текста, второй в find_image_in_article
+ради og:image. Новый путь (fetcher.extract_article): страница обрезана до
+MAX_PAGE_BYTES, og:image берётся сканированием <head>, и выполняется один
+разбор — lxml, если он установлен.
+
+Запуск:
+    python benchmarks/bench_extraction.py [--corpus DIR] [--repeat N] [--json FILE]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from urllib.parse import urljoin
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import fetcher  # noqa: E402
+from corpus import load_corpus  # noqa: E402
+
+BASE_URL = "https://example.org/news/article"
+
+
+def legacy_extract(html, url):
+    """Копия исходного пути: parse_article + find_image_in_article, два разбора html.parser."""
+    soup = BeautifulSoup(html, 'html.parser')
+    title = soup.find('h1')
+    title_text = title.get_text(strip=True) if title else "Заголовок не найден"
+    article_body = soup.find('article') or soup.find('main') or soup.find('div', class_=re.compile(r'(content|body|post|article)', re.I))
+    text = ""
+    if article_body:
+        for script_or_style in article_body(["script", "style", "nav", "footer"]):
+            script_or_style.decompose()
+        paragraphs = article_body.find_all('p')
+        text = "\n\n".join(p.get_text(strip=True) for p in paragraphs if p.get_text(strip=True))
+
+    soup = BeautifulSoup(html, 'html.parser')
+    image_url = None
+    og_image = soup.find('meta', property='og:image')
+    if og_image and og_image.get('content'):
+        image_url = og_image['content']
+    else:
+        body = soup.find('article') or soup.find('main')
+        if body:
+            first_img = body.find('img', class_=re.compile(r'(main|hero|featured|post-image)', re.I))
+            if first_img and first_img.get('src'):
+                image_url = urljoin(url, first_img['src'])
+    return title_text, text, image_url
+
+
+def new_extract(html, url, parser):
+    document = fetcher.extract_article(html[:fetcher.MAX_PAGE_BYTES], url, parser=parser)
+    return document.title, document.text, document.image_url
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help="каталог с сохранёнными страницами *.html")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help="куда записать результаты в JSON")
+    args = parser.parse_args()
+
+    parsers = ['html.parser']
+    if fetcher.DEFAULT_HTML_PARSER == 'lxml':
+        parsers.append('lxml')
+
+    pages = load_corpus(args.corpus)
+    results = []
+    header = f"{'страница':<28}{'КБ':>8}{'старый, мс':>13}" + "".join(f"{'новый ' + p + ', мс':>22}" for p in parsers)
+    print(header)
+    print("-" * len(header))
+
+    for name, html in pages.items():
+        legacy_ms = measure(lambda: legacy_extract(html, BASE_URL), args.repeat)
+        row = {'page': name, 'kb': round(len(html) / 1024, 1), 'legacy_ms': round(legacy_ms, 2)}
+        line = f"{name:<28}{row['kb']:>8}{legacy_ms:>13.1f}"
+        for p in parsers:
+            new_ms = measure(lambda: new_extract(html, BASE_URL, p), args.repeat)
+            row[f'new_{p}_ms'] = round(new_ms, 2)
+            line += f"{new_ms:>12.1f} (x{legacy_ms / new_ms:>4.1f})     "
+        results.append(row)
+        print(line)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'repeat': args.repeat, 'parsers': parsers, 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты записаны в {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Бенчмарк опроса RSS-лент (feeds.py) без сети.
+
+Поднимает заглушку FeedSite с N лентами и прогоняет раунды опроса так же, как
+бот (check_feed с ограниченной параллельностью):
+1. первый опрос — все ленты отдают полное тело;
+2. повторный опрос без изменений — условные запросы, ответы 304;
+3. опрос после новых записей в части лент — тело получают только они.
+
+Для каждого раунда: время, ответы 200/304, байты тел, исходы feed_fetch
+(ok — разобрана, not_modified — 304, unchanged — тело совпало по хэшу) и
+число новых записей. --no-conditional — сервер без ETag/Last-Modified: тогда
+повторный разбор экономит сравнение хэша тела.
+
+Запуск:
+    python benchmarks/bench_feeds.py [--feeds N] [--items K] [--updated M] [--concurrency C] [--no-conditional]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import FeedSite  # noqa: E402
+
+
+async def poll(feeds_module, store, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(url):
+        async with slots:
+            entries, state = await feeds_module.check_feed(store, url)
+            store.mark_seen(url, entries)
+            if state:
+                store.update(url, **state)
+            return len(entries)
+
+    return sum(await asyncio.gather(*(one(feed['url']) for feed in store.list())))
+
+
+async def main_async(args):
+    import fetcher
+    import feeds
+    import metrics
+
+    site = FeedSite(items_per_feed=args.items, conditional=not args.conditional_off).start()
+    store = feeds.FeedStore(os.path.join(tempfile.mkdtemp(prefix='bench-feeds-'), 'feeds.sqlite3'))
+    names = [f"feed{i}" for i in range(args.feeds)]
+    for name in names:
+        store.add(site.add_feed(name, items=args.items))
+
+    rounds = [
+        ("первый опрос", lambda: None),
+        ("без изменений", lambda: None),
+        (f"новые записи в {args.updated} лентах", lambda: [site.publish(name) for name in names[:args.updated]]),
+    ]
+    print(f"Лент: {args.feeds}, записей в ленте: {args.items}, условные запросы: {'нет' if args.conditional_off else 'да'}")
+    print(f"{'раунд':<32}{'время, с':>10}{'200':>6}{'304':>6}{'КБ тел':>9}{'новых':>7}  исходы")
+    try:
+        for title, prepare in rounds:
+            prepare()
+            metrics.registry.reset()
+            responses_before = dict(site.responses)
+            bytes_before = site.bytes_sent
+            started = time.perf_counter()
+            new = await poll(feeds, store, args.concurrency)
+            elapsed = time.perf_counter() - started
+            outcomes = {name: item['count'] for name, item in sorted(metrics.STAGE_SECONDS.summary('outcome').items())}
+            print(
+                f"{title:<32}{elapsed:>10.2f}"
+                f"{site.responses[200] - responses_before[200]:>6}{site.responses[304] - responses_before[304]:>6}"
+                f"{(site.bytes_sent - bytes_before) / 1024:>9.0f}{new:>7}  {outcomes}"
+            )
+    finally:
+        store.close()
+        await fetcher.close_http_client()
+        await site.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--feeds', type=int, default=200)
+    parser.add_argument('--items', type=int, default=30, help="записей в каждой ленте")
+    parser.add_argument('--updated', type=int, default=5, help="в скольких лентах появится новая запись")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--no-conditional', dest='conditional_off', action='store_true',
+                        help="сервер без ETag/Last-Modified")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
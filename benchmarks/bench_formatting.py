@@ -0,0 +1,179 @@
+"""
+Бенчмарк форматирования подписи: старый путь против formatting.format_post.
+
+Старый путь (как было в bot.py): обрезка post_text[:800] по символам Python
+до экранирования и safe_html — 13 проходов str.replace с плейсхолдерами.
+Новый путь: один проход токенизатора с подсчётом длины в единицах UTF-16,
+обрезкой по границе предложения и балансировкой тегов.
+
+Кроме времени, на случайных текстах (эмодзи, &, <, >, лишние и перекрёстные
+теги) проверяются свойства результата обоих путей:
+- теги только <b>/<i> и сбалансированы, вне тегов нет сырых < > и &;
+- длина видимого текста в единицах Telegram не больше лимита;
+- без обрезки видимый текст совпадает с исходным (без разрешённых тегов);
+- при split подпись и продолжение вместе дают весь исходный текст.
+
+Запуск:
+    python benchmarks/bench_formatting.py [--repeat N] [--samples N] [--seed S]
+"""
+import argparse
+import html
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import formatting  # noqa: E402
+
+LEGACY_MAX_POST_LENGTH = 800
+LIMIT = formatting.CAPTION_LIMIT - 64
+SUFFIX = "\n\n<b>[...Обрезано из-за лимита Telegram]</b>"
+
+ALLOWED_TAG_RE = re.compile(r"</?[bi]>", re.IGNORECASE)
+ANY_TAG_RE = re.compile(r"<(/?)([^<>]*)>")
+ENTITY_RE = re.compile(r"&(amp|lt|gt);")
+
+FRAGMENTS = [
+    "Учёные обнаружили сигнал.", "Это важно!", "Почему?", "🚀", "🔭✨", "👩‍🔬", "&", "<", ">", "a < b", "R&D",
+    "<b>", "</b>", "<i>", "</i>", "<B>", "</b></b>", "<b><i>", "</b></i>", " ", " ", " ", "\n", "\n\n",
+    "Нейтронная звезда", "неожиданно", "данные телескопа", "модель", "«цитата».", "(скобки).", "…",
+]
+
+
+def legacy_safe_html(text):
+    """Копия исходного safe_html из bot.py."""
+    text = text.replace('&', '&amp;')
+    text = text.replace('<b>', '___B_OPEN___').replace('</b>', '___B_CLOSE___')
+    text = text.replace('<i>', '___I_OPEN___').replace('</i>', '___I_CLOSE___')
+    text = text.replace('<', '&lt;').replace('>', '&gt;')
+    text = text.replace('___B_OPEN___', '<b>').replace('___B_CLOSE___', '</b>')
+    text = text.replace('___I_OPEN___', '<i>').replace('___I_CLOSE___', '</i>')
+    return text
+
+
+def legacy_prepare(post_text):
+    """Копия исходного prepare_post_text: обрезка по символам до экранирования."""
+    if len(post_text) > LEGACY_MAX_POST_LENGTH:
+        post_text = post_text[:LEGACY_MAX_POST_LENGTH] + SUFFIX
+    return legacy_safe_html(post_text)
+
+
+def new_prepare(post_text):
+    return formatting.format_post(post_text, limit=LIMIT, suffix=SUFFIX).text
+
+
+def sample_post(rng, approx_chars):
+    """Пост в стиле GPT: заголовок жирным, абзацы с эмодзи и редкими спецсимволами."""
+    parts = ["<b>🚀 Учёные снова всех удивили: сигнал из далёкой галактики</b>\n\n"]
+    while sum(map(len, parts)) < approx_chars:
+        sentence = " ".join(rng.choice(FRAGMENTS[23:]) for _ in range(rng.randint(4, 12)))
+        parts.append(sentence.capitalize() + rng.choice([". ", "! ", "? ", " 🔭. ", " — <i>вот это да</i>. "]))
+        if rng.random() < 0.15:
+            parts.append("\n\n")
+    return "".join(parts)
+
+
+def random_text(rng, fragments):
+    return "".join(rng.choice(FRAGMENTS) for _ in range(fragments))
+
+
+def visible(markup):
+    """Видимый текст HTML-разметки Telegram (теги убраны, сущности раскрыты)."""
+    return html.unescape(ANY_TAG_RE.sub("", markup))
+
+
+def problems(markup, limit):
+    """Нарушения свойств разметки: список строк (пустой — всё в порядке)."""
+    found = []
+    stack = []
+    for match in ANY_TAG_RE.finditer(markup):
+        closing, name = match.groups()
+        if name not in ('b', 'i'):
+            found.append(f"недопустимый тег <{closing}{name}>")
+        elif not closing:
+            stack.append(name)
+        elif not stack or stack.pop() != name:
+            found.append(f"несбалансированный </{name}>")
+    if stack:
+        found.append(f"незакрытые теги {stack}")
+    outside = ENTITY_RE.sub("", ANY_TAG_RE.sub("", markup))
+    if any(char in outside for char in "<>&"):
+        found.append("неэкранированный символ")
+    if formatting.telegram_length(visible(markup)) > limit:
+        found.append(f"длина {formatting.telegram_length(visible(markup))} > {limit}")
+    return found
+
+
+def check_properties(samples, seed):
+    rng = random.Random(seed)
+    failures = {'legacy': 0, 'new': 0}
+    examples = []
+    for _ in range(samples):
+        text = random_text(rng, rng.randint(1, 400))
+        expected = ALLOWED_TAG_RE.sub("", text)
+
+        if problems(legacy_prepare(text), formatting.CAPTION_LIMIT):
+            failures['legacy'] += 1
+
+        post = formatting.format_post(text, limit=LIMIT, suffix=SUFFIX)
+        errors = problems(post.text, LIMIT)
+        if post.length != formatting.telegram_length(visible(post.text)):
+            errors.append(f"length {post.length} != фактической")
+        if not post.truncated and visible(post.text) != expected:
+            errors.append("видимый текст изменился без обрезки")
+
+        split = formatting.format_post(text, limit=LIMIT, split=True)
+        errors += problems(split.text, LIMIT)
+        if split.overflow is not None:
+            errors += problems(split.overflow, formatting.MESSAGE_LIMIT)
+            joined = visible(split.text) + visible(split.overflow)
+            if not split.truncated and re.sub(r"\s", "", joined) != re.sub(r"\s", "", expected):
+                errors.append("подпись + продолжение не равны исходному тексту")
+
+        if errors:
+            failures['new'] += 1
+            if len(examples) < 3:
+                examples.append((text[:120], errors))
+    return failures, examples
+
+
+def measure(func, texts, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for text in texts:
+            func(text)
+        timings.append((time.perf_counter() - started) / len(texts))
+    return statistics.median(timings) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--samples', type=int, default=2000, help="случайных текстов для проверки свойств")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'набор':<28}{'safe_html, мкс':>16}{'старый путь, мкс':>18}{'format_post, мкс':>18}")
+    for title, size in (("короткий пост (~600)", 600), ("типичный пост (~1000)", 1000), ("длинный ответ (~5000)", 5000)):
+        texts = [sample_post(rng, size) for _ in range(50)]
+        print(
+            f"{title:<28}{measure(legacy_safe_html, texts, args.repeat):>16.1f}"
+            f"{measure(legacy_prepare, texts, args.repeat):>18.1f}{measure(new_prepare, texts, args.repeat):>18.1f}"
+        )
+
+    failures, examples = check_properties(args.samples, args.seed)
+    print(f"\nПроверка свойств на {args.samples} случайных текстах:")
+    print(f"   старый путь: нарушений в {failures['legacy']} текстах")
+    print(f"   format_post: нарушений в {failures['new']} текстах")
+    for text, errors in examples:
+        print(f"   {text!r}: {errors}")
+
+
+if __name__ == '__main__':
+    main()
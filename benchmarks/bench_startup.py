@@ -0,0 +1,144 @@
+"""
+Бенчмарк холодного старта webhook-процесса.
+
+Запускает `python bot.py` (или другой файл через --bot, например из старой
+ревизии) против заглушки Telegram Bot API и меряет от момента запуска процесса:
+- listen — сервер начал отвечать на HTTP;
+- ack — webhook принял обновление /start (ответ 200);
+- reply — бот ответил на /start (заглушка получила sendMessage).
+
+Запуск:
+    python benchmarks/bench_startup.py [--bot PATH] [--runs N] [--telegram-latency S] [--json FILE]
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import FakeTelegram  # noqa: E402
+
+ADMIN_ID = 1
+TOKEN = "1000:bench"
+POLL_INTERVAL = 0.005
+TIMEOUT = 30
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_update(update_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': ADMIN_ID, 'type': 'private'},
+            'from': {'id': ADMIN_ID, 'is_bot': False, 'first_name': 'Admin'},
+            'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        },
+    }
+
+
+async def measure_once(bot_path, telegram, run):
+    port = free_port()
+    env = {
+        **os.environ,
+        'TELEGRAM_BOT_TOKEN': TOKEN,
+        'OPENAI_API_KEY': 'sk-bench',
+        'TELEGRAM_API_URL': telegram.url,
+        'ADMIN_ID': str(ADMIN_ID),
+        'CHANNEL_ID': '-1001000',
+        'WEBHOOK_URL': f'http://127.0.0.1:{port}/',
+        'PORT': str(port),
+        'DATA_DIR': tempfile.mkdtemp(prefix='bench-startup-'),
+    }
+    replies_before = telegram.count('sendMessage', chat_id=ADMIN_ID)
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, bot_path, env=env, cwd=os.path.dirname(os.path.abspath(bot_path)),
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    result = {}
+    try:
+        async with httpx.AsyncClient(timeout=5) as client:
+            while 'ack' not in result:
+                if time.perf_counter() - started > TIMEOUT:
+                    raise TimeoutError("бот не ответил на webhook")
+                try:
+                    response = await client.post(f'http://127.0.0.1:{port}/{TOKEN}', json=start_update(run + 1))
+                except httpx.TransportError:
+                    await asyncio.sleep(POLL_INTERVAL)
+                    continue
+                result.setdefault('listen', time.perf_counter() - started)
+                if response.status_code == 200:
+                    result['ack'] = time.perf_counter() - started
+                else:
+                    await asyncio.sleep(POLL_INTERVAL)
+
+        while telegram.count('sendMessage', chat_id=ADMIN_ID) == replies_before:
+            if time.perf_counter() - started > TIMEOUT:
+                raise TimeoutError("бот не ответил на /start")
+            await asyncio.sleep(POLL_INTERVAL)
+        result['reply'] = time.perf_counter() - started
+    finally:
+        if process.returncode is None:
+            process.send_signal(signal.SIGTERM)
+            try:
+                await asyncio.wait_for(process.wait(), 10)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+    return result
+
+
+async def main_async(args):
+    telegram = FakeTelegram(latency=args.telegram_latency).start()
+    runs = []
+    try:
+        for run in range(args.runs):
+            result = await measure_once(args.bot, telegram, run)
+            runs.append(result)
+            print(f"запуск {run + 1}: " + ", ".join(f"{key} {value * 1000:.0f} мс" for key, value in result.items()))
+    finally:
+        await telegram.stop()
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bot', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bot.py'))
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--telegram-latency', type=float, default=0.15, help="задержка ответа Bot API, с")
+    parser.add_argument('--json', help="куда записать результаты в JSON")
+    args = parser.parse_args()
+
+    runs = asyncio.run(main_async(args))
+    summary = {
+        key: round(statistics.median(run[key] for run in runs) * 1000, 1)
+        for key in ('listen', 'ack', 'reply')
+    }
+    print("\nМедиана, мс: " + ", ".join(f"{key} {value}" for key, value in summary.items()))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'bot': args.bot, 'runs': runs, 'median_ms': summary,
+                       'telegram_latency': args.telegram_latency}, f, ensure_ascii=False, indent=2)
+        print(f"Результаты записаны в {args.json}")
+
+
+if __name__ == '__main__':
+    main()
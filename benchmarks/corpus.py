@@ -0,0 +1,100 @@
+"""
+Корпус HTML-страниц для бенчмарков.
+
+Если передан каталог с сохранёнными страницами (*.html), используются они.
+Иначе генерируются синтетические страницы, похожие по структуре и размеру на
+реальные новостные сайты: тяжёлый <head> с мета-тегами и инлайн-скриптами,
+навигация, статья, блок «читайте также», комментарии и подвал.
+"""
+import glob
+import os
+import random
+
+# Имя страницы -> (абзацев статьи, комментариев, размер инлайн-скриптов в КБ)
+SYNTHETIC_PAGES = {
+    'short-news': (8, 0, 40),
+    'typical-article': (20, 30, 150),
+    'longread-with-comments': (80, 400, 400),
+    'heavy-portal': (40, 1500, 1200),
+}
+
+WORDS = (
+    "quantum telescope galaxy neutron protein genome climate fusion reactor particle "
+    "researchers discovered unexpected signal universe experiment laboratory results "
+    "astronomers observed mission spacecraft orbit data model evolution species fossil"
+).split()
+
+
+def _sentence(rng, words=14):
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text.capitalize() + f" in {rng.randint(1990, 2025)}."
+
+
+def _paragraph(rng, sentences=4):
+    return " ".join(_sentence(rng) for _ in range(sentences))
+
+
+def generate_page(name, paragraphs, comments, script_kb, seed=0):
+    """Строит одну синтетическую страницу и возвращает её байты."""
+    rng = random.Random(f"{name}-{seed}")
+    script_blob = "".join(
+        f'window.__state_{i} = {{"id": {i}, "payload": "{"x" * 1000}"}};\n'
+        for i in range(script_kb)
+    )
+    meta = "\n".join(
+        f'<meta name="keyword-{i}" content="{rng.choice(WORDS)}">' for i in range(60)
+    )
+    nav = "".join(f'<li><a href="/section/{i}">{rng.choice(WORDS)}</a></li>' for i in range(80))
+    body = "".join(f"<p>{_paragraph(rng)}</p>\n" for _ in range(paragraphs))
+    related = "".join(
+        f'<li><a href="/news/{i}"><img src="/thumb/{i}.jpg" class="thumb">{_sentence(rng, 8)}</a></li>'
+        for i in range(30)
+    )
+    comment_blocks = "".join(
+        f'<div class="comment"><span class="author">user{i}</span><p>{_sentence(rng, 20)}</p></div>\n'
+        for i in range(comments)
+    )
+    page = f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{name}</title>
+<meta property="og:title" content="{name}">
+<meta property="og:image" content="/images/{name}/hero.jpg">
+{meta}
+<style>{"body{margin:0}" * 500}</style>
+<script>{script_blob}</script>
+</head>
+<body>
+<header><nav><ul>{nav}</ul></nav></header>
+<main>
+<article>
+<h1>{_sentence(rng, 8)}</h1>
+<img class="hero-image" src="/images/{name}/inline.jpg">
+{body}
+<aside class="related"><ul>{related}</ul></aside>
+</article>
+<section class="comments">{comment_blocks}</section>
+</main>
+<footer><p>All rights reserved.</p></footer>
+</body>
+</html>
+"""
+    return page.encode('utf-8')
+
+
+def load_corpus(directory=None):
+    """Возвращает {имя: байты HTML}: страницы из каталога или синтетический корпус."""
+    if directory:
+        pages = {}
+        for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+            with open(path, 'rb') as f:
+                pages[os.path.basename(path)] = f.read()
+        if not pages:
+            raise SystemExit(f"В каталоге {directory} нет *.html")
+        return pages
+
+    return {
+        name: generate_page(name, *params)
+        for name, params in SYNTHETIC_PAGES.items()
+    }
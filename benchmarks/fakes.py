@@ -0,0 +1,335 @@
+"""
+Локальные заглушки внешних сервисов для бенчмарков без ключей и сети.
+
+- FakeOpenAI — /v1/chat/completions (обычный и потоковый ответ в формате
+  [ПОСТ] / [DALL-E PROMPT]) и /v1/images/generations с настраиваемой задержкой;
+- FakeTelegram — Bot API: getMe, sendMessage, sendPhoto, editMessageText и др.;
+  все вызовы записываются в calls;
+- ArticleSite — страницы корпуса (benchmarks/corpus.py) и картинки к ним;
+- FeedSite — RSS-ленты с ETag / Last-Modified и счётчиками ответов 200/304.
+
+Все серверы — приложения tornado, работающие в том же цикле событий, что и бенчмарк.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from email.utils import formatdate
+from xml.sax.saxutils import escape
+
+import tornado.httpserver
+import tornado.netutil
+import tornado.web
+
+# Минимальный валидный PNG 1x1
+PNG_1X1 = bytes.fromhex(
+    "89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489"
+    "0000000b49444154789c6360000200000500017a5eab3f0000000049454e44ae426082"
+)
+
+POST_TEMPLATE = (
+    "<b>🚀 Учёные снова всех удивили: {title}</b>\n\n"
+    "Исследователи обнаружили то, чего никто не ждал. Если коротко: данные с телескопа "
+    "показали сигнал, который не укладывается в привычные модели, и теперь теоретикам "
+    "придётся поломать голову. Почему это важно? Потому что каждое такое «не сходится» — "
+    "шанс узнать о Вселенной что-то новое. 🔭✨"
+)
+PROMPT_TEMPLATE = "A vivid conceptual illustration of a scientific discovery: {title}, cinematic lighting, no text"
+
+
+class _Server:
+    """Общая часть: запуск на свободном порту localhost и остановка."""
+
+    def __init__(self):
+        self.server = None
+        self.port = None
+
+    def make_app(self):
+        raise NotImplementedError
+
+    def start(self):
+        self.server = tornado.httpserver.HTTPServer(self.make_app())
+        sockets = tornado.netutil.bind_sockets(0, address='127.0.0.1')
+        self.port = sockets[0].getsockname()[1]
+        self.server.add_sockets(sockets)
+        return self
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    async def stop(self):
+        self.server.stop()
+        await self.server.close_all_connections()
+
+
+class _QuietApp(tornado.web.Application):
+    def log_request(self, handler):
+        pass
+
+
+# --- OpenAI ---
+
+class _ChatHandler(tornado.web.RequestHandler):
+    def initialize(self, fake):
+        self.fake = fake
+
+    async def post(self):
+        request = json.loads(self.request.body)
+        model = request.get('model', 'gpt-4o')
+        messages = request.get('messages', [])
+        prompt_tokens = sum(len(m.get('content', '')) for m in messages) // 4
+        self.fake.calls.append(('chat', model, bool(request.get('stream'))))
+
+        if model == 'gpt-4o':
+            title = f"запрос {len(self.fake.calls)}"
+            content = f"[ПОСТ]\n{POST_TEMPLATE.format(title=title)}\n\n[DALL-E PROMPT]\n{PROMPT_TEMPLATE.format(title=title)}\n"
+        else:
+            content = PROMPT_TEMPLATE.format(title="fast prompt")
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': len(content) // 4,
+            'total_tokens': prompt_tokens + len(content) // 4,
+        }
+        base = {'id': 'chatcmpl-bench', 'created': int(time.time()), 'model': model}
+
+        await asyncio.sleep(self.fake.first_token_latency)
+        if not request.get('stream'):
+            await asyncio.sleep(self.fake.token_interval * len(content) / self.fake.chunk_chars)
+            self.set_header('Content-Type', 'application/json')
+            self.write({
+                **base,
+                'object': 'chat.completion',
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+            return
+
+        self.set_header('Content-Type', 'text/event-stream')
+        size = self.fake.chunk_chars
+        for start in range(0, len(content), size):
+            chunk = {
+                **base,
+                'object': 'chat.completion.chunk',
+                'choices': [{'index': 0, 'delta': {'content': content[start:start + size]}, 'finish_reason': None}],
+            }
+            self.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+            await self.flush()
+            await asyncio.sleep(self.fake.token_interval)
+        self.write(f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n")
+        self.write("data: [DONE]\n\n")
+
+
+class _ImagesHandler(tornado.web.RequestHandler):
+    def initialize(self, fake):
+        self.fake = fake
+
+    async def post(self):
+        self.fake.calls.append(('image', 'dall-e-3', False))
+        await asyncio.sleep(self.fake.image_latency)
+        self.write({'created': int(time.time()), 'data': [{'url': self.fake.image_url}]})
+
+
+class FakeOpenAI(_Server):
+    """
+    Заглушка OpenAI. first_token_latency — задержка до первого фрагмента,
+    token_interval — пауза между фрагментами по chunk_chars символов,
+    image_latency — время «генерации» картинки.
+    """
+
+    def __init__(self, first_token_latency=0.5, token_interval=0.02, chunk_chars=12,
+                 image_latency=3.0, image_url="http://127.0.0.1/image.png"):
+        super().__init__()
+        self.first_token_latency = first_token_latency
+        self.token_interval = token_interval
+        self.chunk_chars = chunk_chars
+        self.image_latency = image_latency
+        self.image_url = image_url
+        self.calls = []
+
+    def make_app(self):
+        return _QuietApp([
+            (r"/v1/chat/completions", _ChatHandler, {'fake': self}),
+            (r"/v1/images/generations", _ImagesHandler, {'fake': self}),
+        ])
+
+
+# --- Telegram Bot API ---
+
+class _BotApiHandler(tornado.web.RequestHandler):
+    def initialize(self, fake):
+        self.fake = fake
+
+    async def post(self, token, method):
+        if self.request.headers.get('Content-Type', '').startswith('application/json'):
+            params = json.loads(self.request.body or b'{}')
+        else:
+            params = {key: values[0].decode('utf-8') for key, values in self.request.body_arguments.items()}
+        files = sorted(self.request.files)
+        self.fake.calls.append({'method': method, 'chat_id': str(params.get('chat_id', '')), 'files': files, 'at': time.monotonic()})
+        await asyncio.sleep(self.fake.latency)
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps({'ok': True, 'result': self.fake.result(method, params)}, ensure_ascii=False))
+
+
+class FakeTelegram(_Server):
+    """Заглушка Bot API: отвечает успехом и записывает каждый вызов в calls."""
+
+    def __init__(self, latency=0.05):
+        super().__init__()
+        self.latency = latency
+        self.calls = []
+        self._message_id = 0
+
+    def make_app(self):
+        return _QuietApp([(r"/bot([^/]+)/(\w+)", _BotApiHandler, {'fake': self})])
+
+    def _message(self, params, **fields):
+        self._message_id += 1
+        chat_id = int(params.get('chat_id') or 0)
+        return {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'channel'},
+            **fields,
+        }
+
+    def result(self, method, params):
+        if method == 'getMe':
+            return {'id': 1000, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        if method in ('sendMessage', 'editMessageText'):
+            return self._message(params, text=params.get('text', ''))
+        if method == 'sendPhoto':
+            file_id = f"photo-{self._message_id + 1}"
+            photo = [{'file_id': file_id, 'file_unique_id': file_id, 'width': 1024, 'height': 1024}]
+            return self._message(params, photo=photo, caption=params.get('caption', ''))
+        if method == 'editMessageReplyMarkup':
+            return self._message(params)
+        return True
+
+    def count(self, method, chat_id=None):
+        return sum(
+            1 for call in self.calls
+            if call['method'] == method and (chat_id is None or call['chat_id'] == str(chat_id))
+        )
+
+
+# --- Сайты со статьями ---
+
+class _ArticleHandler(tornado.web.RequestHandler):
+    def initialize(self, site):
+        self.site = site
+
+    async def get(self, name):
+        page = self.site.pages.get(name)
+        if page is None:
+            raise tornado.web.HTTPError(404)
+        await asyncio.sleep(self.site.latency)
+        # Номер запроса в заголовке: у каждой ссылки свой текст, кэш GPT не срабатывает
+        variant = self.get_query_argument('n', '')
+        if variant:
+            page = page.replace(b'<h1>', f'<h1>#{variant} '.encode(), 1)
+        self.set_header('Content-Type', 'text/html; charset=utf-8')
+        self.write(page)
+
+
+class _ImageHandler(tornado.web.RequestHandler):
+    def get(self, path):
+        self.set_header('Content-Type', 'image/png')
+        self.write(PNG_1X1)
+
+
+class ArticleSite(_Server):
+    """Отдаёт страницы корпуса по /article/<имя>?n=<номер> и любые картинки по /images/..."""
+
+    def __init__(self, pages, latency=0.1):
+        super().__init__()
+        self.pages = pages
+        self.latency = latency
+
+    def make_app(self):
+        return _QuietApp([
+            (r"/article/([^/?]+)", _ArticleHandler, {'site': self}),
+            (r"/images/(.*)", _ImageHandler),
+        ])
+
+
+# --- RSS-ленты ---
+
+class _FeedHandler(tornado.web.RequestHandler):
+    def initialize(self, site):
+        self.site = site
+
+    async def get(self, name):
+        if name not in self.site.items:
+            raise tornado.web.HTTPError(404)
+        await asyncio.sleep(self.site.latency)
+        body, etag, modified = self.site.render(name)
+        # Как в RFC 9110: при If-None-Match заголовок If-Modified-Since не учитывается
+        if_none_match = self.request.headers.get('If-None-Match')
+        if self.site.conditional and (
+            if_none_match == etag if if_none_match else self.request.headers.get('If-Modified-Since') == modified
+        ):
+            self.site.responses[304] += 1
+            self.set_status(304)
+            return
+        self.site.responses[200] += 1
+        self.site.bytes_sent += len(body)
+        self.set_header('Content-Type', 'application/rss+xml; charset=utf-8')
+        if self.site.conditional:
+            self.set_header('ETag', etag)
+            self.set_header('Last-Modified', modified)
+        self.write(body)
+
+    def compute_etag(self):
+        # Свой ETag выставляется выше; автоматический от tornado не нужен
+        return None
+
+
+class FeedSite(_Server):
+    """
+    RSS-ленты /feed/<имя>. Записи ссылаются на article_url; publish() добавляет запись.
+    conditional=False — сервер без ETag/Last-Modified (всегда 200 с полным телом).
+    """
+
+    def __init__(self, article_url="http://127.0.0.1/article", items_per_feed=30, latency=0.0, conditional=True):
+        super().__init__()
+        self.article_url = article_url
+        self.items_per_feed = items_per_feed
+        self.latency = latency
+        self.conditional = conditional
+        self.items = {}
+        self.modified = {}
+        self.responses = {200: 0, 304: 0}
+        self.bytes_sent = 0
+
+    def make_app(self):
+        return _QuietApp([(r"/feed/([^/]+)", _FeedHandler, {'site': self})])
+
+    def add_feed(self, name, items=0):
+        self.items[name] = []
+        for _ in range(items):
+            self.publish(name)
+        return f"{self.url}/feed/{name}"
+
+    def publish(self, name):
+        number = len(self.items[name]) + 1
+        self.items[name].append(number)
+        self.modified[name] = time.time()
+        return number
+
+    def render(self, name):
+        latest = self.items[name][-self.items_per_feed:]
+        entries = "".join(
+            f"<item><title>{escape(name)} #{number}</title>"
+            f"<link>{escape(self.article_url)}?n={escape(name)}-{number}</link>"
+            f"<guid>{escape(name)}-{number}</guid>"
+            f"<description>{'Lorem ipsum dolor sit amet. ' * 20}</description></item>"
+            for number in reversed(latest)
+        )
+        body = (
+            f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+            f"<title>Лента {escape(name)}</title><link>{self.url}</link>{entries}</channel></rss>"
+        ).encode('utf-8')
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        return body, etag, formatdate(self.modified[name], usegmt=True)
@@ -1,23 +1,48 @@
+import time
+
+# Отсчёт холодного старта: от этой точки считаются импорт, инициализация и готовность сервера
+STARTUP_STARTED = time.perf_counter()
+
 import os
+import sys
+import asyncio
+import html
 import logging
 import re
+import subprocess
+import threading
+from contextlib import contextmanager
 from functools import wraps
-from urllib.parse import urljoin
-import random
 
-from telegram import Update
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, NetworkError, RetryAfter
 from telegram.ext import (
     Application,
+    CallbackQueryHandler,
     CommandHandler,
     MessageHandler,
     filters,
     ContextTypes
 )
 
-import requests
-from bs4 import BeautifulSoup
+import httpx
 
-from openai import OpenAI
+from fetcher import fetch_article, close_http_client, normalize_url, download_image, shutdown_parse_pool
+from fetcher import warm_up as warm_up_fetcher
+from ai_cache import AICache, cache_key
+from live_message import LiveMessage
+from drafts import DraftStore
+from text_reduction import reduce_to_budget
+from profiles import DomainProfileStore, domain_of
+from dedup import DuplicateIndex, minhash
+from formatting import CAPTION_LIMIT, MESSAGE_LIMIT, format_post
+from feeds import FeedStore, check_feed, is_due
+from resilience import CircuitOpenError, TokenBucket, hedged, parse_retry_after, retry_async
+from metrics import (
+    AI_CACHE_LOOKUPS, FETCHED_BYTES, OPENAI_TOKENS,
+    record_usage, set_request_labels, span, stage_summary,
+)
+from webserver import serve_webhook
 
 # --- 1. Настройка и Инициализация ---
 
@@ -25,47 +50,198 @@ from openai import OpenAI
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# КОНСТАНТА: Максимальная безопасная длина поста, чтобы не превысить лимит Telegram (1024 символа)
-MAX_POST_LENGTH = 800
+# Максимальная длина поста в единицах Telegram (UTF-16, без разметки): лимит подписи к фото
+# минус запас под шапку и подсказку черновика ("[Черновик #N]", "/publish N ...")
+MAX_POST_LENGTH = CAPTION_LIMIT - 64
+TRUNCATION_SUFFIX = "\n\n<b>[...Обрезано из-за лимита Telegram]</b>"
+# Не помещающийся в подпись остаток поста отправляется отдельным сообщением, а не обрезается
+SPLIT_LONG_POSTS = os.getenv("SPLIT_LONG_POSTS", "0") == "1"
+
+# Запасная картинка, если DALL-E не ответил
+PLACEHOLDER_IMAGE_URL = "https://via.placeholder.com/1024"
+
+# Спекулятивная генерация изображения параллельно с GPT-4o (по быстрому промту от gpt-4o-mini)
+SPECULATIVE_IMAGES = os.getenv("SPECULATIVE_IMAGES", "1") == "1"
+FAST_PROMPT_MODEL = "gpt-4o-mini"
+FAST_PROMPT_INPUT_CHARS = 2000
+
+# Потоковый режим GPT-4o: черновик растёт в одном сообщении, правки не чаще раза в STREAM_EDIT_INTERVAL секунд
+STREAM_MODE = os.getenv("STREAM_MODE", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+
+# Ограничения параллельности по этапам (общие для всех обработчиков и пакетного режима)
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))
+TEXT_CONCURRENCY = int(os.getenv("TEXT_CONCURRENCY", "4"))
+IMAGE_CONCURRENCY = int(os.getenv("IMAGE_CONCURRENCY", "2"))
+
+# Пакетный режим: максимум ссылок за один /batch
+BATCH_MAX_URLS = int(os.getenv("BATCH_MAX_URLS", "100"))
+BATCH_MAX_FILE_BYTES = 256 * 1024
+# Сколько статей пакета обрабатывается одновременно (этапы дополнительно ограничены слотами ниже)
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "6"))
+
+# Ограничения частоты запросов к внешним сервисам (запросов в минуту / в секунду)
+OPENAI_TEXT_RPM = float(os.getenv("OPENAI_TEXT_RPM", "120"))
+OPENAI_IMAGE_RPM = float(os.getenv("OPENAI_IMAGE_RPM", "7"))
+TELEGRAM_RPS = float(os.getenv("TELEGRAM_RPS", "20"))
+# Повторы при 429/таймаутах и страхующий второй запрос к DALL-E, если первый идёт дольше N секунд (0 — выкл.)
+OPENAI_ATTEMPTS = 4
+TELEGRAM_ATTEMPTS = 4
+DALLE_HEDGE_DELAY = float(os.getenv("DALLE_HEDGE_DELAY", "30"))
+
+# Бюджет токенов на текст статьи, отправляемый в GPT-4o (0 — без сокращения)
+INPUT_TOKEN_BUDGET = int(os.getenv("INPUT_TOKEN_BUDGET", "2500"))
+
+# Каталог для локальных данных бота (кэш, черновики)
+DATA_DIR = os.getenv("DATA_DIR", "data")
 
-# Список актуальных User-Agent'ов для ротации
-USER_AGENTS = [
-    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15',
-    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-    'Mozilla/5.0 (Windows NT 10.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-]
+# Кэш ответов GPT и DALL-E: тексты живут долго, ссылки DALL-E истекают примерно через час
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "2000"))
+TEXT_CACHE_TTL = 30 * 24 * 3600
+IMAGE_CACHE_TTL = 50 * 60
 
+# Адрес Bot API (по умолчанию api.telegram.org): локальный Bot API-сервер или заглушка в бенчмарках.
+# Адрес OpenAI аналогично задаётся переменной OPENAI_BASE_URL (её читает сам клиент OpenAI).
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
 
-# Чтение переменных окружения
-try:
-    TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-    ADMIN_ID = os.getenv("ADMIN_ID")
-    CHANNEL_ID = os.getenv("CHANNEL_ID")
-    WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+# Токен для доступа к /metrics (если не задан, метрики открыты)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
-    if not all([TOKEN, OPENAI_API_KEY, ADMIN_ID, CHANNEL_ID, WEBHOOK_URL]):
-        raise ValueError("Не все переменные окружения установлены.")
+# Сколько часов хранится неопубликованный черновик
+DRAFT_TTL = float(os.getenv("DRAFT_TTL_HOURS", "72")) * 3600
 
-except ValueError as e:
-    logger.error(f"ОШИБКА КОНФИГУРАЦИИ: {e}")
-    exit()
+# Почти-дубликаты: порог сходства текстов (0..1, 0 — проверка выключена) и сколько дней помнить статьи
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.5"))
+DEDUP_MAX_AGE_DAYS = float(os.getenv("DEDUP_MAX_AGE_DAYS", "90"))
+
+# Подписки на RSS/Atom: период опроса (0 — только вручную, /feeds check), сколько лент
+# опрашивать одновременно и сколько новых записей одной ленты брать в работу за опрос
+FEED_POLL_INTERVAL = float(os.getenv("FEED_POLL_MINUTES", "15")) * 60
+FEED_CONCURRENCY = int(os.getenv("FEED_CONCURRENCY", "8"))
+FEED_MAX_NEW_PER_POLL = int(os.getenv("FEED_MAX_NEW_PER_POLL", "5"))
+
+# Чтение переменных окружения (проверяются при запуске в check_config, а не при импорте)
+TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+ADMIN_ID = os.getenv("ADMIN_ID")
+CHANNEL_ID = os.getenv("CHANNEL_ID")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+
+
+def check_config():
+    """Проверяет, что все обязательные переменные окружения заданы."""
+    required = {
+        "TELEGRAM_BOT_TOKEN": TOKEN,
+        "OPENAI_API_KEY": OPENAI_API_KEY,
+        "ADMIN_ID": ADMIN_ID,
+        "CHANNEL_ID": CHANNEL_ID,
+        "WEBHOOK_URL": WEBHOOK_URL,
+    }
+    missing = [name for name, value in required.items() if not value]
+    if missing:
+        raise ValueError(f"Не все переменные окружения установлены: {', '.join(missing)}")
+
+# Длительность этапов холодного старта, мс (для лога и --profile-startup)
+startup_timings = {}
+
+@contextmanager
+def startup_step(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+# Клиент OpenAI создаётся при первом обращении (или в фоне после запуска):
+# импорт openai — самая дорогая часть холодного старта, а для приёма обновлений он не нужен.
+_openai_client = None
+_openai_client_lock = threading.Lock()
+
+def get_openai_client():
+    """
+    Асинхронный клиент OpenAI (пул соединений с keep-alive внутри клиента).
+    Встроенные повторы выключены: повторами, паузами и ограничением частоты управляет resilience.
+    """
+    global _openai_client
+    if _openai_client is None:
+        with _openai_client_lock:
+            if _openai_client is None:
+                from openai import AsyncOpenAI
+                _openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+    return _openai_client
 
-# Инициализация клиента OpenAI
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Ограничители частоты по сервисам
+openai_text_limiter = TokenBucket(OPENAI_TEXT_RPM / 60, capacity=5)
+openai_image_limiter = TokenBucket(OPENAI_IMAGE_RPM / 60, capacity=2)
+telegram_limiter = TokenBucket(TELEGRAM_RPS)
 
-# --- ГЛОБАЛЬНАЯ ИНИЦИАЛИЗАЦИЯ ---
-try:
-    app = Application.builder().token(TOKEN).build()
-except Exception as e:
-    logger.error(f"Ошибка при создании объекта Application: {e}")
-    exit()
-# ----------------------------------
+# Слоты этапов конвейера: загрузка статей, текстовые и графические запросы к OpenAI
+fetch_slots = asyncio.Semaphore(FETCH_CONCURRENCY)
+text_slots = asyncio.Semaphore(TEXT_CONCURRENCY)
+image_slots = asyncio.Semaphore(IMAGE_CONCURRENCY)
 
-# Глобальный словарь для хранения черновика поста
-draft_post = {}
+# Локальные хранилища открываются в init_storage при запуске:
+# постоянный кэш результатов GPT и DALL-E, профили сайтов (проверенные селекторы,
+# User-Agent, задержки и доля 403), черновики (много одновременно, каждый со своим ID)
+# подписи уже обработанных статей для поиска почти-дубликатов и подписки на ленты
+ai_cache = None
+domain_profiles = None
+drafts = None
+dedup_index = None
+feed_store = None
+
+# Приложение Telegram (создаётся в build_application)
+app = None
+
+
+def init_storage():
+    """Открывает локальные хранилища бота (однократно)."""
+    global ai_cache, domain_profiles, drafts, dedup_index, feed_store
+    if ai_cache is None:
+        ai_cache = AICache(os.path.join(DATA_DIR, "ai_cache.sqlite3"), max_entries=AI_CACHE_MAX_ENTRIES)
+    if domain_profiles is None:
+        domain_profiles = DomainProfileStore(os.path.join(DATA_DIR, "domain_profiles.json"))
+    if drafts is None:
+        drafts = DraftStore(os.path.join(DATA_DIR, "drafts.sqlite3"), ttl=DRAFT_TTL)
+    if dedup_index is None:
+        dedup_index = DuplicateIndex(
+            os.path.join(DATA_DIR, "dedup.sqlite3"), threshold=DEDUP_THRESHOLD, max_age_days=DEDUP_MAX_AGE_DAYS
+        )
+    if feed_store is None:
+        feed_store = FeedStore(os.path.join(DATA_DIR, "feeds.sqlite3"))
+
+
+def warm_up_modules():
+    """Импорт и создание тяжёлых клиентов заранее (в фоновом потоке), чтобы первая ссылка не ждала."""
+    try:
+        with startup_step("warm_up_openai"):
+            get_openai_client()
+        with startup_step("warm_up_bs4"):
+            warm_up_fetcher()
+        logger.info(
+            f"Фоновый прогрев завершён: openai {startup_timings['warm_up_openai']} мс, "
+            f"bs4 {startup_timings['warm_up_bs4']} мс"
+        )
+    except Exception as e:
+        logger.warning(f"Ошибка фонового прогрева (модули загрузятся при первом обращении): {e}")
+
+
+async def warm_up_clients(application):
+    """post_init: прогрев запускается в фоне и не задерживает приём обновлений."""
+    asyncio.get_running_loop().run_in_executor(None, warm_up_modules)
+
+
+async def shutdown_clients(application):
+    """Закрывает общие HTTP-клиенты при остановке приложения."""
+    await close_http_client()
+    shutdown_parse_pool()
+    if _openai_client is not None:
+        await _openai_client.close()
+    ai_cache.close()
+    drafts.close()
+    dedup_index.close()
+    feed_store.close()
+    domain_profiles.save()
 
 # --- 2. Декораторы и Управление Доступом ---
 
@@ -76,111 +252,163 @@ def restricted(func):
         user_id = str(update.effective_user.id)
         if user_id != ADMIN_ID:
             logger.warning(f"Попытка доступа от не-администратора: {user_id}")
-            await update.message.reply_text("⛔️ Вы не являетесь администратором бота. Запрос отклонен.")
+            if update.callback_query:
+                await update.callback_query.answer("⛔️ Вы не являетесь администратором бота.", show_alert=True)
+            else:
+                await update.message.reply_text("⛔️ Вы не являетесь администратором бота. Запрос отклонен.")
             return
         return await func(update, context, *args, **kwargs)
     return wrapped
 
 # --- 3. Функции Парсинга, AI, Изображений и Безопасности ---
 
-def safe_html(text):
-    """
-    Экранирует опасные символы (<, >, &) в тексте, не трогая валидные теги <b> и <i>.
-    Это предотвращает ошибку Can't parse entities: unexpected end tag.
-    """
-    # Экранируем амперсанд
-    text = text.replace('&', '&amp;')
-    
-    # Временно заменяем валидные теги на плейсхолдеры
-    text = text.replace('<b>', '___B_OPEN___').replace('</b>', '___B_CLOSE___')
-    text = text.replace('<i>', '___I_OPEN___').replace('</i>', '___I_CLOSE___')
-    
-    # Экранируем все остальные угловые скобки 
-    text = text.replace('<', '&lt;').replace('>', '&gt;')
-    
-    # Возвращаем валидные теги обратно
-    text = text.replace('___B_OPEN___', '<b>').replace('___B_CLOSE___', '</b>')
-    text = text.replace('___I_OPEN___', '<i>').replace('___I_CLOSE___', '</i>')
-    
-    # Telegram HTML поддерживает только ограниченный набор, здесь учитываем основные
-    
-    return text
+def cache_lookup(key, kind):
+    """Читает кэш GPT/DALL-E и учитывает попадание или промах в метриках."""
+    cached = ai_cache.get(key, kind)
+    AI_CACHE_LOOKUPS.inc(kind=kind, result='hit' if cached else 'miss')
+    return cached
 
-def parse_article(url):
-    """Извлекает заголовок и основной текст статьи по URL. Усиленные заголовки для обхода 403."""
+async def parse_article(url):
+    """Извлекает заголовок и основной текст статьи по URL. Страница загружается один раз и кэшируется."""
     try:
-        # Ротация User-Agent
-        headers = {
-            'User-Agent': random.choice(USER_AGENTS),
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Referer': 'https://www.google.com/',
-        }
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        title = soup.find('h1')
-        title_text = title.get_text(strip=True) if title else "Заголовок не найден"
-
-        article_body = soup.find('article') or soup.find('main') or soup.find('div', class_=re.compile(r'(content|body|post|article)', re.I))
-
-        if not article_body:
-            return title_text, "Не удалось найти основной блок статьи."
-
-        for script_or_style in article_body(["script", "style", "nav", "footer"]):
-            script_or_style.decompose()
-            
-        paragraphs = article_body.find_all('p')
-        text = "\n\n".join(p.get_text(strip=True) for p in paragraphs if p.get_text(strip=True))
-
-        return title_text, text
-        
-    except requests.exceptions.RequestException as e:
+        async with fetch_slots:
+            document = await fetch_article(url, profiles=domain_profiles)
+    except httpx.HTTPError as e:
         return "Ошибка парсинга", f"Ошибка запроса или таймаут: {e}"
+    except CircuitOpenError as e:
+        return "Ошибка парсинга", f"Сайт временно отключён после серии ошибок: {e}"
     except Exception as e:
         logger.error(f"Ошибка при парсинге URL {url}: {e}")
         return "Ошибка парсинга", f"Произошла непредвиденная ошибка: {e}"
 
-def find_image_in_article(url):
-    """Ищет URL главного изображения статьи через мета-теги или в контенте."""
+    if not document.body_found:
+        return document.title, "Не удалось найти основной блок статьи."
+
+    return document.title, document.text
+
+async def find_image_in_article(url):
+    """Возвращает URL главного изображения статьи (og:image или картинка в контенте) из того же документа."""
     try:
-        # Ротация User-Agent
-        headers = {
-            'User-Agent': random.choice(USER_AGENTS),
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Referer': 'https://www.google.com/',
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # 1. Поиск по мета-тегу og:image (самый надежный способ)
-        og_image = soup.find('meta', property='og:image')
-        if og_image and og_image.get('content'):
-            return og_image['content']
-            
-        # 2. Поиск первой большой картинки в основном контенте
-        article_body = soup.find('article') or soup.find('main')
-        if article_body:
-            first_img = article_body.find('img', class_=re.compile(r'(main|hero|featured|post-image)', re.I))
-            if first_img and first_img.get('src'):
-                img_src = first_img['src']
-                if img_src.startswith('http'):
-                    return img_src
-                
-                # Обработка относительных URL
-                return urljoin(url, img_src)
-                
+        with span('image_discovery') as s:
+            image_url = (await fetch_article(url, profiles=domain_profiles)).image_url
+            s.outcome = 'found' if image_url else 'none'
+        return image_url
     except Exception as e:
         logger.warning(f"Ошибка при поиске изображения в статье {url}: {e}")
         return None
 
+def is_retryable_openai_error(e):
+    """Временные ошибки OpenAI: 429 (кроме исчерпанной квоты), таймауты, обрывы, 5xx."""
+    from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+    if isinstance(e, RateLimitError):
+        return getattr(e, 'code', None) != 'insufficient_quota'
+    return isinstance(e, (APITimeoutError, APIConnectionError, InternalServerError))
+
+def openai_retry_after(e):
+    """Пауза, которую OpenAI попросил в заголовках retry-after-ms / retry-after."""
+    response = getattr(e, 'response', None)
+    if response is None:
+        return None
+    retry_after_ms = response.headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    return parse_retry_after(response.headers.get('retry-after'))
+
+async def call_openai(operation, name, limiter, attempts=OPENAI_ATTEMPTS):
+    """Вызов OpenAI с ограничением частоты и повторами с экспоненциальной задержкой."""
+    return await retry_async(
+        operation,
+        name=name,
+        is_retryable=is_retryable_openai_error,
+        retry_after=openai_retry_after,
+        attempts=attempts,
+        base_delay=2.0,
+        max_delay=60.0,
+        limiter=limiter,
+    )
+
+def telegram_retry_after(e):
+    if isinstance(e, RetryAfter):
+        retry_after = e.retry_after
+        return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
     return None
 
-def generate_ai_content(title, raw_text):
-    """Обрабатывает текст через GPT-4o для создания поста и промта для DALL-E. Использует HTML."""
+async def call_telegram(operation, name, network_retries=True):
+    """
+    Вызов Bot API с ограничением частоты и ожиданием flood control (RetryAfter).
+    network_retries=False — не повторять при сетевых ошибках: запрос мог дойти,
+    и повтор создал бы дубликат (важно для публикации в канал).
+    """
+    def is_retryable(e):
+        if isinstance(e, RetryAfter):
+            return True
+        return network_retries and isinstance(e, NetworkError) and not isinstance(e, BadRequest)
+
+    return await retry_async(
+        operation,
+        name=name,
+        is_retryable=is_retryable,
+        retry_after=telegram_retry_after,
+        attempts=TELEGRAM_ATTEMPTS,
+        limiter=telegram_limiter,
+    )
+
+POST_MARKER_RE = re.compile(r"\[ПОСТ\]", re.IGNORECASE)
+PROMPT_MARKER_RE = re.compile(r"\[DALL-E PROMPT\]", re.IGNORECASE)
+# Незакрытый хвост вида "[DALL-E PR" в конце потока, который ещё может оказаться маркером
+PARTIAL_MARKER_RE = re.compile(r"\[[^\]\n]*$")
+
+async def stream_completion(messages, on_post_update=None, on_prompt_ready=None):
+    """
+    Читает потоковый ответ GPT-4o и возвращает полный текст.
+    on_post_update(text) вызывается с растущим разделом [ПОСТ];
+    on_prompt_ready(prompt) — один раз, как только после маркера [DALL-E PROMPT]
+    пришла законченная строка промта (не дожидаясь конца потока).
+    """
+    stream = await get_openai_client().chat.completions.create(
+        model="gpt-4o", messages=messages, stream=True, stream_options={"include_usage": True}
+    )
+    full_response = ""
+    prompt_sent = False
+    async for chunk in stream:
+        if chunk.usage:
+            # Последний фрагмент потока несёт расход токенов
+            record_usage("gpt-4o", chunk.usage)
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        full_response += delta
+
+        post_marker = POST_MARKER_RE.search(full_response)
+        prompt_marker = PROMPT_MARKER_RE.search(full_response)
+
+        if post_marker and on_post_update:
+            if prompt_marker:
+                partial = full_response[post_marker.end():prompt_marker.start()]
+            else:
+                partial = PARTIAL_MARKER_RE.sub("", full_response[post_marker.end():])
+            on_post_update(partial.strip())
+
+        if prompt_marker and on_prompt_ready and not prompt_sent:
+            prompt_part = full_response[prompt_marker.end():].lstrip()
+            if "\n" in prompt_part:
+                first_line = prompt_part.split("\n", 1)[0].strip()
+                if first_line:
+                    prompt_sent = True
+                    on_prompt_ready(first_line)
+
+    return full_response
+
+async def generate_ai_content(title, raw_text, on_post_update=None, on_prompt_ready=None):
+    """
+    Обрабатывает текст через GPT-4o для создания поста и промта для DALL-E. Использует HTML.
+    Если переданы колбэки, ответ читается потоком (см. stream_completion).
+    """
         
     # ЖЕСТКОЕ ОГРАНИЧЕНИЕ ДЛИНЫ ПОСТА В ПРОМТЕ (850)
     system_prompt = (
@@ -204,16 +432,30 @@ def generate_ai_content(title, raw_text):
         "[DALL-E PROMPT]\n"
         "Текст промта на английском."
     ).format(title=title)
+
+    # Повторная отправка той же статьи отдаётся из кэша без обращения к API
+    key = cache_key("gpt-4o", system_prompt, title, raw_text)
+    cached = cache_lookup(key, 'text')
+    if cached:
+        logger.info("Ответ GPT взят из кэша.")
+        return cached[0], cached[1]
     
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": raw_text}
+    ]
+
+    async def request():
+        if on_post_update or on_prompt_ready:
+            return await stream_completion(messages, on_post_update, on_prompt_ready)
+        response = await get_openai_client().chat.completions.create(model="gpt-4o", messages=messages)
+        record_usage("gpt-4o", response.usage)
+        return response.choices[0].message.content
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": raw_text}
-            ]
-        )
-        full_response = response.choices[0].message.content
+        async with text_slots:
+            with span('gpt'):
+                full_response = await call_openai(request, "GPT-4o", openai_text_limiter)
         
         # УСТОЙЧИВЫЙ ПАРСИНГ
         post_match = re.search(r"\[ПОСТ\]\s*(.*?)\s*(?=\[DALL-E PROMPT\]|$)", full_response, re.DOTALL | re.IGNORECASE)
@@ -222,6 +464,7 @@ def generate_ai_content(title, raw_text):
         if post_match and prompt_match:
             post_text = post_match.group(1).strip()
             dalle_prompt = prompt_match.group(1).strip()
+            ai_cache.put(key, 'text', [post_text, dalle_prompt], TEXT_CACHE_TTL)
             return post_text, dalle_prompt
         else:
             logger.error(f"Ошибка парсинга ответа GPT. Ответ: {full_response}")
@@ -231,20 +474,357 @@ def generate_ai_content(title, raw_text):
         logger.error(f"Ошибка вызова OpenAI API для текста: {e}")
         return "Произошла ошибка при обращении к GPT.", "A simple conceptual image for a science article."
 
-def generate_image_url(dalle_prompt):
-    """Генерирует изображение с помощью DALL-E 3 и возвращает URL."""
-    try:
-        response = client.images.generate(
-            model="dall-e-3",
-            prompt=dalle_prompt,
-            size="1024x1024",
-            quality="standard",
-            n=1
+def reduce_article_text(title, raw_text):
+    """Сокращает текст статьи до INPUT_TOKEN_BUDGET, оставляя самые значимые абзацы, и пишет экономию в лог."""
+    if INPUT_TOKEN_BUDGET <= 0:
+        return raw_text
+    reduced, stats = reduce_to_budget(title, raw_text, INPUT_TOKEN_BUDGET)
+    saved = stats['tokens_before'] - stats['tokens_after']
+    if saved > 0:
+        logger.info(
+            f"Текст сокращён: ~{stats['tokens_before']} -> ~{stats['tokens_after']} токенов "
+            f"(сэкономлено ~{saved}), абзацев {stats['paragraphs_kept']}/{stats['paragraphs_total']}"
         )
-        return response.data[0].url
+    return reduced
+
+def is_ai_error(post_text):
+    """Проверяет, вернул ли generate_ai_content текст ошибки вместо поста."""
+    return "Ошибка форматирования" in post_text or "Произошла ошибка" in post_text
+
+async def generate_fast_dalle_prompt(title, raw_text):
+    """
+    Быстро получает промт для DALL-E по началу статьи через лёгкую модель.
+    Нужен, чтобы начать генерацию изображения, не дожидаясь полного ответа GPT-4o.
+    """
+    key = cache_key(FAST_PROMPT_MODEL, title, raw_text[:FAST_PROMPT_INPUT_CHARS])
+    cached = cache_lookup(key, 'fast_prompt')
+    if cached:
+        return cached
+    try:
+        async with text_slots, span('fast_prompt'):
+            response = await call_openai(lambda: get_openai_client().chat.completions.create(
+                model=FAST_PROMPT_MODEL,
+                max_tokens=150,
+                messages=[
+                    {"role": "system", "content": (
+                        "Write one short English prompt for DALL-E 3 illustrating this science news. "
+                        "Vivid, conceptual, no text in the image. Reply with the prompt only."
+                    )},
+                    {"role": "user", "content": f"{title}\n\n{raw_text[:FAST_PROMPT_INPUT_CHARS]}"}
+                ]
+            ), FAST_PROMPT_MODEL, openai_text_limiter, attempts=2)
+        record_usage(FAST_PROMPT_MODEL, response.usage)
+        fast_prompt = response.choices[0].message.content.strip()
+        if fast_prompt:
+            ai_cache.put(key, 'fast_prompt', fast_prompt, TEXT_CACHE_TTL)
+        return fast_prompt or None
+    except Exception as e:
+        logger.warning(f"Не удалось получить быстрый промт для DALL-E: {e}")
+        return None
+
+async def generate_image_url(dalle_prompt, fallback=PLACEHOLDER_IMAGE_URL):
+    """Генерирует изображение с помощью DALL-E 3 и возвращает URL (или fallback при ошибке)."""
+    key = cache_key("dall-e-3", "1024x1024", "standard", dalle_prompt)
+    cached = cache_lookup(key, 'image')
+    if cached:
+        logger.info("Изображение DALL-E взято из кэша.")
+        return cached
+    try:
+        async def request():
+            return await call_openai(lambda: get_openai_client().images.generate(
+                model="dall-e-3",
+                prompt=dalle_prompt,
+                size="1024x1024",
+                quality="standard",
+                n=1
+            ), "DALL-E 3", openai_image_limiter)
+
+        async with image_slots, span('dalle'):
+            # DALL-E иногда «зависает» на десятки секунд: страхуемся вторым запросом
+            if DALLE_HEDGE_DELAY > 0:
+                response = await hedged(request, DALLE_HEDGE_DELAY)
+            else:
+                response = await request()
+        image_url = response.data[0].url
+        ai_cache.put(key, 'image', image_url, IMAGE_CACHE_TTL)
+        return image_url
     except Exception as e:
         logger.error(f"Ошибка вызова DALL-E API: {e}")
-        return "https://via.placeholder.com/1024"
+        return fallback
+
+async def generate_speculative_image(title, raw_text):
+    """Спекулятивная ветка: быстрый промт -> DALL-E. Возвращает URL или None."""
+    fast_prompt = await generate_fast_dalle_prompt(title, raw_text)
+    if not fast_prompt:
+        return None
+    return await generate_image_url(fast_prompt, fallback=None)
+
+async def cancel_tasks(*tasks):
+    """Отменяет незавершённые задачи и дожидается их остановки."""
+    pending = [task for task in tasks if task is not None and not task.done()]
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+async def run_pipeline(title, raw_text, url=None, progress=None, on_post_update=None):
+    """
+    Этапный конвейер подготовки черновика.
+
+    Генерация текста GPT-4o идёт параллельно с поиском изображения в статье, а если
+    картинки нет — параллельно со спекулятивной генерацией DALL-E по быстрому промту.
+    Если передан on_post_update, GPT-4o читается потоком; при выключенной спекуляции
+    DALL-E стартует, как только в потоке появился промт.
+    Лишняя работа отменяется: при ошибке GPT изображение не дорисовывается.
+    Возвращает (post_text, dalle_prompt, image_url); image_url — None, если текст не сгенерирован.
+    """
+    async def notify(message):
+        if progress:
+            await progress(message)
+
+    # Лишние абзацы (комментарии, «читайте также») не отправляем в GPT
+    raw_text = reduce_article_text(title, raw_text)
+
+    image_task = None
+    need_image = None  # неизвестно, пока не закончен поиск картинки в статье
+    streamed_prompt = None
+
+    def on_prompt_ready(prompt):
+        nonlocal image_task, streamed_prompt
+        streamed_prompt = prompt
+        if need_image and image_task is None:
+            image_task = asyncio.create_task(generate_image_url(prompt, fallback=None))
+
+    text_task = asyncio.create_task(generate_ai_content(
+        title, raw_text,
+        on_post_update=on_post_update,
+        on_prompt_ready=on_prompt_ready if on_post_update else None,
+    ))
+    try:
+        image_url = await find_image_in_article(url) if url else None
+        need_image = not image_url
+        if image_url:
+            await notify("✅ Изображение найдено в статье. DALL-E не понадобится.")
+        elif SPECULATIVE_IMAGES:
+            if url:
+                await notify("⚠️ Изображение в статье не найдено. Параллельно с текстом генерирую изображение через DALL-E 3...")
+            image_task = asyncio.create_task(generate_speculative_image(title, raw_text))
+        elif streamed_prompt and image_task is None:
+            image_task = asyncio.create_task(generate_image_url(streamed_prompt, fallback=None))
+
+        post_text, dalle_prompt = await text_task
+        if is_ai_error(post_text):
+            await cancel_tasks(image_task)
+            return post_text, dalle_prompt, None
+
+        if image_url:
+            return post_text, dalle_prompt, image_url
+
+        if image_task is not None:
+            image_url = await image_task
+        if not image_url:
+            # Запасной путь: полноценный промт из ответа GPT-4o
+            await notify("⏳ Генерирую изображение через DALL-E 3...")
+            image_url = await generate_image_url(dalle_prompt)
+        return post_text, dalle_prompt, image_url
+    except BaseException:
+        await cancel_tasks(text_task, image_task)
+        raise
+
+def strip_post_tags(text):
+    """Убирает теги <b>/<i> для показа незаконченного поста простым текстом."""
+    return re.sub(r"</?[bi]>", "", text)
+
+def start_live_draft(update, context):
+    """
+    Создаёт сообщение, в котором по мере генерации растёт текст поста.
+    Возвращает (live, on_post_update) или (None, None), если потоковый режим выключен.
+    """
+    if not STREAM_MODE:
+        return None, None
+    live = LiveMessage(context.bot, update.effective_chat.id, min_interval=STREAM_EDIT_INTERVAL)
+
+    def on_post_update(partial):
+        live.update(f"✍️ Пишу пост...\n\n{strip_post_tags(partial)}")
+
+    return live, on_post_update
+
+async def finish_live_draft(live, post_text):
+    """Фиксирует итог в потоковом сообщении (если оно было создано)."""
+    if live is None:
+        return
+    if not live.started:
+        # Ответ пришёл из кэша — отдельное сообщение не нужно
+        return
+    if is_ai_error(post_text):
+        await live.finish(f"❌ {post_text}")
+    else:
+        await live.finish(f"✅ Текст сгенерирован.\n\n{strip_post_tags(post_text)}")
+
+def draft_keyboard(draft_id):
+    """Кнопки под черновиком: опубликовать или удалить."""
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton("🚀 Опубликовать", callback_data=f"publish:{draft_id}"),
+        InlineKeyboardButton("🗑 Удалить", callback_data=f"delete:{draft_id}"),
+    ]])
+
+def prepare_post_text(post_text):
+    """
+    Экранирует пост (кроме тегов <b>/<i>) и укладывает его в MAX_POST_LENGTH по границе предложения.
+    Возвращает (текст подписи, продолжение отдельным сообщением или None, был_ли_обрезан).
+    """
+    post = format_post(
+        post_text, limit=MAX_POST_LENGTH, suffix=TRUNCATION_SUFFIX,
+        split=SPLIT_LONG_POSTS, overflow_limit=MESSAGE_LIMIT - 64
+    )
+    return post.text, post.overflow, post.truncated
+
+def truncation_notice(overflow, truncated):
+    """Предупреждение администратору о длинном посте (или None)."""
+    if truncated:
+        return (
+            "⚠️ <b>Внимание:</b> Сгенерированный пост был <b>обрезан</b> по границе предложения, "
+            f"чтобы соответствовать лимиту Telegram ({CAPTION_LIMIT} знаков в подписи, {MESSAGE_LIMIT} — в сообщении)."
+        )
+    if overflow:
+        return "ℹ️ Пост длиннее подписи к фото: окончание будет отправлено следующим сообщением."
+    return None
+
+async def load_draft_photo(draft):
+    """
+    Возвращает, что передать в send_photo: file_id уже загруженной картинки, её байты
+    (скачанные один раз с проверкой типа и размера) или, если скачать не удалось, URL.
+    """
+    if draft.get('file_id'):
+        return draft['file_id']
+    try:
+        return await download_image(draft['image_url'])
+    except Exception as e:
+        logger.warning(f"Не удалось скачать изображение {draft['image_url']}, Telegram загрузит его сам: {e}")
+        return draft['image_url']
+
+async def send_draft(bot, chat_id, draft):
+    """
+    Отправляет черновик администратору: фото с подписью и кнопками (и продолжение поста, если есть).
+    Картинка загружается в Telegram один раз, её file_id сохраняется в черновике для публикации.
+    """
+    draft_id = draft['id']
+    caption_draft = f"<b>[Черновик #{draft_id}]</b>\n\n{draft['text']}\n\n/publish {draft_id} для публикации"
+    
+    try:
+        photo = await load_draft_photo(draft)
+        async with span('telegram_send'):
+            message = await call_telegram(lambda: bot.send_photo(
+                chat_id=chat_id,
+                photo=photo,
+                caption=caption_draft,
+                parse_mode='HTML', # Используем HTML для форматированного текста
+                reply_markup=draft_keyboard(draft_id)
+            ), "Отправка черновика")
+        if message.photo and not draft.get('file_id'):
+            drafts.update(draft_id, file_id=message.photo[-1].file_id)
+    except Exception as e:
+        logger.error(f"Ошибка отправки фото с подписью: {e}")
+        await call_telegram(lambda: bot.send_message(
+            chat_id=chat_id,
+            text=f"❌ Изображение не загружено. Ошибка: {e}\n\nТекст черновика:\n{caption_draft}",
+            parse_mode='HTML',
+            reply_markup=draft_keyboard(draft_id)
+        ), "Отправка черновика")
+
+    if draft.get('overflow'):
+        await call_telegram(lambda: bot.send_message(
+            chat_id=chat_id,
+            text=f"<b>[Черновик #{draft_id}, продолжение]</b>\n\n{draft['overflow']}",
+            parse_mode='HTML'
+        ), "Отправка черновика")
+
+async def save_and_send_draft(update, context, post_text, image_url, title, source, reservation=None, overflow=None):
+    """Сохраняет черновик в хранилище и отправляет его администратору с кнопками."""
+    draft = drafts.create(text=post_text, overflow=overflow, image_url=image_url, title=title, source=source)
+    remember_article(reservation, draft)
+    await send_draft(context.bot, update.effective_chat.id, draft)
+    return draft
+
+def check_duplicate(article_text, title=None, source=None, force=False):
+    """
+    Проверяет статью на почти-дубликат и бронирует её подпись в индексе.
+    Вызывается до запросов к OpenAI: перепечатку не нужно генерировать заново.
+    Возвращает (бронь, None) или (None, похожая статья); force — без проверки, только бронь.
+    Бронь подтверждает remember_article, снимает forget_article.
+    """
+    with span('dedup') as s:
+        reservation, match = dedup_index.reserve(
+            minhash(article_text), title=title, source=source, check=bool(DEDUP_THRESHOLD) and not force
+        )
+        s.outcome = 'duplicate' if match else 'new'
+    return reservation, match
+
+def remember_article(reservation, draft):
+    """Закрепляет забронированную подпись статьи за созданным черновиком."""
+    if reservation is None:
+        return
+    try:
+        dedup_index.commit(reservation, draft_id=draft['id'], title=draft['title'])
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить подпись статьи для черновика #{draft['id']}: {e}")
+
+def forget_article(reservation):
+    """Снимает бронь статьи, по которой черновик не создан (ошибка AI и т.п.)."""
+    if reservation is not None:
+        dedup_index.release(reservation)
+
+def describe_duplicate(match):
+    """Предупреждение о дубликате (HTML): что это за статья и где её черновик или пост."""
+    title = html.escape(match['title'] or "без заголовка")
+    lines = [f"♻️ <b>Похоже, эта статья уже обрабатывалась</b> (сходство {match['similarity']:.0%}): «{title}»"]
+    if match['source']:
+        lines.append(f"Источник: {html.escape(match['source'])}")
+    if match['post_link']:
+        lines.append(f"Опубликована: {match['post_link']}")
+    elif match['published_at']:
+        lines.append("Уже опубликована в канале.")
+    elif match['pending']:
+        lines.append("Она обрабатывается прямо сейчас — черновик скоро придёт.")
+    elif match['draft_id'] and drafts.get(match['draft_id']):
+        lines.append(f"Черновик #{match['draft_id']}: /publish {match['draft_id']}")
+    else:
+        lines.append("Черновик по ней удалён или устарел.")
+    return "\n".join(lines)
+
+# ID черновиков, которые публикуются прямо сейчас (защита от двойного нажатия кнопки)
+publishing_now = set()
+
+async def publish_draft(bot, draft):
+    """Отправляет черновик в канал и удаляет его из хранилища. Ошибки Telegram пробрасываются."""
+    if draft['id'] in publishing_now:
+        raise RuntimeError(f"черновик #{draft['id']} уже публикуется")
+    publishing_now.add(draft['id'])
+    try:
+        # Публикация по file_id: без повторной загрузки с сервера-источника
+        photo = await load_draft_photo(draft)
+        async with span('telegram_publish'):
+            message = await call_telegram(lambda: bot.send_photo(
+                chat_id=CHANNEL_ID,
+                photo=photo,
+                caption=draft['text'],
+                parse_mode='HTML' # Используем HTML для форматированного текста
+            ), "Публикация в канал", network_retries=False)
+        drafts.delete(draft['id'])
+        try:
+            dedup_index.mark_published(draft['id'], getattr(message, 'link', None))
+        except Exception as e:
+            logger.warning(f"Не удалось отметить публикацию черновика #{draft['id']} в индексе дубликатов: {e}")
+        if draft.get('overflow'):
+            try:
+                await call_telegram(lambda: bot.send_message(
+                    chat_id=CHANNEL_ID, text=draft['overflow'], parse_mode='HTML'
+                ), "Публикация продолжения", network_retries=False)
+            except Exception as e:
+                # Пост уже в канале, черновик удалён: повтор /publish задублировал бы фото
+                raise RuntimeError(f"пост #{draft['id']} опубликован, но продолжение не отправлено: {e}") from e
+    finally:
+        publishing_now.discard(draft['id'])
 
 # --- 4. Обработчики Команд ---
 
@@ -255,7 +835,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "👉 **Ваш рабочий процесс (Free Tier):**\n"
         "1. Отправьте **/wake** (если бот долго спал).\n"
         "2. Отправьте ссылку на статью (автоматический режим) ИЛИ **скопированный текст статьи** (ручной режим).\n"
-        "3. Отправьте **/publish**."
+        "3. Отправьте **/publish** (или **/publish <номер>**; список черновиков — **/drafts**).\n\n"
+        "Если статья похожа на уже обработанную, бот предупредит и не будет её генерировать; "
+        "обработать всё равно — **/force <ссылка>** или ответ **/force** на сообщение с текстом.\n\n"
+        "📰 Ленты RSS/Atom: **/feeds add <url>** — новые статьи будут приходить черновиками (**/feeds** — список)."
     )
 
 @restricted
@@ -272,58 +855,57 @@ async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Пожалуйста, отправьте корректную ссылку.")
         return
 
-    url = url_match.group(0)
-    await update.message.reply_text(f"⏳ <b>Начинаю обработку ссылки:</b> <code>{url}</code>\n\n1. Парсинг статьи...", parse_mode='HTML')
-    
-    # 1. Парсинг
-    title, article_text = parse_article(url)
-    if "Ошибка парсинга" in title:
-        await update.message.reply_text(f"❌ Парсинг не удался: {article_text}")
-        return
-        
-    await update.message.reply_text("✅ Статья спарсена. 2. Передаю текст в GPT-4o...")
-    
-    # 2. Генерация текста и промта
-    post_text, dalle_prompt = generate_ai_content(title, article_text)
-    
-    if "Ошибка форматирования" in post_text or "Произошла ошибка" in post_text:
-        await update.message.reply_text(f"❌ Ошибка генерации AI: {post_text}")
-        return
+    await process_url(update, context, url_match.group(0))
 
-    # --- ПРИНУДИТЕЛЬНОЕ ОБРЕЗАНИЕ ТЕКСТА ---
-    if len(post_text) > MAX_POST_LENGTH:
-        post_text = post_text[:MAX_POST_LENGTH] + "\n\n<b>[...Обрезано из-за лимита Telegram]</b>"
-        await update.message.reply_text(f"⚠️ <b>Внимание:</b> Сгенерированный пост был <b>обрезан</b> до {MAX_POST_LENGTH} символов, чтобы соответствовать лимиту подписи Telegram (1024 символа).", parse_mode='HTML')
-    # ----------------------------------------------------
+async def process_url(update, context, url, force=False):
+    """Конвейер автоматического режима для одной ссылки. force — не проверять дубликаты."""
+    set_request_labels('url', domain_of(url))
+    with span('total') as total:
+        await update.message.reply_text(f"⏳ <b>Начинаю обработку ссылки:</b> <code>{url}</code>\n\n1. Парсинг статьи...", parse_mode='HTML')
     
-    # !!! БЕЗОПАСНОСТЬ: Экранируем текст перед использованием !!!
-    post_text = safe_html(post_text)
+        # 1. Парсинг
+        title, article_text = await parse_article(url)
+        if "Ошибка парсинга" in title:
+            await update.message.reply_text(f"❌ Парсинг не удался: {article_text}")
+            total.outcome = 'parse_error'
+            return
 
-    # --- ИНТЕЛЛЕКТУАЛЬНЫЙ ПОИСК ИЗОБРАЖЕНИЯ ---
-    image_url = find_image_in_article(url)
+        reservation, duplicate = check_duplicate(article_text, title=title, source=url, force=force)
+        if duplicate:
+            await update.message.reply_text(
+                f"{describe_duplicate(duplicate)}\n\nОбработать всё равно: /force {html.escape(url)}",
+                parse_mode='HTML'
+            )
+            total.outcome = 'duplicate'
+            return
 
-    if image_url:
-        await update.message.reply_text("✅ Изображение найдено в статье. Пропускаю DALL-E.")
-    else:
-        await update.message.reply_text("⚠️ Изображение в статье не найдено. 3. Генерирую изображение через DALL-E 3...")
-        # 3. Генерация изображения (используется только как запасной вариант)
-        image_url = generate_image_url(dalle_prompt)
+        try:
+            await update.message.reply_text("✅ Статья спарсена. 2. Передаю текст в GPT-4o и параллельно ищу изображение...")
     
-    # 4. Сохраняем черновик поста и отправляем его администратору
-    global draft_post
-    draft_post = {'text': post_text, 'image_url': image_url}
+            # 2. Генерация текста и промта, параллельно — поиск или генерация изображения
+            live, on_post_update = start_live_draft(update, context)
+            post_text, dalle_prompt, image_url = await run_pipeline(
+                title, article_text, url=url, progress=update.message.reply_text, on_post_update=on_post_update
+            )
+            await finish_live_draft(live, post_text)
     
-    caption_draft = f"<b>[Черновик]</b>\n\n{post_text}\n\n/publish для публикации"
+            if is_ai_error(post_text):
+                await update.message.reply_text(f"❌ Ошибка генерации AI: {post_text}")
+                total.outcome = 'ai_error'
+                return
+
+            # Обрезка до лимита Telegram и экранирование
+            post_text, overflow, truncated = prepare_post_text(post_text)
+            notice = truncation_notice(overflow, truncated)
+            if notice:
+                await update.message.reply_text(notice, parse_mode='HTML')
     
-    try:
-        await update.message.reply_photo(
-            photo=image_url,
-            caption=caption_draft,
-            parse_mode='HTML' # Используем HTML для форматированного текста
-        )
-    except Exception as e:
-        logger.error(f"Ошибка отправки фото с подписью: {e}")
-        await update.message.reply_text(f"❌ Изображение не загружено. Ошибка: {e}\n\nТекст черновика:\n{caption_draft}", parse_mode='HTML')
+            # 3. Сохраняем черновик поста и отправляем его администратору
+            await save_and_send_draft(
+                update, context, post_text, image_url, title=title, source=url, reservation=reservation, overflow=overflow
+            )
+        finally:
+            forget_article(reservation)
 
 @restricted
 async def handle_manual_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -345,81 +927,652 @@ async def handle_manual_text(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     # ----------------------------------------------------------------------
 
-    # Используем HTML
-    await update.message.reply_text("⏳ <b>Ручной режим активирован.</b>\n\n1. Передаю текст в GPT-4o...", parse_mode='HTML')
+    await process_manual_text(update, context, raw_text)
+
+async def process_manual_text(update, context, raw_text, force=False):
+    """Конвейер ручного режима для текста статьи. force — не проверять дубликаты."""
+    set_request_labels('manual')
+    with span('total') as total:
+        title = "Ручная вставка статьи"
+        reservation, duplicate = check_duplicate(raw_text, title=title, force=force)
+        if duplicate:
+            await update.message.reply_text(
+                f"{describe_duplicate(duplicate)}\n\nОбработать всё равно: ответьте /force на сообщение с текстом.",
+                parse_mode='HTML'
+            )
+            total.outcome = 'duplicate'
+            return
+
+        try:
+            # Используем HTML
+            await update.message.reply_text("⏳ <b>Ручной режим активирован.</b>\n\n1. Передаю текст в GPT-4o и параллельно генерирую изображение через DALL-E 3...", parse_mode='HTML')
     
-    # 1. Генерация текста и промта
-    title = "Ручная вставка статьи"
-    post_text, dalle_prompt = generate_ai_content(title, raw_text)
+            # 1. Генерация текста и промта, параллельно — изображение (в ручном режиме всегда DALL-E)
+            live, on_post_update = start_live_draft(update, context)
+            post_text, dalle_prompt, image_url = await run_pipeline(
+                title, raw_text, progress=update.message.reply_text, on_post_update=on_post_update
+            )
+            await finish_live_draft(live, post_text)
     
-    if "Ошибка форматирования" in post_text or "Произошла ошибка" in post_text:
-        await update.message.reply_text(f"❌ Ошибка генерации AI: {post_text}")
-        return
+            if is_ai_error(post_text):
+                await update.message.reply_text(f"❌ Ошибка генерации AI: {post_text}")
+                total.outcome = 'ai_error'
+                return
 
-    # --- ПРИНУДИТЕЛЬНОЕ ОБРЕЗАНИЕ ТЕКСТА ---
-    if len(post_text) > MAX_POST_LENGTH:
-        post_text = post_text[:MAX_POST_LENGTH] + "\n\n<b>[...Обрезано из-за лимита Telegram]</b>"
-        await update.message.reply_text(f"⚠️ <b>Внимание:</b> Сгенерированный пост был <b>обрезан</b> до {MAX_POST_LENGTH} символов, чтобы соответствовать лимиту подписи Telegram (1024 символа).", parse_mode='HTML')
-    # ----------------------------------------------------
-    
-    # !!! БЕЗОПАСНОСТЬ: Экранируем текст перед использованием !!!
-    post_text = safe_html(post_text)
+            # Обрезка до лимита Telegram и экранирование
+            post_text, overflow, truncated = prepare_post_text(post_text)
+            notice = truncation_notice(overflow, truncated)
+            if notice:
+                await update.message.reply_text(notice, parse_mode='HTML')
 
-    await update.message.reply_text("✅ Текст сгенерирован. 2. Генерирую изображение через DALL-E 3...")
+            # 2. Сохраняем черновик поста и отправляем его администратору
+            await save_and_send_draft(
+                update, context, post_text, image_url, title=title, source=None, reservation=reservation, overflow=overflow
+            )
+        finally:
+            forget_article(reservation)
 
-    # 2. Генерация изображения (в ручном режиме всегда используем DALL-E)
-    image_url = generate_image_url(dalle_prompt)
-    
-    # 3. Сохраняем черновик поста и отправляем его администратору
-    global draft_post
-    draft_post = {'text': post_text, 'image_url': image_url}
-    
-    caption_draft = f"<b>[Черновик]</b>\n\n{post_text}\n\n/publish для публикации"
-    
+@restricted
+async def force_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /force <ссылка> или /force в ответ на сообщение со ссылкой или текстом статьи:
+    обработка без проверки на почти-дубликаты.
+    """
+    reply = update.message.reply_to_message
+    source_text = " ".join(context.args or []) or ((reply.text or reply.caption or "") if reply else "")
+    url_match = URL_RE.search(source_text)
+    if url_match:
+        await process_url(update, context, url_match.group(0), force=True)
+    elif reply and len(source_text) >= 500:
+        await process_manual_text(update, context, source_text, force=True)
+    else:
+        await update.message.reply_text(
+            "Использование: /force <ссылка> или ответ /force на сообщение со ссылкой или текстом статьи (от 500 символов)."
+        )
+
+
+URL_RE = re.compile(r'https?://[^\s<>"\']+')
+
+async def collect_batch_urls(message):
+    """
+    Собирает ссылки для /batch: из текста после команды, из сообщения, на которое
+    ответили командой, и из приложенного текстового файла. Дубликаты отбрасываются.
+    """
+    sources = []
+    for msg in (message, message.reply_to_message):
+        if msg is None:
+            continue
+        if msg.text:
+            sources.append(msg.text)
+        if msg.caption:
+            sources.append(msg.caption)
+        if msg.document:
+            if msg.document.file_size and msg.document.file_size > BATCH_MAX_FILE_BYTES:
+                raise ValueError(f"файл больше {BATCH_MAX_FILE_BYTES // 1024} КБ")
+            telegram_file = await msg.document.get_file()
+            data = await telegram_file.download_as_bytearray()
+            sources.append(bytes(data).decode('utf-8', errors='replace'))
+
+    urls, seen = [], set()
+    for text in sources:
+        for url in URL_RE.findall(text):
+            url = url.rstrip('.,;:)]')
+            key = normalize_url(url)
+            if key not in seen:
+                seen.add(key)
+                urls.append(url)
+    return urls
+
+async def process_url_to_draft(url):
+    """
+    Полный конвейер для одной ссылки без диалога с администратором:
+    парсинг -> GPT-4o и изображение -> сохранённый черновик.
+    Возвращает (draft, None) или (None, текст ошибки).
+    """
+    set_request_labels('batch', domain_of(url))
+    with span('total') as total:
+        title, article_text = await parse_article(url)
+        if "Ошибка парсинга" in title:
+            total.outcome = 'parse_error'
+            return None, article_text
+
+        reservation, duplicate = check_duplicate(article_text, title=title, source=url)
+        if duplicate:
+            total.outcome = 'duplicate'
+            if duplicate['pending']:
+                where = "обрабатывается сейчас"
+            else:
+                where = f"черновик #{duplicate['draft_id']}" if duplicate['draft_id'] else "ранее"
+            return None, f"дубликат статьи «{duplicate['title']}» ({where}, сходство {duplicate['similarity']:.0%})"
+
+        try:
+            post_text, dalle_prompt, image_url = await run_pipeline(title, article_text, url=url)
+            if is_ai_error(post_text):
+                total.outcome = 'ai_error'
+                return None, post_text
+
+            post_text, overflow, truncated = prepare_post_text(post_text)
+            draft = drafts.create(text=post_text, overflow=overflow, image_url=image_url, title=title, source=url)
+            remember_article(reservation, draft)
+            return draft, None
+        finally:
+            forget_article(reservation)
+
+@restricted
+async def batch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Обрабатывает /batch: много ссылок (в сообщении, в ответе или в .txt-файле) через
+    очередь с ограниченным числом обработчиков. Прогресс — в одном обновляемом сообщении,
+    черновики присылаются в конце.
+    """
     try:
-        await update.message.reply_photo(
-            photo=image_url,
-            caption=caption_draft,
-            parse_mode='HTML' # Используем HTML для форматированного текста
+        urls = await collect_batch_urls(update.message)
+    except Exception as e:
+        await update.message.reply_text(f"❌ Не удалось прочитать список ссылок: {e}")
+        return
+
+    if not urls:
+        await update.message.reply_text(
+            "Пакетный режим: отправьте /batch и ссылки (по одной в строке), "
+            "ответьте /batch на сообщение со ссылками или приложите .txt-файл с подписью /batch."
         )
+        return
+
+    skipped = 0
+    if len(urls) > BATCH_MAX_URLS:
+        skipped = len(urls) - BATCH_MAX_URLS
+        urls = urls[:BATCH_MAX_URLS]
+
+    chat_id = update.effective_chat.id
+    status = LiveMessage(context.bot, chat_id, min_interval=STREAM_EDIT_INTERVAL, parse_mode='HTML')
+    results = [None] * len(urls)
+    counters = {'active': 0, 'done': 0, 'failed': 0}
+    # Черновики, которые сохранены, но не доставлены администратору
+    unsent = []
+
+    def render(final=False):
+        finished = counters['done'] + counters['failed']
+        header = "✅ <b>Пакет обработан</b>" if final else "📦 <b>Пакетная обработка</b>"
+        lines = [
+            header,
+            f"Готово: {finished}/{len(urls)} (черновиков: {counters['done']}, ошибок: {counters['failed']})",
+        ]
+        if not final:
+            lines.append(f"В работе: {counters['active']}")
+        if skipped:
+            lines.append(f"⚠️ Пропущено ссылок сверх лимита {BATCH_MAX_URLS}: {skipped}")
+        if final:
+            failures = [(url, result[1]) for url, result in zip(urls, results) if result and result[1]]
+            for url, error in failures[:10]:
+                lines.append(f"❌ {html.escape(url)} — {html.escape(str(error)[:100])}")
+            if len(failures) > 10:
+                lines.append(f"... и ещё {len(failures) - 10} ошибок")
+            if unsent:
+                lines.append(
+                    f"⚠️ Не удалось отправить черновики: {', '.join(f'#{draft_id}' for draft_id in unsent)} "
+                    f"— они сохранены, см. /drafts"
+                )
+        return "\n".join(lines)
+
+    queue = asyncio.Queue()
+    for index, url in enumerate(urls):
+        queue.put_nowait((index, url))
+
+    async def worker():
+        while True:
+            try:
+                index, url = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            counters['active'] += 1
+            status.update(render())
+            try:
+                results[index] = await process_url_to_draft(url)
+            except Exception as e:
+                logger.error(f"Пакетный режим: ошибка обработки {url}: {e}")
+                results[index] = (None, f"непредвиденная ошибка: {e}")
+            counters['active'] -= 1
+            counters['done' if results[index][0] else 'failed'] += 1
+            status.update(render())
+
+    status.update(render())
+    workers = [asyncio.create_task(worker()) for _ in range(min(BATCH_WORKERS, len(urls)))]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        await cancel_tasks(*workers)
+        raise
+
+    # Черновики — в исходном порядке ссылок; ошибка отправки одного не останавливает остальные
+    for result in results:
+        if result and result[0]:
+            draft = result[0]
+            try:
+                await send_draft(context.bot, chat_id, draft)
+            except Exception as e:
+                logger.error(f"Пакетный режим: черновик #{draft['id']} не отправлен: {e}")
+                unsent.append(draft['id'])
+    await status.finish(render(final=True))
+
+# Опрос лент: плановый (job_queue) и ручной (/feeds check) не должны идти одновременно
+feeds_lock = asyncio.Lock()
+
+async def poll_feeds(bot, force=False):
+    """
+    Опрашивает ленты, которые пора проверить (force — все), обрабатывает новые записи
+    как ссылки пакетного режима и присылает черновики администратору.
+    Возвращает сводку: {'feeds', 'failed_feeds', 'new', 'drafts', 'skipped'}.
+    """
+    async with feeds_lock:
+        due = [feed['url'] for feed in feed_store.list() if force or is_due(feed, FEED_POLL_INTERVAL)]
+        stats = {'feeds': len(due), 'failed_feeds': 0, 'new': 0, 'drafts': 0, 'skipped': 0}
+        feed_slots = asyncio.Semaphore(FEED_CONCURRENCY)
+
+        async def check(url):
+            async with feed_slots:
+                try:
+                    entries, state = await check_feed(feed_store, url)
+                    return url, entries, state
+                except Exception as e:
+                    logger.warning(f"Лента {url} не загружена: {e}")
+                    stats['failed_feeds'] += 1
+                    return url, [], None
+
+        checked = await asyncio.gather(*(check(url) for url in due))
+
+        # Одна и та же статья в нескольких лентах обрабатывается один раз
+        links, queued = set(), []
+        for url, entries, state in checked:
+            taken = entries[:FEED_MAX_NEW_PER_POLL]
+            stats['new'] += len(taken)
+            for entry in taken:
+                key = normalize_url(entry.link)
+                if key not in links:
+                    links.add(key)
+                    queued.append(entry.link)
+
+        workers = asyncio.Semaphore(BATCH_WORKERS)
+
+        async def process(link):
+            async with workers:
+                try:
+                    return await process_url_to_draft(link)
+                except Exception as e:
+                    logger.error(f"Ленты: ошибка обработки {link}: {e}")
+                    return None, f"непредвиденная ошибка: {e}"
+
+        results = await asyncio.gather(*(process(link) for link in queued))
+        for link, (draft, error) in zip(queued, results):
+            if draft:
+                stats['drafts'] += 1
+                try:
+                    await send_draft(bot, ADMIN_ID, draft)
+                except Exception as e:
+                    # Черновик уже сохранён (виден в /drafts); ошибка Telegram не должна
+                    # помешать отметить записи просмотренными ниже
+                    logger.error(f"Ленты: черновик #{draft['id']} не отправлен: {e}")
+            else:
+                stats['skipped'] += 1
+                logger.info(f"Ленты: запись {link} пропущена: {error}")
+
+        # Записи отмечаются просмотренными после обработки; ETag и хэш ленты сохраняются,
+        # только если разобраны все её новые записи — остаток придёт при следующем опросе
+        now = time.time()
+        for url, entries, state in checked:
+            taken = entries[:FEED_MAX_NEW_PER_POLL]
+            feed_store.mark_seen(url, taken)
+            if state and len(taken) == len(entries):
+                feed_store.update(url, **state)
+            if taken:
+                feed_store.update(url, last_new_at=now)
+        return stats
+
+def describe_poll(stats):
+    line = (
+        f"📰 Ленты: проверено {stats['feeds']}, новых записей {stats['new']}, "
+        f"черновиков {stats['drafts']}, пропущено {stats['skipped']} (дубликаты и ошибки)"
+    )
+    if stats['failed_feeds']:
+        line += f", недоступно лент: {stats['failed_feeds']}"
+    return line
+
+async def feeds_job(context: ContextTypes.DEFAULT_TYPE):
+    """Плановый опрос лент (job_queue). Администратору пишем, только если были новые записи."""
+    try:
+        stats = await poll_feeds(context.bot)
     except Exception as e:
-        logger.error(f"Ошибка отправки фото с подписью: {e}")
-        await update.message.reply_text(f"❌ Изображение не загружено. Ошибка: {e}\n\nТекст черновика:\n{caption_draft}", parse_mode='HTML')
+        logger.error(f"Ошибка планового опроса лент: {e}")
+        return
+    if stats['new']:
+        await call_telegram(lambda: context.bot.send_message(chat_id=ADMIN_ID, text=describe_poll(stats)), "Сводка лент")
 
+def find_feed(argument):
+    """Подписка по URL или по номеру из /feeds list."""
+    items = feed_store.list()
+    if argument.isdigit() and 1 <= int(argument) <= len(items):
+        return items[int(argument) - 1]
+    return feed_store.get(argument)
 
 @restricted
-async def publish_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает команду /publish и отправляет пост в канал."""
-    
-    global draft_post
-    if not draft_post or not draft_post.get('text'):
-        await update.message.reply_text("Нет активного черновика для публикации. Отправьте ссылку или текст, чтобы создать новый.")
+async def feeds_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /feeds [list] — подписки на RSS/Atom.
+    /feeds add <url> — подписаться (записи, уже лежащие в ленте, считаются просмотренными).
+    /feeds remove <url|номер> — отписаться. /feeds check — опросить все ленты сейчас.
+    """
+    args = context.args or []
+    action = args[0].lower() if args else "list"
+
+    if action == "add" and len(args) > 1:
+        url = args[1]
+        if not URL_RE.fullmatch(url):
+            await update.message.reply_text("Укажите адрес ленты: /feeds add https://example.com/rss")
+            return
+        if not feed_store.add(url):
+            await update.message.reply_text("Эта лента уже есть в подписках.")
+            return
+        try:
+            entries, state = await check_feed(feed_store, url)
+        except Exception as e:
+            feed_store.remove(url)
+            await update.message.reply_text(f"❌ Не удалось прочитать ленту: {e}")
+            return
+        feed_store.mark_seen(url, entries)
+        if state:
+            feed_store.update(url, **state)
+        title = feed_store.get(url)['title'] or url
+        await update.message.reply_text(
+            f"✅ Подписка добавлена: {title}\nЗаписей в ленте сейчас: {len(entries)} — они пропущены, "
+            f"черновики будут приходить по новым."
+        )
+        return
+
+    if action == "remove" and len(args) > 1:
+        feed = find_feed(args[1])
+        if feed is None or not feed_store.remove(feed['url']):
+            await update.message.reply_text("Такой подписки нет. Список — /feeds.")
+            return
+        await update.message.reply_text(f"🗑 Подписка удалена: {feed['title'] or feed['url']}")
+        return
+
+    if action == "check":
+        if not len(feed_store):
+            await update.message.reply_text("Подписок нет. Добавьте ленту: /feeds add <url>")
+            return
+        await update.message.reply_text(f"⏳ Проверяю ленты ({len(feed_store)})...")
+        stats = await poll_feeds(context.bot, force=True)
+        await update.message.reply_text(describe_poll(stats))
+        return
+
+    if action != "list":
+        await update.message.reply_text(
+            "Ленты: /feeds — список, /feeds add <url>, /feeds remove <url|номер>, /feeds check — проверить сейчас."
+        )
+        return
+
+    items = feed_store.list()
+    if not items:
+        await update.message.reply_text("Подписок нет. Добавьте ленту: /feeds add <url>")
+        return
+    lines = []
+    for number, feed in enumerate(items, 1):
+        if feed['title']:
+            line = f"{number}. <b>{html.escape(feed['title'][:100])}</b>\n   {html.escape(feed['url'])}"
+        else:
+            line = f"{number}. {html.escape(feed['url'])}"
+        if feed['errors']:
+            line += f"\n   ⚠️ ошибок подряд: {feed['errors']} ({html.escape((feed['last_error'] or '')[:100])})"
+        lines.append(line)
+    footer = f"\nОпрос каждые {FEED_POLL_INTERVAL / 60:.0f} мин." if FEED_POLL_INTERVAL else None
+    text = fit_list(f"📰 <b>Ленты ({len(items)}):</b>\n", lines, footer=footer)
+    await update.message.reply_text(text, parse_mode='HTML', disable_web_page_preview=True)
+
+# Виды записей кэша GPT/DALL-E (аргумент /cache purge)
+AI_CACHE_KINDS = ('text', 'image', 'fast_prompt')
+
+@restricted
+async def cache_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /cache — статистика кэша GPT/DALL-E.
+    /cache purge [text|image|fast_prompt] — очистка всего кэша или одного вида записей.
+    """
+    args = context.args or []
+
+    if args and args[0] == 'purge':
+        kind = args[1] if len(args) > 1 else None
+        if kind is not None and kind not in AI_CACHE_KINDS:
+            await update.message.reply_text(f"Вид записей — один из: {', '.join(AI_CACHE_KINDS)}.")
+            return
+        removed = ai_cache.purge(kind)
+        target = f"вида <code>{kind}</code>" if kind else "всех видов"
+        await update.message.reply_text(f"🧹 Удалено записей {target}: {removed}", parse_mode='HTML')
+        return
+
+    stats = ai_cache.stats()
+    if not stats:
+        await update.message.reply_text("Кэш пуст, обращений к нему ещё не было.")
+        return
+
+    lines = ["📦 <b>Кэш GPT/DALL-E</b>\n"]
+    for kind, item in stats.items():
+        lines.append(
+            f"<code>{kind}</code>: записей {item['entries']}, "
+            f"попаданий {item['hits']}, промахов {item['misses']} "
+            f"({item['hit_rate']:.0%})"
+        )
+    lines.append(f"\n/cache purge [{'|'.join(AI_CACHE_KINDS)}] — очистить")
+    await update.message.reply_text("\n".join(lines), parse_mode='HTML')
+
+
+@restricted
+async def profiles_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /profiles — сводка по сайтам; /profiles <домен> — подробный профиль;
+    /profiles reset [домен] — сброс одного или всех профилей.
+    """
+    args = context.args or []
+
+    if args and args[0] == 'reset':
+        domain = args[1].lower() if len(args) > 1 else None
+        removed = domain_profiles.reset(domain)
+        target = f"домена <code>{html.escape(domain)}</code>" if domain else "всех доменов"
+        await update.message.reply_text(f"🧹 Сброшены профили {target}: {removed}", parse_mode='HTML')
+        return
+
+    if args:
+        domain = args[0].lower()
+        profile = domain_profiles.get(domain)
+        if profile is None:
+            await update.message.reply_text(f"Профиля для {domain} нет.")
+            return
+        hints = domain_profiles.hints(domain)
+        await update.message.reply_text(
+            f"🌐 <b>{html.escape(domain)}</b>\n"
+            f"Загрузок: {profile['fetches']}, 403: {profile['errors_403']}, других ошибок: {profile['failures']}\n"
+            f"Средняя задержка: {profile['latency_ms']} мс\n"
+            f"Контейнер: <code>{html.escape(str(hints['container']))}</code> {html.escape(str(profile['container']))}\n"
+            f"Картинка: <code>{html.escape(str(hints['image']))}</code> {html.escape(str(profile['image']))}\n"
+            f"User-Agent №: {hints['user_agent']}",
+            parse_mode='HTML'
+        )
+        return
+
+    rows = domain_profiles.summary()
+    if not rows:
+        await update.message.reply_text("Профилей доменов пока нет.")
         return
+    lines = ["🌐 <b>Профили доменов</b> (загрузок / 403 / задержка)\n"]
+    for domain, fetches, forbidden, latency in rows[:30]:
+        latency_text = f"{latency:.0f} мс" if latency is not None else "—"
+        lines.append(f"<code>{html.escape(domain)}</code>: {fetches} / {forbidden:.0%} / {latency_text}")
+    lines.append("\n/profiles &lt;домен&gt; — подробно, /profiles reset [домен] — сброс")
+    await update.message.reply_text("\n".join(lines), parse_mode='HTML')
+
+
+# Порядок этапов в сводке /stats
+STATS_STAGE_ORDER = (
+    'total', 'fetch', 'parse', 'dedup', 'image_discovery', 'gpt', 'fast_prompt', 'dalle',
+    'telegram_send', 'telegram_publish', 'feed_fetch',
+)
+
+@restricted
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/stats — p50/p95 по этапам конвейера и счётчики с момента запуска."""
+    summary = stage_summary()
+    if not summary:
+        await update.message.reply_text("Замеров пока нет: обработайте хотя бы одну ссылку или текст.")
+        return
+
+    stages = [s for s in STATS_STAGE_ORDER if s in summary] + sorted(set(summary) - set(STATS_STAGE_ORDER))
+    lines = ["⏱ <b>Этапы конвейера</b> (замеров / p50 / p95)\n"]
+    for stage in stages:
+        item = summary[stage]
+        lines.append(f"<code>{stage}</code>: {item['count']} / {item['p50']:.2f} с / {item['p95']:.2f} с")
+
+    hits = AI_CACHE_LOOKUPS.total(result='hit')
+    lookups = AI_CACHE_LOOKUPS.total()
+    lines.append("")
+    if lookups:
+        lines.append(f"Кэш GPT/DALL-E: {hits}/{lookups} попаданий ({hits / lookups:.0%})")
+    lines.append(
+        f"Токены OpenAI: {OPENAI_TOKENS.total(type='prompt'):.0f} входных, "
+        f"{OPENAI_TOKENS.total(type='completion'):.0f} выходных"
+    )
+    lines.append(
+        f"Загружено: страницы {FETCHED_BYTES.total(kind='page') / 1024 / 1024:.1f} МБ, "
+        f"изображения {FETCHED_BYTES.total(kind='image') / 1024 / 1024:.1f} МБ, "
+        f"ленты {FETCHED_BYTES.total(kind='feed') / 1024 / 1024:.1f} МБ"
+    )
+    lines.append("\nПодробно по режимам и доменам — /metrics на веб-сервере бота.")
+    await update.message.reply_text("\n".join(lines), parse_mode='HTML')
+
+
+@restricted
+async def publish_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Обрабатывает команду /publish [id] и отправляет пост в канал.
+    Без ID публикуется самый свежий черновик.
+    """
+    args = context.args or []
+    if args:
+        if not args[0].isdigit():
+            await update.message.reply_text("Укажите номер черновика: /publish 12. Список — /drafts.")
+            return
+        draft = drafts.get(int(args[0]))
+        if draft is None:
+            await update.message.reply_text(f"Черновик #{args[0]} не найден или устарел. Список — /drafts.")
+            return
+    else:
+        draft = drafts.latest()
+        if draft is None:
+            await update.message.reply_text("Нет активного черновика для публикации. Отправьте ссылку или текст, чтобы создать новый.")
+            return
         
     try:
-        await context.bot.send_photo(
-            chat_id=CHANNEL_ID,
-            photo=draft_post['image_url'],
-            caption=draft_post['text'],
-            parse_mode='HTML' # Используем HTML для форматированного текста
-        )
-        await update.message.reply_text("🚀 Новость успешно опубликована в канал 'Горизонт событий'!")
-        draft_post = {}
+        await publish_draft(context.bot, draft)
+        await update.message.reply_text(f"🚀 Новость #{draft['id']} успешно опубликована в канал 'Горизонт событий'!")
     except Exception as e:
         await update.message.reply_text(
             f"❌ Ошибка публикации в канал. Проверьте ID канала (`{CHANNEL_ID}`) и права бота: {e}"
         )
 
+# Списки /drafts и /feeds: не больше стольких записей в ответе (остальные — «… и ещё N»)
+LIST_MAX_ITEMS = 30
+
+def fit_list(header, entries, separator="\n", footer=None):
+    """
+    Собирает список (HTML) в одно сообщение: не больше LIST_MAX_ITEMS записей и
+    MESSAGE_LIMIT символов. Не поместившиеся записи заменяются строкой «… и ещё N».
+    """
+    parts = [header]
+    # Запас под строку «… и ещё N» и подвал
+    size = len(header) + 32 + (len(separator) + len(footer) if footer else 0)
+    for entry in entries[:LIST_MAX_ITEMS]:
+        size += len(separator) + len(entry)
+        if size > MESSAGE_LIMIT:
+            break
+        parts.append(entry)
+    hidden = len(entries) - (len(parts) - 1)
+    if hidden:
+        parts.append(f"… и ещё {hidden}")
+    if footer:
+        parts.append(footer)
+    return separator.join(parts)
+
+@restricted
+async def list_drafts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /drafts: список актуальных черновиков."""
+    items = drafts.list()
+    if not items:
+        await update.message.reply_text("Черновиков нет. Отправьте ссылку или текст, чтобы создать новый.")
+        return
+
+    lines = []
+    for draft in items:
+        # Текст черновика уже экранирован: раскрываем сущности, чтобы обрезка не разрезала их
+        preview = html.unescape(strip_post_tags(draft['text'])).split("\n", 1)[0][:80]
+        lines.append(f"#{draft['id']} — {html.escape(preview, quote=False)}\n/publish {draft['id']}")
+    text = fit_list(f"📝 <b>Черновики ({len(items)}):</b>\n", lines, separator="\n\n")
+    await update.message.reply_text(text, parse_mode='HTML')
+
+@restricted
+async def draft_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает кнопки под черновиком (publish:<id> / delete:<id>)."""
+    query = update.callback_query
+    action, _, raw_id = query.data.partition(":")
+    draft = drafts.get(int(raw_id)) if raw_id.isdigit() else None
+    if draft is None:
+        await query.answer("Черновик не найден или уже обработан.", show_alert=True)
+        return
+
+    if action == "delete":
+        drafts.delete(draft['id'])
+        await query.answer(f"Черновик #{draft['id']} удалён.")
+        await query.edit_message_reply_markup(reply_markup=None)
+        return
+
+    try:
+        await publish_draft(context.bot, draft)
+    except Exception as e:
+        await query.answer(f"Ошибка публикации: {e}", show_alert=True)
+        return
+    await query.answer(f"🚀 Черновик #{draft['id']} опубликован!")
+    await query.edit_message_reply_markup(reply_markup=None)
+
 
 # --- 5. Функция Запуска (Webhook для Render) ---
 
-def main():
-    """Настраивает обработчики и запускает встроенный веб-сервер."""
-    
+def build_application():
+    """Открывает хранилища, создаёт приложение Telegram и регистрирует обработчики."""
+    global app
+    init_storage()
+
+    # concurrent_updates: несколько ссылок/текстов обрабатываются одновременно
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .concurrent_updates(True)
+        .post_init(warm_up_clients)
+        .post_shutdown(shutdown_clients)
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL.rstrip('/')}/bot").base_file_url(f"{TELEGRAM_API_URL.rstrip('/')}/file/bot")
+    app = builder.build()
+
     # Регистрация обработчиков
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("publish", publish_post))
     app.add_handler(CommandHandler("wake", wake))
+    app.add_handler(CommandHandler("cache", cache_command))
+    app.add_handler(CommandHandler("profiles", profiles_command))
+    app.add_handler(CommandHandler("stats", stats_command))
+    app.add_handler(CommandHandler("drafts", list_drafts))
+    app.add_handler(CommandHandler("batch", batch_command))
+    app.add_handler(CommandHandler("force", force_command))
+    app.add_handler(CommandHandler("feeds", feeds_command))
+    # /batch в подписи к текстовому файлу со ссылками
+    app.add_handler(MessageHandler(filters.Document.ALL & filters.CaptionRegex(r'^/batch\b'), batch_command))
+    app.add_handler(CallbackQueryHandler(draft_button, pattern=r'^(publish|delete):\d+$'))
     
     # Обработчик 1: Автоматический режим (содержит URL) - имеет ПРИОРИТЕТ
     app.add_handler(MessageHandler(
@@ -434,19 +1587,103 @@ def main():
         & ~filters.Regex(r'https?://[^\s]+'), 
         handle_manual_text
     ))
+
+    # Плановый опрос RSS/Atom-лент (job_queue запускается вместе с приложением)
+    if FEED_POLL_INTERVAL:
+        if app.job_queue is None:
+            logger.warning("job_queue недоступен (нужен python-telegram-bot[job-queue]): ленты опрашиваются только по /feeds check")
+        else:
+            app.job_queue.run_repeating(feeds_job, interval=FEED_POLL_INTERVAL, first=60, name="feeds")
+    return app
+
+def profile_startup():
+    """
+    Режим --profile-startup: сколько стоит холодный старт по компонентам.
+    Импорт меряется в чистом процессе (python -X importtime), инициализация — здесь же.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import bot"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    # Строки вида "import time:  self | cumulative | <отступ>модуль"; прямые импорты bot
+    # идут с отступом на уровень глубже и печатаются перед строкой самого bot
+    imports, children, total_us = [], [], None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line.split("|")
+        if not parts[1].strip().isdigit():
+            continue
+        cumulative = int(parts[1])
+        name = parts[2][1:]
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        name = name.strip()
+        if depth == 0:
+            if name == "bot":
+                imports, total_us = children, cumulative
+            children = []
+        elif depth == 1:
+            children.append((name, cumulative))
+
+    print("Импорт модуля bot (чистый процесс):")
+    for name, cumulative in sorted(imports, key=lambda item: item[1], reverse=True):
+        print(f"  {name:<24}{cumulative / 1000:>9.1f} мс")
+    if total_us is not None:
+        print(f"  {'ВСЕГО':<24}{total_us / 1000:>9.1f} мс")
+    else:
+        print(f"  не удалось измерить: {result.stderr.strip()[-300:]}")
+
+    print("\nИнициализация:")
+    with startup_step("init_storage"):
+        init_storage()
+    if TOKEN:
+        with startup_step("build_application"):
+            build_application()
+    with startup_step("openai (ленивый импорт + клиент)"):
+        if OPENAI_API_KEY:
+            get_openai_client()
+        else:
+            import openai  # noqa: F401 — без ключа меряется только импорт
+    with startup_step("bs4 + парсер (ленивый импорт)"):
+        warm_up_fetcher()
+    for name, ms in startup_timings.items():
+        print(f"  {name:<36}{ms:>9.1f} мс")
+    print("\nopenai и bs4 при обычном запуске загружаются в фоне после того, как сервер начал принимать обновления.")
+
+def main():
+    """Настраивает обработчики и запускает веб-сервер."""
+    if "--profile-startup" in sys.argv:
+        profile_startup()
+        return
+
+    try:
+        check_config()
+    except ValueError as e:
+        logger.error(f"ОШИБКА КОНФИГУРАЦИИ: {e}")
+        exit()
+
+    try:
+        build_application()
+    except Exception as e:
+        logger.error(f"Ошибка при создании объекта Application: {e}")
+        exit()
     
     logger.info(f"Настройка Webhook по адресу: {WEBHOOK_URL}{TOKEN}")
     
     # Получаем порт, предоставленный Render
     PORT = int(os.environ.get("PORT", "8080"))
 
-    # Запускаем встроенный веб-сервер Python-Telegram-Bot
-    app.run_webhook(
+    # Веб-сервер (webhook Telegram, /metrics и /healthz на одном порту) начинает принимать
+    # обновления сразу; до готовности приложения они копятся в очереди и не теряются
+    asyncio.run(serve_webhook(
+        app,
         listen="0.0.0.0",
         port=PORT,
         url_path=TOKEN,
-        webhook_url=f'{WEBHOOK_URL}{TOKEN}'
-    )
+        webhook_url=f'{WEBHOOK_URL}{TOKEN}',
+        metrics_token=METRICS_TOKEN,
+        started_at=STARTUP_STARTED
+    ))
 
 # --- Точка входа ---
 if __name__ == '__main__':
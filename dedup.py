@@ -0,0 +1,293 @@
+"""
+Индекс почти-дубликатов статей.
+
+Разные издания и синдицированные ссылки часто перепечатывают один и тот же
+пресс-релиз. Для каждой обработанной статьи хранится MinHash-подпись
+очищенного текста: множество шинглов (по SHINGLE_WORDS слов) сжимается в
+SIGNATURE_SIZE чисел, и доля совпавших позиций двух подписей оценивает
+коэффициент Жаккара их множеств шинглов. Дубликат — статья с оценкой не ниже
+threshold.
+
+Подпись строится за один проход (one permutation hashing): хэш шингла
+вычисляется один раз, старшие биты выбирают корзину, младшие — значение,
+в корзине остаётся минимум; пустые корзины заполняются соседними.
+
+Поиск не перебирает все подписи (LSH): подпись делится на BANDS полос по
+ROWS позиций, и кандидатами считаются статьи, у которых совпала хотя бы одна
+полоса целиком. Похожие тексты почти всегда совпадают хоть в одной полосе,
+непохожие — почти никогда, поэтому проверка занимает микросекунды. Подписи с
+метаданными (заголовок, источник, черновик, ссылка на пост) лежат в SQLite —
+512 байт подписи на статью — и загружаются в память при старте; статьи старше
+max_age_days удаляются.
+
+Проверка и запись атомарны (reserve): подпись статьи, которая ещё
+обрабатывается, сразу попадает в индекс как бронь, поэтому две копии одной
+новости в /batch или в одном опросе лент не генерируются обе. Бронь
+подтверждается, когда создан черновик (commit), или снимается при ошибке
+(release).
+"""
+import hashlib
+import logging
+import operator
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_SIZE = 128
+BANDS = 32
+ROWS = SIGNATURE_SIZE // BANDS
+DEFAULT_THRESHOLD = 0.5
+# Статьи старше этого срока забываются: перепечатки появляются в первые дни
+DEFAULT_MAX_AGE_DAYS = 90
+# Длина шингла в словах и минимум слов, при котором подпись надёжна
+SHINGLE_WORDS = 3
+MIN_WORDS = 50
+
+WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+_BIN_SHIFT = 64 - (SIGNATURE_SIZE - 1).bit_length()
+_VALUE_MASK = 0xFFFFFFFF
+_EMPTY = _VALUE_MASK + 1
+
+
+def _hash64(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def minhash(text):
+    """MinHash-подпись текста (кортеж из SIGNATURE_SIZE чисел) или None, если слов меньше MIN_WORDS."""
+    words = [word.lower() for word in WORD_RE.findall(text or "")]
+    if len(words) < MIN_WORDS:
+        return None
+
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    bins = [_EMPTY] * SIGNATURE_SIZE
+    for shingle in shingles:
+        value = _hash64(shingle)
+        index = value >> _BIN_SHIFT
+        value &= _VALUE_MASK
+        if value < bins[index]:
+            bins[index] = value
+
+    # Уплотнение: пустая корзина берёт значение ближайшей непустой справа (по кругу)
+    # со сдвигом на расстояние, чтобы заимствованные значения разных корзин не совпадали случайно
+    for index in range(SIGNATURE_SIZE):
+        if bins[index] != _EMPTY:
+            continue
+        for step in range(1, SIGNATURE_SIZE):
+            donor = bins[(index + step) % SIGNATURE_SIZE]
+            if donor != _EMPTY and donor <= _VALUE_MASK:
+                bins[index] = _EMPTY + (donor + step * 0x9E3779B1 & _VALUE_MASK)
+                break
+    return tuple(value & _VALUE_MASK for value in bins)
+
+
+def similarity(a, b):
+    """Оценка коэффициента Жаккара по двум подписям: доля совпавших позиций."""
+    return sum(map(operator.eq, a, b)) / SIGNATURE_SIZE
+
+
+_BAND_BYTES = ROWS * 4
+
+
+def _bands(packed):
+    """Ключи полос упакованной подписи: ROWS 32-битных значений, сжатые в одно число."""
+    return [hash(packed[offset:offset + _BAND_BYTES]) for offset in range(0, len(packed), _BAND_BYTES)]
+
+
+def _pack(signature):
+    return array('I', signature).tobytes()
+
+
+def _unpack(blob):
+    # array, а не кортеж: 4 байта на значение вместо объекта int
+    values = array('I')
+    values.frombytes(blob)
+    return values
+
+
+class DuplicateIndex:
+    """Подписи обработанных статей: LSH-индекс в памяти + SQLite на диске."""
+
+    def __init__(self, path, threshold=DEFAULT_THRESHOLD, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS articles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                signature BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                title TEXT,
+                source TEXT,
+                draft_id INTEGER,
+                post_link TEXT,
+                published_at REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS articles_draft ON articles (draft_id)")
+        if max_age_days:
+            self._conn.execute("DELETE FROM articles WHERE created_at < ?", (time.time() - max_age_days * 86400,))
+        self._conn.commit()
+
+        self._signatures = {}
+        # Брони статей в обработке (ещё без черновика): отрицательные ID, только в памяти
+        self._pending = {}
+        self._next_pending = 0
+        # Полоса -> ID статьи, при совпадении ключа у нескольких статей — список ID
+        self._bands = [{} for _ in range(BANDS)]
+        for article_id, blob in self._conn.execute("SELECT id, signature FROM articles"):
+            self._index(article_id, _unpack(blob), blob)
+
+    def _index(self, article_id, signature, packed):
+        self._signatures[article_id] = signature
+        for table, key in zip(self._bands, _bands(packed)):
+            present = table.get(key)
+            if present is None:
+                table[key] = article_id
+            elif isinstance(present, list):
+                present.append(article_id)
+            else:
+                table[key] = [present, article_id]
+
+    def _unindex(self, article_id, packed):
+        del self._signatures[article_id]
+        for table, key in zip(self._bands, _bands(packed)):
+            present = table.get(key)
+            if isinstance(present, list):
+                present.remove(article_id)
+                if len(present) == 1:
+                    table[key] = present[0]
+            elif present == article_id:
+                del table[key]
+
+    def _best(self, signature):
+        """(ID, сходство) самой похожей статьи не ниже threshold или (None, 0.0). Вызывается под _lock."""
+        candidates = set()
+        for table, key in zip(self._bands, _bands(_pack(signature))):
+            present = table.get(key)
+            if isinstance(present, list):
+                candidates.update(present)
+            elif present is not None:
+                candidates.add(present)
+        best_id, best_score = None, 0.0
+        for article_id in candidates:
+            score = similarity(signature, self._signatures[article_id])
+            if score >= self.threshold and score > best_score:
+                best_id, best_score = article_id, score
+        return best_id, best_score
+
+    def _match(self, article_id, score):
+        """Описание найденной статьи для find/reserve. Вызывается под _lock."""
+        pending = self._pending.get(article_id)
+        if pending is not None:
+            title, source, created_at = pending['title'], pending['source'], pending['created_at']
+            draft_id = post_link = published_at = None
+        else:
+            title, source, draft_id, post_link, published_at, created_at = self._conn.execute(
+                "SELECT title, source, draft_id, post_link, published_at, created_at FROM articles WHERE id = ?",
+                (article_id,)
+            ).fetchone()
+        return {
+            'id': article_id, 'title': title, 'source': source, 'draft_id': draft_id,
+            'post_link': post_link, 'published_at': published_at, 'created_at': created_at,
+            'similarity': score, 'pending': pending is not None,
+        }
+
+    def find(self, signature):
+        """
+        Самая похожая ранее сохранённая (или обрабатываемая сейчас) статья с оценкой
+        сходства не ниже threshold: словарь с полями id, title, source, draft_id,
+        post_link, published_at, created_at, similarity, pending.
+        None — дубликатов нет (или подписи нет).
+        """
+        if signature is None:
+            return None
+        with self._lock:
+            best_id, best_score = self._best(signature)
+            return self._match(best_id, best_score) if best_id is not None else None
+
+    def reserve(self, signature, title=None, source=None, check=True):
+        """
+        Атомарно проверяет статью на дубликат и, если его нет, занимает её подпись:
+        параллельная обработка перепечатки найдёт эту статью как pending.
+        Возвращает (ID брони, None) или (None, описание дубликата как у find).
+        Бронь подтверждается commit (черновик создан) или снимается release.
+        check=False — без проверки, только бронь. Без подписи — (None, None).
+        """
+        if signature is None:
+            return None, None
+        packed = _pack(signature)
+        with self._lock:
+            if check:
+                best_id, best_score = self._best(signature)
+                if best_id is not None:
+                    return None, self._match(best_id, best_score)
+            self._next_pending -= 1
+            reservation = self._next_pending
+            self._pending[reservation] = {
+                'packed': packed, 'title': title, 'source': source, 'created_at': time.time(),
+            }
+            self._index(reservation, _unpack(packed), packed)
+            return reservation, None
+
+    def commit(self, reservation, draft_id=None, title=None):
+        """Сохраняет забронированную подпись за черновиком. Возвращает ID записи (None — брони нет)."""
+        with self._lock:
+            pending = self._pending.pop(reservation, None)
+            if pending is None:
+                return None
+            packed = pending['packed']
+            self._unindex(reservation, packed)
+            cursor = self._conn.execute(
+                "INSERT INTO articles (signature, created_at, title, source, draft_id) VALUES (?, ?, ?, ?, ?)",
+                (packed, pending['created_at'], title or pending['title'], pending['source'], draft_id)
+            )
+            self._conn.commit()
+            self._index(cursor.lastrowid, _unpack(packed), packed)
+            return cursor.lastrowid
+
+    def release(self, reservation):
+        """Снимает бронь (обработка не удалась). Подтверждённую или уже снятую бронь игнорирует."""
+        with self._lock:
+            pending = self._pending.pop(reservation, None)
+            if pending is not None:
+                self._unindex(reservation, pending['packed'])
+
+    def add(self, signature, title=None, source=None, draft_id=None):
+        """Сохраняет подпись статьи. Возвращает ID записи (None, если подписи нет)."""
+        if signature is None:
+            return None
+        packed = _pack(signature)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO articles (signature, created_at, title, source, draft_id) VALUES (?, ?, ?, ?, ?)",
+                (packed, time.time(), title, source, draft_id)
+            )
+            self._conn.commit()
+            self._index(cursor.lastrowid, _unpack(packed), packed)
+            return cursor.lastrowid
+
+    def mark_published(self, draft_id, post_link=None):
+        """Отмечает статью черновика опубликованной и запоминает ссылку на пост."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE articles SET published_at = ?, post_link = ? WHERE draft_id = ?",
+                (time.time(), post_link, draft_id)
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        return len(self._signatures) - len(self._pending)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,127 @@
+"""
+Хранилище черновиков постов.
+
+Каждый черновик получает числовой ID. Рабочий набор держится в памяти (индекс
+по ID), а каждая запись сразу сохраняется в локальный файл SQLite, поэтому
+уже оплаченный результат GPT/DALL-E переживает перезапуск процесса.
+Опубликованные и устаревшие черновики удаляются.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DRAFT_TTL = 72 * 3600
+
+
+class DraftStore:
+    """Черновики с ID: индекс в памяти + долговременная копия в SQLite."""
+
+    def __init__(self, path, ttl=DEFAULT_DRAFT_TTL):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS drafts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                data TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+        self._drafts = {}
+        for draft_id, created_at, data in self._conn.execute("SELECT id, created_at, data FROM drafts"):
+            draft = json.loads(data)
+            draft['id'] = draft_id
+            draft['created_at'] = created_at
+            self._drafts[draft_id] = draft
+        self.evict_expired()
+
+    def create(self, **fields):
+        """Сохраняет новый черновик и возвращает его (с полями id и created_at)."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO drafts (created_at, data) VALUES (?, ?)",
+                (now, json.dumps(fields, ensure_ascii=False))
+            )
+            self._conn.commit()
+            draft = dict(fields, id=cursor.lastrowid, created_at=now)
+            self._drafts[draft['id']] = draft
+        return dict(draft)
+
+    def update(self, draft_id, **fields):
+        """Дополняет черновик новыми полями. Возвращает обновлённый черновик или None."""
+        with self._lock:
+            draft = self._drafts.get(draft_id)
+            if draft is None:
+                return None
+            draft.update(fields)
+            data = {k: v for k, v in draft.items() if k not in ('id', 'created_at')}
+            self._conn.execute(
+                "UPDATE drafts SET data = ? WHERE id = ?",
+                (json.dumps(data, ensure_ascii=False), draft_id)
+            )
+            self._conn.commit()
+            return dict(draft)
+
+    def get(self, draft_id):
+        """Возвращает черновик по ID или None, если его нет или он устарел."""
+        with self._lock:
+            draft = self._drafts.get(draft_id)
+        if draft is None or self._expired(draft):
+            return None
+        return dict(draft)
+
+    def latest(self):
+        """Самый свежий актуальный черновик или None."""
+        drafts = self.list()
+        return drafts[-1] if drafts else None
+
+    def list(self):
+        """Актуальные черновики в порядке создания."""
+        self.evict_expired()
+        with self._lock:
+            return [dict(self._drafts[draft_id]) for draft_id in sorted(self._drafts)]
+
+    def delete(self, draft_id):
+        """Удаляет черновик (после публикации или по команде). Возвращает True, если он был."""
+        with self._lock:
+            existed = self._drafts.pop(draft_id, None) is not None
+            self._conn.execute("DELETE FROM drafts WHERE id = ?", (draft_id,))
+            self._conn.commit()
+        return existed
+
+    def _expired(self, draft, now=None):
+        return (now or time.time()) - draft['created_at'] > self.ttl
+
+    def evict_expired(self):
+        """Удаляет устаревшие черновики. Возвращает их число."""
+        now = time.time()
+        with self._lock:
+            expired = [draft_id for draft_id, draft in self._drafts.items() if self._expired(draft, now)]
+            for draft_id in expired:
+                del self._drafts[draft_id]
+            if expired:
+                self._conn.execute("DELETE FROM drafts WHERE created_at < ?", (now - self.ttl,))
+                self._conn.commit()
+        if expired:
+            logger.info(f"Удалены устаревшие черновики: {expired}")
+        return len(expired)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._drafts)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
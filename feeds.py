@@ -0,0 +1,339 @@
+"""
+Подписки на RSS/Atom-ленты.
+
+Ленты опрашиваются по расписанию (job_queue бота). Каждый опрос — условный
+GET через общий httpx-клиент (fetcher.get_http_client) с If-None-Match /
+If-Modified-Since из прошлого ответа, поэтому неизменившаяся лента стоит один
+ответ 304 без тела. Если сервер не поддерживает условные запросы, тело
+сравнивается по хэшу с прошлым и повторно не разбирается.
+
+Из ленты (RSS 2.0, RSS 1.0/RDF или Atom, разбор через xml.etree) берутся
+идентификаторы записей (guid / id, иначе ссылка). Просмотренные записи хранятся
+компактно — 64-битным хэшем идентификатора, не больше MAX_SEEN_PER_FEED на
+ленту, — в SQLite рядом с состоянием лент (ETag, Last-Modified, ошибки).
+Наружу отдаются только новые записи; их ссылки бот обрабатывает как обычные.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from urllib.parse import urljoin
+
+import httpx
+
+from fetcher import USER_AGENTS, get_http_client
+from metrics import FETCHED_BYTES, span
+from profiles import domain_of
+
+logger = logging.getLogger(__name__)
+
+# Лента дочитывается не дальше этого размера
+MAX_FEED_BYTES = 2 * 1024 * 1024
+FEED_TIMEOUT = 20
+# Сколько хэшей просмотренных записей хранить на ленту (с запасом больше окна любой ленты)
+MAX_SEEN_PER_FEED = 1000
+# Ленты с ошибками опрашиваются реже: интервал удваивается за каждую ошибку подряд, до 2^N раз
+MAX_BACKOFF_EXPONENT = 5
+
+FEED_ACCEPT = "application/rss+xml, application/atom+xml, application/xml;q=0.9, text/xml;q=0.9, */*;q=0.5"
+
+
+class FeedError(Exception):
+    """Лента недоступна или не разбирается."""
+
+
+@dataclass
+class FeedEntry:
+    key: str
+    link: str
+    title: str = ""
+
+
+def _local(tag):
+    """Имя тега без пространства имён: {http://www.w3.org/2005/Atom}entry -> entry."""
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ""
+
+
+def _child_text(element, name):
+    for child in element:
+        if _local(child.tag) == name:
+            return (child.text or "").strip()
+    return ""
+
+
+def _atom_link(entry):
+    """Ссылка записи Atom: rel="alternate" (или без rel), иначе первая."""
+    fallback = ""
+    for child in entry:
+        if _local(child.tag) != 'link':
+            continue
+        href = (child.get('href') or "").strip()
+        if href and child.get('rel', 'alternate') == 'alternate':
+            return href
+        fallback = fallback or href
+    return fallback
+
+
+def parse_feed(data, base_url=""):
+    """
+    Разбирает RSS/Atom. Возвращает (заголовок ленты, записи в порядке ленты).
+    Записи без ссылки пропускаются. FeedError — если это не лента.
+    """
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError as e:
+        raise FeedError(f"некорректный XML: {e}")
+
+    kind = _local(root.tag)
+    if kind == 'feed':
+        channel, item_name = root, 'entry'
+    elif kind == 'rss':
+        channel = next((child for child in root if _local(child.tag) == 'channel'), None)
+        if channel is None:
+            raise FeedError("в RSS нет <channel>")
+        item_name = 'item'
+    elif kind == 'RDF':
+        channel, item_name = root, 'item'
+    else:
+        raise FeedError(f"неизвестный формат ленты <{kind}>")
+
+    if kind == 'RDF':
+        meta = next((child for child in root if _local(child.tag) == 'channel'), root)
+        title = _child_text(meta, 'title')
+    else:
+        title = _child_text(channel, 'title')
+
+    entries = []
+    for item in channel:
+        if _local(item.tag) != item_name:
+            continue
+        if kind == 'feed':
+            link = _atom_link(item)
+            key = _child_text(item, 'id')
+        else:
+            link = _child_text(item, 'link')
+            key = _child_text(item, 'guid') or item.get('{http://www.w3.org/1999/02/22-rdf-syntax-ns#}about', '')
+        if not link:
+            continue
+        link = urljoin(base_url, link)
+        entries.append(FeedEntry(key=key or link, link=link, title=_child_text(item, 'title')))
+    return title, entries
+
+
+def entry_hash(key):
+    """64-битный хэш идентификатора записи (со знаком — под INTEGER в SQLite)."""
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+def _body_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class FeedStore:
+    """Подписки, их состояние для условных запросов и хэши просмотренных записей (SQLite)."""
+
+    FIELDS = ('url', 'title', 'etag', 'last_modified', 'body_hash', 'added_at',
+              'checked_at', 'last_new_at', 'errors', 'last_error')
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS feeds (
+                url TEXT PRIMARY KEY,
+                title TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                body_hash TEXT,
+                added_at REAL NOT NULL,
+                checked_at REAL,
+                last_new_at REAL,
+                errors INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS seen (
+                feed_url TEXT NOT NULL,
+                entry INTEGER NOT NULL,
+                seen_at REAL NOT NULL,
+                PRIMARY KEY (feed_url, entry)
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+
+        self._feeds = {}
+        for row in self._conn.execute(f"SELECT {', '.join(self.FIELDS)} FROM feeds ORDER BY added_at"):
+            feed = dict(zip(self.FIELDS, row))
+            self._feeds[feed['url']] = feed
+        self._seen = {url: set() for url in self._feeds}
+        for feed_url, entry in self._conn.execute("SELECT feed_url, entry FROM seen"):
+            self._seen.setdefault(feed_url, set()).add(entry)
+
+    def add(self, url, title=None):
+        """Добавляет подписку. False — такая уже есть."""
+        with self._lock:
+            if url in self._feeds:
+                return False
+            feed = dict.fromkeys(self.FIELDS)
+            feed.update(url=url, title=title, added_at=time.time(), errors=0)
+            self._conn.execute(
+                f"INSERT INTO feeds ({', '.join(self.FIELDS)}) VALUES ({', '.join('?' * len(self.FIELDS))})",
+                tuple(feed[name] for name in self.FIELDS)
+            )
+            self._conn.commit()
+            self._feeds[url] = feed
+            self._seen[url] = set()
+            return True
+
+    def remove(self, url):
+        """Удаляет подписку вместе с просмотренными записями. False — её не было."""
+        with self._lock:
+            if self._feeds.pop(url, None) is None:
+                return False
+            self._seen.pop(url, None)
+            self._conn.execute("DELETE FROM feeds WHERE url = ?", (url,))
+            self._conn.execute("DELETE FROM seen WHERE feed_url = ?", (url,))
+            self._conn.commit()
+            return True
+
+    def get(self, url):
+        with self._lock:
+            feed = self._feeds.get(url)
+            return dict(feed) if feed else None
+
+    def list(self):
+        """Подписки в порядке добавления."""
+        with self._lock:
+            return [dict(feed) for feed in self._feeds.values()]
+
+    def update(self, url, **fields):
+        with self._lock:
+            feed = self._feeds.get(url)
+            if feed is None:
+                return
+            feed.update(fields)
+            names = [name for name in fields if name in self.FIELDS and name != 'url']
+            if names:
+                self._conn.execute(
+                    f"UPDATE feeds SET {', '.join(f'{name} = ?' for name in names)} WHERE url = ?",
+                    (*(fields[name] for name in names), url)
+                )
+                self._conn.commit()
+
+    def unseen(self, url, entries):
+        """Записи, которых ещё не было в этой ленте (порядок сохраняется)."""
+        with self._lock:
+            seen = self._seen.get(url, set())
+            return [entry for entry in entries if entry_hash(entry.key) not in seen]
+
+    def mark_seen(self, url, entries):
+        """Запоминает записи как просмотренные; старые хэши сверх MAX_SEEN_PER_FEED удаляются."""
+        if not entries:
+            return
+        now = time.time()
+        hashes = {entry_hash(entry.key) for entry in entries}
+        with self._lock:
+            if url not in self._feeds:
+                return
+            self._seen[url].update(hashes)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO seen (feed_url, entry, seen_at) VALUES (?, ?, ?)",
+                [(url, value, now) for value in hashes]
+            )
+            if len(self._seen[url]) > MAX_SEEN_PER_FEED:
+                stale = [value for (value,) in self._conn.execute(
+                    "SELECT entry FROM seen WHERE feed_url = ? ORDER BY seen_at DESC LIMIT -1 OFFSET ?",
+                    (url, MAX_SEEN_PER_FEED)
+                )]
+                self._conn.executemany("DELETE FROM seen WHERE feed_url = ? AND entry = ?", [(url, value) for value in stale])
+                self._seen[url].difference_update(stale)
+            self._conn.commit()
+
+    def __len__(self):
+        return len(self._feeds)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def is_due(feed, interval, now=None):
+    """Пора ли опрашивать ленту: прошёл интервал (для ленты с ошибками — увеличенный)."""
+    if not feed['checked_at']:
+        return True
+    now = now if now is not None else time.time()
+    backoff = 2 ** min(feed['errors'] or 0, MAX_BACKOFF_EXPONENT)
+    # Небольшой допуск: задача job_queue срабатывает не ровно через interval
+    return now - feed['checked_at'] >= interval * backoff - 5
+
+
+async def fetch_feed(feed):
+    """
+    Условный GET ленты. Возвращает (тело, заголовки) или (None, заголовки), если лента
+    не изменилась (304). Ошибки загрузки — httpx.HTTPError, слишком большой ответ — FeedError.
+    """
+    headers = {'User-Agent': USER_AGENTS[0], 'Accept': FEED_ACCEPT}
+    if feed.get('etag'):
+        headers['If-None-Match'] = feed['etag']
+    if feed.get('last_modified'):
+        headers['If-Modified-Since'] = feed['last_modified']
+
+    async with get_http_client().stream('GET', feed['url'], headers=headers, timeout=FEED_TIMEOUT) as response:
+        if response.status_code == 304:
+            return None, response.headers
+        response.raise_for_status()
+        chunks = []
+        received = 0
+        async for chunk in response.aiter_bytes():
+            received += len(chunk)
+            if received > MAX_FEED_BYTES:
+                raise FeedError(f"лента больше {MAX_FEED_BYTES // 1024} КБ")
+            chunks.append(chunk)
+    FETCHED_BYTES.inc(received, kind='feed')
+    return b"".join(chunks), response.headers
+
+
+async def check_feed(store, url):
+    """
+    Опрашивает одну ленту. Возвращает (новые записи от старых к новым, состояние ответа).
+    Состояние (ETag, Last-Modified, хэш тела) нужно сохранить через store.update, когда все
+    новые записи обработаны: иначе следующий опрос получит 304 и остаток записей потеряется.
+    Пустой список и None — лента не изменилась. Ошибки считаются в store и пробрасываются.
+    """
+    feed = store.get(url)
+    if feed is None:
+        return [], None
+    now = time.time()
+    with span('feed_fetch', mode='feed', domain=domain_of(url)) as s:
+        try:
+            body, headers = await fetch_feed(feed)
+            if body is None:
+                s.outcome = 'not_modified'
+                store.update(url, checked_at=now, errors=0, last_error=None)
+                return [], None
+
+            digest = _body_hash(body)
+            if digest == feed['body_hash']:
+                s.outcome = 'unchanged'
+                store.update(url, checked_at=now, errors=0, last_error=None)
+                return [], None
+
+            title, entries = await asyncio.to_thread(parse_feed, body, url)
+        except (httpx.HTTPError, FeedError) as e:
+            store.update(url, checked_at=now, errors=(feed['errors'] or 0) + 1, last_error=str(e)[:200])
+            raise
+
+    store.update(url, checked_at=now, errors=0, last_error=None, title=feed['title'] or title or None)
+    state = {'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified'), 'body_hash': digest}
+    # Лента идёт от новых к старым: обрабатываем в хронологическом порядке
+    return list(reversed(store.unseen(url, entries))), state
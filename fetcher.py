@@ -0,0 +1,554 @@
+"""
+Слой загрузки статей.
+
+Каждая ссылка скачивается и разбирается ровно один раз: из одного дерева
+BeautifulSoup извлекаются и заголовок с текстом, и главное изображение.
+Результат кладётся в небольшой TTL-кэш процесса по нормализованному URL,
+поэтому повторная отправка той же ссылки не вызывает новой загрузки.
+
+Загрузка идёт через общий асинхронный httpx-клиент с пулом keep-alive
+соединений, потоком и с ограничением размера страницы. Разбор HTML выполняется
+в отдельном потоке, а тяжёлые страницы — в пуле процессов, чтобы не блокировать
+цикл событий бота. Если установлен lxml, используется он. Мета-теги (og:image)
+сначала ищутся быстрым сканированием байтов до </head>, без построения дерева.
+BeautifulSoup импортируется при первом разборе (или в фоне через warm_up),
+чтобы не замедлять холодный старт бота. Процессы пула запускаются через
+forkserver, а не fork: бот многопоточный.
+"""
+import asyncio
+import functools
+import html as html_lib
+import logging
+import multiprocessing
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+
+import httpx
+
+from metrics import FETCHED_BYTES, span
+from profiles import domain_of
+from resilience import CircuitBreakerRegistry, parse_retry_after, retry_async
+
+logger = logging.getLogger(__name__)
+
+# Список актуальных User-Agent'ов для ротации
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+]
+
+# Таймаут загрузки страницы (секунды)
+FETCH_TIMEOUT = 15
+
+# Страница дочитывается не дальше этого размера: статья и мета-теги всегда в начале
+MAX_PAGE_BYTES = int(os.getenv("MAX_PAGE_BYTES", str(3 * 1024 * 1024)))
+
+# Парсер BeautifulSoup: lxml (быстрее в разы), если установлен, иначе встроенный html.parser
+try:
+    import lxml  # noqa: F401
+    DEFAULT_HTML_PARSER = 'lxml'
+except ImportError:
+    DEFAULT_HTML_PARSER = 'html.parser'
+HTML_PARSER = os.getenv("HTML_PARSER", DEFAULT_HTML_PARSER)
+
+# Страницы больше этого размера разбираются в пуле процессов (0 процессов — всегда в потоке)
+PARSE_PROCESSES = int(os.getenv("PARSE_PROCESSES", "2"))
+PROCESS_PARSE_MIN_BYTES = 512 * 1024
+
+# Повторы загрузки при таймаутах и 5xx; после серии ошибок хост временно отключается
+FETCH_ATTEMPTS = 3
+HOST_FAILURE_THRESHOLD = 5
+HOST_RESET_TIMEOUT = 120
+# Если сайт почти всегда отвечает 403, повтор с другим User-Agent бесполезен
+FORBIDDEN_RETRY_MAX_RATE = 0.8
+
+# Если </head> не найден, мета-теги ищутся только в начале документа
+HEAD_SCAN_LIMIT = 256 * 1024
+
+# Ограничения пула соединений общего HTTP-клиента
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
+HTTP_KEEPALIVE_EXPIRY = 30
+
+# Картинки для Telegram: не больше лимита загрузки фото (10 МБ) и только image/*
+IMAGE_MAX_BYTES = 10 * 1024 * 1024
+IMAGE_TIMEOUT = 20
+
+# Время жизни записи в кэше документов и максимальное число записей
+DOCUMENT_CACHE_TTL = 15 * 60
+DOCUMENT_CACHE_MAX_ITEMS = 128
+
+# Трекинговые параметры, которые не влияют на содержимое страницы
+TRACKING_PARAM_RE = re.compile(r'^(utm_\w+|fbclid|gclid|yclid|mc_cid|mc_eid|ref|ref_src)$', re.I)
+
+# Стандартная цепочка поиска контейнера статьи (после неё — div с «говорящим» классом)
+DEFAULT_CONTAINER_SELECTORS = ('article', 'main')
+CONTAINER_CLASS_RE = re.compile(r'(content|body|post|article)', re.I)
+HEAD_END_RE = re.compile(rb'</head\s*>', re.I)
+META_TAG_RE = re.compile(rb'<meta\b[^>]*>', re.I)
+TAG_ATTR_RE = re.compile(rb'([a-zA-Z_:.-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+))')
+HERO_IMAGE_CLASS_RE = re.compile(r'(main|hero|featured|post-image)', re.I)
+
+
+class ImageDownloadError(Exception):
+    """Картинку нельзя использовать: не изображение, слишком большая или оборвалась загрузка."""
+
+
+@dataclass
+class ArticleDocument:
+    """Результат единственной загрузки и разбора страницы."""
+    url: str
+    title: str
+    text: str
+    image_url: Optional[str]
+    body_found: bool
+    fetched_at: float
+    # Какие селекторы сработали (для профилей доменов)
+    container_selector: Optional[str] = None
+    image_selector: Optional[str] = None
+
+
+def normalize_url(url):
+    """Приводит URL к каноническому виду для ключа кэша: регистр хоста, без фрагмента и трекинга."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    path = parts.path or '/'
+    if len(path) > 1 and path.endswith('/'):
+        path = path.rstrip('/')
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not TRACKING_PARAM_RE.match(k)
+    ))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def scan_head_meta(html):
+    """
+    Быстро достаёт мета-теги property/name -> content из байтов <head>, не строя дерево.
+    Сканирование останавливается на </head>.
+    """
+    head_end = HEAD_END_RE.search(html)
+    head = html[:head_end.start()] if head_end else html[:HEAD_SCAN_LIMIT]
+
+    meta = {}
+    for tag in META_TAG_RE.finditer(head):
+        attrs = {}
+        for match in TAG_ATTR_RE.finditer(tag.group(0)):
+            value = match.group(2) if match.group(2) is not None else (
+                match.group(3) if match.group(3) is not None else match.group(4)
+            )
+            attrs[match.group(1).lower()] = value
+        key = attrs.get(b'property') or attrs.get(b'name')
+        content = attrs.get(b'content')
+        if key and content:
+            name = key.decode('ascii', errors='ignore').lower()
+            meta.setdefault(name, html_lib.unescape(content.decode('utf-8', errors='replace')).strip())
+    return meta
+
+
+@functools.lru_cache(maxsize=256)
+def compile_selector(selector):
+    """
+    Превращает селектор вида 'article', 'div.post-content' или 'img.hero'
+    в готовую функцию поиска по дереву. Скомпилированные селекторы кэшируются.
+    """
+    tag, _, css_class = selector.partition('.')
+    if css_class:
+        return lambda node: node.find(tag, class_=css_class)
+    return lambda node: node.find(tag)
+
+
+def _matched_class(node, pattern):
+    return next((c for c in (node.get('class') or []) if pattern.search(c)), None)
+
+
+def _find_container(soup, hint=None):
+    # Сначала — селектор, который уже срабатывал на этом сайте
+    if hint:
+        node = compile_selector(hint)(soup)
+        if node is not None:
+            return node, hint
+
+    for selector in DEFAULT_CONTAINER_SELECTORS:
+        if selector != hint:
+            node = compile_selector(selector)(soup)
+            if node is not None:
+                return node, selector
+
+    node = soup.find('div', class_=CONTAINER_CLASS_RE)
+    if node is None:
+        return None, None
+    # Запоминаем конкретный класс, чтобы в следующий раз искать без регулярного выражения
+    css_class = _matched_class(node, CONTAINER_CLASS_RE)
+    return node, f"div.{css_class}" if css_class else None
+
+
+def _find_hero_image(content, url, hint=None):
+    if hint and hint.startswith('img.'):
+        first_img = compile_selector(hint)(content)
+        if first_img is not None and first_img.get('src'):
+            return urljoin(url, first_img['src']), hint
+
+    first_img = content.find('img', class_=HERO_IMAGE_CLASS_RE)
+    if first_img and first_img.get('src'):
+        css_class = _matched_class(first_img, HERO_IMAGE_CLASS_RE)
+        # Обработка относительных URL
+        return urljoin(url, first_img['src']), f"img.{css_class}" if css_class else None
+    return None, None
+
+
+def _find_image(soup, head_meta, url, hint=None):
+    content = None
+    # Сайт, где og:image не бывает: сразу ищем картинку проверенным селектором
+    if hint and hint.startswith('img.'):
+        content = soup.find('article') or soup.find('main')
+        if content is not None:
+            image_url, selector = _find_hero_image(content, url, hint)
+            if image_url and selector == hint:
+                return image_url, selector
+
+    # 1. Поиск по мета-тегу og:image (самый надежный способ): сначала в отсканированном <head>
+    if head_meta.get('og:image'):
+        return urljoin(url, head_meta['og:image']), 'og:image'
+    og_image = soup.find('meta', property='og:image')
+    if og_image and og_image.get('content'):
+        return urljoin(url, og_image['content']), 'og:image'
+
+    # 2. Поиск первой большой картинки в основном контенте
+    if content is None:
+        content = soup.find('article') or soup.find('main')
+    if content is not None:
+        return _find_hero_image(content, url, hint)
+    return None, None
+
+
+def extract_article(html, url, parser=None, hints=None):
+    """
+    Извлекает заголовок, основной текст и главное изображение из одного дерева разбора.
+    hints — проверенные селекторы сайта ({'container': ..., 'image': ...}), пробуются первыми.
+    """
+    from bs4 import BeautifulSoup
+
+    hints = hints or {}
+    head_meta = scan_head_meta(html) if isinstance(html, bytes) else {}
+    soup = BeautifulSoup(html, parser or HTML_PARSER)
+
+    title = soup.find('h1')
+    title_text = title.get_text(strip=True) if title else "Заголовок не найден"
+
+    # Изображение ищем до очистки дерева, чтобы не потерять картинки внутри удаляемых блоков
+    image_url, image_selector = _find_image(soup, head_meta, url, hints.get('image'))
+
+    article_body, container_selector = _find_container(soup, hints.get('container'))
+
+    text = ""
+    if article_body:
+        for script_or_style in article_body(["script", "style", "nav", "footer"]):
+            script_or_style.decompose()
+
+        paragraphs = article_body.find_all('p')
+        text = "\n\n".join(p.get_text(strip=True) for p in paragraphs if p.get_text(strip=True))
+
+    return ArticleDocument(
+        url=url,
+        title=title_text,
+        text=text,
+        image_url=image_url,
+        body_found=article_body is not None,
+        fetched_at=time.time(),
+        container_selector=container_selector,
+        image_selector=image_selector if image_url else None,
+    )
+
+
+# --- TTL-кэш документов ---
+
+_document_cache = OrderedDict()
+_document_cache_lock = threading.Lock()
+
+
+def _cache_get(key):
+    with _document_cache_lock:
+        entry = _document_cache.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > DOCUMENT_CACHE_TTL:
+            del _document_cache[key]
+            return None
+        _document_cache.move_to_end(key)
+        return entry[1]
+
+
+def _cache_put(key, document):
+    with _document_cache_lock:
+        _document_cache[key] = (time.monotonic(), document)
+        _document_cache.move_to_end(key)
+        while len(_document_cache) > DOCUMENT_CACHE_MAX_ITEMS:
+            _document_cache.popitem(last=False)
+
+
+# --- Общий HTTP-клиент ---
+
+_http_client = None
+
+
+def get_http_client():
+    """Возвращает общий httpx.AsyncClient (создаётся при первом обращении)."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=FETCH_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """Закрывает общий HTTP-клиент и его соединения."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# Загрузки, которые выполняются прямо сейчас: параллельные запросы одного URL ждут одну загрузку
+_in_flight = {}
+
+
+def _forget_in_flight(key, task):
+    _in_flight.pop(key, None)
+    # Забираем исключение, чтобы asyncio не ругался, если все ожидающие уже отменены
+    if not task.cancelled():
+        task.exception()
+
+
+# --- Пул процессов для тяжёлого разбора ---
+
+_parse_pool = None
+
+
+def warm_up():
+    """Заранее импортирует BeautifulSoup и парсер, чтобы первая ссылка не платила за импорт."""
+    from bs4 import BeautifulSoup
+    BeautifulSoup("<html><body><p>warm-up</p></body></html>", HTML_PARSER)
+
+
+def get_parse_pool():
+    """Возвращает пул процессов для разбора больших страниц (создаётся при первом обращении)."""
+    global _parse_pool
+    if _parse_pool is None:
+        # Не fork: у бота несколько потоков (разбор в to_thread, фоновый прогрев, SQLite), и
+        # дочерний процесс мог бы унаследовать чужую занятую блокировку. forkserver запускает
+        # процессы из однопоточного сервера; главный модуль (под защитой __main__) и fetcher
+        # импортируются в нём один раз, а не в каждом процессе. Где forkserver нет — spawn.
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(['__main__', 'fetcher'])
+        else:
+            context = multiprocessing.get_context('spawn')
+        _parse_pool = ProcessPoolExecutor(max_workers=PARSE_PROCESSES, mp_context=context)
+    return _parse_pool
+
+
+def shutdown_parse_pool():
+    """Останавливает пул процессов разбора."""
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
+
+
+async def parse_document(html, url, hints=None):
+    """Разбирает HTML вне цикла событий: крупные страницы — в пуле процессов, остальные — в потоке."""
+    if PARSE_PROCESSES > 0 and len(html) >= PROCESS_PARSE_MIN_BYTES:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_parse_pool(), extract_article, html, url, None, hints)
+    return await asyncio.to_thread(extract_article, html, url, None, hints)
+
+
+async def download_page(url, max_bytes=MAX_PAGE_BYTES, user_agent_index=None):
+    """
+    Скачивает страницу потоком, не дальше max_bytes.
+    user_agent_index — номер User-Agent, который уже не получал отказа на этом сайте.
+    Возвращает (байты, конечный URL после редиректов, номер использованного User-Agent).
+    """
+    if user_agent_index is None or not 0 <= user_agent_index < len(USER_AGENTS):
+        # Ротация User-Agent
+        user_agent_index = random.randrange(len(USER_AGENTS))
+    # Усиленные заголовки для обхода 403
+    headers = {
+        'User-Agent': USER_AGENTS[user_agent_index],
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Referer': 'https://www.google.com/',
+    }
+    async with get_http_client().stream('GET', url, headers=headers) as response:
+        response.raise_for_status()
+        chunks = []
+        received = 0
+        async for chunk in response.aiter_bytes():
+            chunks.append(chunk)
+            received += len(chunk)
+            if received >= max_bytes:
+                logger.warning(f"Страница {url} больше {max_bytes} байт, остаток не загружается.")
+                break
+        final_url = str(response.url)
+    FETCHED_BYTES.inc(received, kind='page')
+    return b"".join(chunks)[:max_bytes], final_url or url, user_agent_index
+
+
+# Размыкатели цепи по хостам сайтов-источников
+host_breakers = CircuitBreakerRegistry(failure_threshold=HOST_FAILURE_THRESHOLD, reset_timeout=HOST_RESET_TIMEOUT)
+
+
+def is_retryable_http_error(e):
+    """Стоит ли повторять загрузку: таймауты, обрывы соединения, 408/425/429 и 5xx."""
+    if isinstance(e, httpx.HTTPStatusError):
+        status = e.response.status_code
+        return status in (408, 425, 429) or status >= 500
+    return isinstance(e, httpx.TransportError)
+
+
+def http_retry_after(e):
+    if isinstance(e, httpx.HTTPStatusError):
+        return parse_retry_after(e.response.headers.get('Retry-After'))
+    return None
+
+
+async def _download_with_retries(url, domain, hints, profiles):
+    state = {
+        'user_agent': hints.get('user_agent'),
+        # Одна попытка сменить User-Agent после 403 — если сайт не блокирует нас всегда
+        'forbidden_retries': 1 if not profiles or profiles.forbidden_rate(domain) < FORBIDDEN_RETRY_MAX_RATE else 0,
+    }
+
+    def record(started, status, user_agent_index=None):
+        if profiles:
+            profiles.record_fetch(domain, (time.monotonic() - started) * 1000, status, user_agent_index)
+
+    async def attempt():
+        user_agent_index = state['user_agent']
+        if user_agent_index is None:
+            user_agent_index = random.randrange(len(USER_AGENTS))
+        started = time.monotonic()
+        try:
+            result = await download_page(url, user_agent_index=user_agent_index)
+        except httpx.HTTPStatusError as e:
+            record(started, e.response.status_code)
+            if e.response.status_code == 403:
+                state['user_agent'] = (user_agent_index + 1) % len(USER_AGENTS)
+            raise
+        except httpx.HTTPError:
+            record(started, None)
+            raise
+        record(started, 200, user_agent_index)
+        return result
+
+    def is_retryable(e):
+        if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 403 and state['forbidden_retries']:
+            state['forbidden_retries'] -= 1
+            return True
+        return is_retryable_http_error(e)
+
+    return await retry_async(
+        attempt,
+        name=f"Загрузка {domain}",
+        is_retryable=is_retryable,
+        retry_after=http_retry_after,
+        attempts=FETCH_ATTEMPTS,
+        base_delay=0.5,
+        max_delay=5.0,
+        breaker=host_breakers.get(domain),
+    )
+
+
+async def _download_and_extract(url, profiles=None):
+    domain = domain_of(url)
+    hints = profiles.hints(domain) if profiles else {}
+
+    with span('fetch', domain=domain):
+        html, final_url, user_agent_index = await _download_with_retries(url, domain, hints, profiles)
+
+    # Относительные ссылки на изображения разрешаем от конечного URL после редиректов
+    with span('parse', domain=domain) as parse_span:
+        document = await parse_document(html, final_url, hints)
+        if not document.body_found:
+            parse_span.outcome = 'no_body'
+    if profiles:
+        profiles.record_extraction(domain, document.container_selector, document.image_selector)
+    return document
+
+
+async def fetch_article(url, profiles=None):
+    """
+    Возвращает ArticleDocument для URL: из кэша, либо после одной загрузки и одного разбора.
+    profiles — DomainProfileStore: проверенные селекторы сайта пробуются первыми,
+    а результаты загрузки и разбора записываются в профиль.
+    Временные ошибки повторяются; окончательные пробрасываются как httpx.HTTPError,
+    а для хоста с разомкнутой цепью — как resilience.CircuitOpenError.
+    """
+    key = normalize_url(url)
+    cached = _cache_get(key)
+    if cached is not None:
+        logger.info(f"Документ взят из кэша: {key}")
+        return cached
+
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_download_and_extract(url, profiles))
+        _in_flight[key] = task
+        task.add_done_callback(lambda t: _forget_in_flight(key, t))
+
+    # shield: отмена одного ожидающего не должна прерывать загрузку для остальных
+    document = await asyncio.shield(task)
+    _cache_put(key, document)
+    return document
+
+
+async def download_image(url, max_bytes=IMAGE_MAX_BYTES):
+    """
+    Скачивает изображение потоком и возвращает его байты.
+    Проверяет Content-Type и размер: загрузка прерывается, как только превышен max_bytes.
+    """
+    headers = {'User-Agent': random.choice(USER_AGENTS), 'Accept': 'image/*'}
+    async with get_http_client().stream('GET', url, headers=headers, timeout=IMAGE_TIMEOUT) as response:
+        response.raise_for_status()
+
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if not content_type.startswith('image/'):
+            raise ImageDownloadError(f"ожидалось изображение, получен Content-Type '{content_type or 'нет'}'")
+
+        declared = response.headers.get('Content-Length')
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise ImageDownloadError(f"изображение больше {max_bytes} байт ({declared})")
+
+        chunks = []
+        received = 0
+        async for chunk in response.aiter_bytes():
+            received += len(chunk)
+            if received > max_bytes:
+                raise ImageDownloadError(f"изображение больше {max_bytes} байт")
+            chunks.append(chunk)
+
+    FETCHED_BYTES.inc(received, kind='image')
+    if not received:
+        raise ImageDownloadError("пустой ответ")
+    return b"".join(chunks)
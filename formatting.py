@@ -0,0 +1,218 @@
+"""
+Подготовка текста поста к отправке в Telegram (parse_mode='HTML').
+
+Текст от GPT — обычный текст с тегами <b> и <i>. format_post разбирает его
+одним регулярным выражением на токены: разрешённые теги, символы &, <, >
+(экранируются) и отрезки прочего текста. За тот же проход:
+- теги балансируются: лишние закрывающие отбрасываются, незакрытые
+  закрываются в конце, перекрёстная вложенность исправляется;
+- длина считается так, как её считает Telegram: видимый текст после разбора
+  разметки в единицах UTF-16 (эмодзи вне BMP — две единицы, тег — ноль,
+  &amp; — одна);
+- если текст не помещается в limit, он обрезается по последней границе
+  предложения (если её нет во второй половине лимита — по слову), открытые
+  теги закрываются, а остаток можно вернуть отдельным сообщением (overflow),
+  где те же теги открываются заново.
+"""
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+# Лимиты Telegram в единицах UTF-16: подпись к фото и текст сообщения
+CAPTION_LIMIT = 1024
+MESSAGE_LIMIT = 4096
+
+TOKEN_RE = re.compile(r"<(/?)([bi])>|([&<>])|([^&<>]+)", re.IGNORECASE)
+TAG_RE = re.compile(r"</?[bi]>", re.IGNORECASE)
+ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;'}
+# Конец предложения: знак препинания (с закрывающими кавычками) перед пробелом или переводом строки
+SENTENCE_END_RE = re.compile(r"[.!?…]+[\"'»”)\]]*(?=\s|$)|\n")
+# Граница предложения ищется не раньше этой доли лимита, иначе режем по слову
+MIN_CUT_RATIO = 0.5
+# Символы вне BMP (эмодзи и т.п.): в UTF-16 занимают две единицы
+ASTRAL_RE = re.compile("[\U00010000-\U0010FFFF]")
+
+
+@dataclass
+class FormattedPost:
+    text: str
+    # Длина text в единицах Telegram
+    length: int
+    truncated: bool = False
+    # Остаток, не поместившийся в limit (HTML), если просили split
+    overflow: Optional[str] = None
+
+
+def telegram_length(text):
+    """Длина видимого текста в единицах UTF-16, как её считает Telegram."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _tokens(text):
+    """Токены ('open'|'close'|'text', значение) со сбалансированными тегами."""
+    stack = []
+    for match in TOKEN_RE.finditer(text):
+        closing, tag, special, run = match.groups()
+        if tag is None:
+            yield 'text', special or run
+            continue
+        tag = tag.lower()
+        if not closing:
+            if tag not in stack:
+                stack.append(tag)
+                yield 'open', tag
+            continue
+        if tag not in stack:
+            continue
+        # <b><i>..</b>..</i> -> <b><i>..</i></b><i>..</i>: вложенные теги закрываются и открываются снова
+        reopen = []
+        while stack[-1] != tag:
+            reopen.append(stack.pop())
+            yield 'close', reopen[-1]
+        stack.pop()
+        yield 'close', tag
+        for inner in reversed(reopen):
+            stack.append(inner)
+            yield 'open', inner
+    for tag in reversed(stack):
+        yield 'close', tag
+
+
+def _render(tokens):
+    parts = []
+    for kind, value in tokens:
+        if kind == 'text':
+            parts.append(ESCAPES.get(value, value))
+        else:
+            parts.append(f"<{'/' if kind == 'close' else ''}{value}>")
+    return "".join(parts)
+
+
+def _visible_length(tokens):
+    return sum(telegram_length(value) for kind, value in tokens if kind == 'text')
+
+
+def visible_length(text):
+    """Длина текста с разметкой <b>/<i> в единицах Telegram (теги не считаются)."""
+    return telegram_length(text) - sum(map(len, TAG_RE.findall(text)))
+
+
+def _last_sentence_end(run, end):
+    position = None
+    for match in SENTENCE_END_RE.finditer(run, 0, end):
+        # Конец среза — не конец предложения, если в тексте дальше не пробел ("3.|14")
+        if match.end() == end < len(run) and not run[end].isspace():
+            continue
+        position = match.end()
+    return position
+
+
+def _prefix_fitting(run, room):
+    """Сколько символов run помещается в room единиц UTF-16 (перебираются только символы вне BMP)."""
+    if telegram_length(run) <= room:
+        return len(run)
+    extra = 0
+    for match in ASTRAL_RE.finditer(run):
+        position = match.start()
+        if position + extra >= room:
+            break
+        if position + extra + 2 > room:
+            return position
+        extra += 1
+    return room - extra
+
+
+def _fit(tokens, total, limit, suffix_tokens=(), keep_rest=False):
+    """
+    Укладывает токены (итератор, total — их видимая длина) в limit единиц.
+    Возвращает (html, длина, обрезан ли, остаток токенов — если keep_rest).
+    suffix_tokens добавляются только при обрезке (их длина входит в limit).
+    Токены после места обрезки без keep_rest не разбираются.
+    """
+    if total <= limit:
+        return _render(tokens), total, False, None
+
+    budget = max(0, limit - _visible_length(suffix_tokens))
+    min_units = budget * MIN_CUT_RATIO
+    out = []
+    consumed = []
+    stack = []
+    units = 0
+    # Последний принятый отрезок с границей предложения: (индекс в out, стек, индекс токена, единиц до него)
+    boundary = None
+    cut = None
+
+    for index, (kind, value) in enumerate(tokens):
+        consumed.append((kind, value))
+        if kind == 'open':
+            out.append(f"<{value}>")
+            stack.append(value)
+            continue
+        if kind == 'close':
+            out.append(f"</{value}>")
+            stack.pop()
+            continue
+
+        size = telegram_length(value)
+        if units + size <= budget:
+            out.append(ESCAPES.get(value, value))
+            if value not in ESCAPES and SENTENCE_END_RE.search(value):
+                boundary = (len(out) - 1, tuple(stack), index, units)
+            units += size
+            continue
+
+        # Текст не помещается: режем по границе предложения в этом отрезке или раньше, иначе по слову
+        fitting = _prefix_fitting(value, budget - units) if value not in ESCAPES else 0
+        position = _last_sentence_end(value, fitting) if fitting else None
+        if position is not None and units + telegram_length(value[:position]) >= min_units:
+            cut = (len(out), position, tuple(stack), index, units + telegram_length(value[:position]))
+        elif boundary is not None:
+            piece_index, open_tags, token_index, before = boundary
+            run = consumed[token_index][1]
+            position = _last_sentence_end(run, len(run))
+            cut = (piece_index, position, open_tags, token_index, before + telegram_length(run[:position]))
+        if cut is None or cut[4] < min_units:
+            space = max(value.rfind(' ', 0, fitting), value.rfind('\n', 0, fitting))
+            position = space if space > 0 else fitting
+            cut = (len(out), position, tuple(stack), index, units + telegram_length(value[:position]))
+        break
+
+    piece_index, position, open_tags, token_index, cut_units = cut
+    run = consumed[token_index][1]
+    head_text = run[:position].rstrip()
+    head = "".join(out[:piece_index]) + head_text + "".join(f"</{tag}>" for tag in reversed(open_tags))
+    cut_units -= telegram_length(run[:position]) - telegram_length(head_text)
+
+    head += _render(suffix_tokens)
+    cut_units += _visible_length(suffix_tokens)
+    if not keep_rest:
+        return head, cut_units, True, None
+
+    rest = [('open', tag) for tag in open_tags]
+    remainder = run[position:].lstrip()
+    if remainder:
+        rest.append(('text', remainder))
+    rest.extend(consumed[token_index + 1:])
+    rest.extend(tokens)
+    return head, cut_units, True, rest
+
+
+def format_post(text, limit=CAPTION_LIMIT, suffix="", split=False, overflow_limit=MESSAGE_LIMIT):
+    """
+    Экранирует текст, сохраняя <b>/<i>, и укладывает его в limit единиц Telegram.
+    При обрезке к тексту добавляется suffix (с тем же синтаксисом), а при split=True
+    остаток возвращается в overflow (не длиннее overflow_limit, suffix — уже к нему).
+    """
+    tokens = _tokens(text)
+    total = visible_length(text)
+    suffix_tokens = list(_tokens(suffix)) if suffix else []
+
+    if not split:
+        html, length, truncated, _ = _fit(tokens, total, limit, suffix_tokens)
+        return FormattedPost(html, length, truncated=truncated)
+
+    html, length, truncated, rest = _fit(tokens, total, limit, keep_rest=True)
+    if not truncated:
+        return FormattedPost(html, length)
+    overflow, _, truncated, _ = _fit(iter(rest), _visible_length(rest), overflow_limit, suffix_tokens)
+    return FormattedPost(html, length, truncated=truncated, overflow=overflow)
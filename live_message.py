@@ -0,0 +1,103 @@
+"""
+Сообщение Telegram, которое обновляется «на лету».
+
+Частые обновления склеиваются: в Telegram уходит не больше одного
+редактирования за min_interval секунд, и всегда с самым свежим текстом.
+Промежуточные версии, которые устарели до отправки, просто отбрасываются.
+"""
+import asyncio
+import logging
+import time
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Лимит длины текстового сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+
+class LiveMessage:
+    """Одно сообщение в чате, текст которого редактируется с ограничением частоты."""
+
+    def __init__(self, bot, chat_id, min_interval=1.5, parse_mode=None):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self.parse_mode = parse_mode
+        self.message = None
+        self._shown_text = None
+        self._pending_text = None
+        self._last_edit = 0.0
+        self._flush_task = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def started(self):
+        """True, если в сообщение уже что-то отправлялось или отправка запланирована."""
+        return self.message is not None or self._flush_task is not None
+
+    @staticmethod
+    def _clip(text):
+        if len(text) <= MAX_MESSAGE_LENGTH:
+            return text
+        return text[:MAX_MESSAGE_LENGTH - 1] + "…"
+
+    def update(self, text):
+        """Запоминает новый текст; отправка произойдёт не раньше, чем позволит интервал."""
+        self._pending_text = self._clip(text)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        delay = self._last_edit + self.min_interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self._flush()
+
+    async def _flush(self):
+        async with self._lock:
+            text = self._pending_text
+            if text is None or text == self._shown_text:
+                return
+            self._pending_text = None
+            try:
+                if self.message is None:
+                    self.message = await self.bot.send_message(
+                        chat_id=self.chat_id, text=text, parse_mode=self.parse_mode
+                    )
+                else:
+                    await self.message.edit_text(text, parse_mode=self.parse_mode)
+                self._shown_text = text
+            except RetryAfter as e:
+                # Flood control: ждём и оставляем текст на повторную отправку
+                logger.warning(f"Telegram просит подождать {e.retry_after} с перед редактированием.")
+                if self._pending_text is None:
+                    self._pending_text = text
+                retry_after = e.retry_after
+                seconds = retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+                await asyncio.sleep(seconds)
+            except BadRequest as e:
+                if "not modified" not in str(e).lower():
+                    logger.warning(f"Не удалось обновить сообщение: {e}")
+            except TelegramError as e:
+                logger.warning(f"Не удалось обновить сообщение: {e}")
+            finally:
+                self._last_edit = time.monotonic()
+
+        # Пока шла отправка, мог прийти более свежий текст
+        if self._pending_text is not None and self._pending_text != self._shown_text:
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def finish(self, text=None):
+        """Отправляет финальный текст (или последний накопленный), соблюдая интервал."""
+        if text is not None:
+            self._pending_text = self._clip(text)
+        while True:
+            task = self._flush_task
+            if task is not None and not task.done():
+                await task
+                continue
+            if self._pending_text is None or self._pending_text == self._shown_text:
+                break
+            await self._delayed_flush()
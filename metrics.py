@@ -0,0 +1,286 @@
+"""
+Метрики конвейера: длительности этапов, счётчики кэша, токенов и байтов.
+
+- span("gpt") — замер одного этапа (fetch, parse, gpt, image_discovery, dalle,
+  telegram_send, ...). К замеру добавляются метки запроса (mode — url/manual/batch,
+  domain) и исход (ok / error или свой, например cache);
+- гистограммы с фиксированными корзинами для Prometheus и резервуарная выборка
+  для p50/p95 в команде /stats;
+- render() — текстовый формат Prometheus для маршрута /metrics.
+
+Метки запроса хранятся в contextvars: задачи, запущенные из обработчика через
+asyncio.create_task, наследуют их автоматически.
+"""
+import contextvars
+import random
+import threading
+import time
+
+# Границы корзин гистограмм длительностей, секунды
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+# Сколько последних наблюдений (случайная выборка) хранится на серию для процентилей
+RESERVOIR_SIZE = 512
+# Ограничение числа разных доменов в метках, остальные попадают в 'other'
+MAX_DOMAINS = 200
+
+_request_labels = contextvars.ContextVar('metrics_request_labels', default=None)
+_known_domains = set()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def percentile(sorted_values, q):
+    """Процентиль q (0..1) по отсортированному списку, None для пустого."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Counter:
+    """Монотонный счётчик с метками."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def values(self):
+        """{кортеж значений меток: значение}."""
+        with self._lock:
+            return dict(self._values)
+
+    def total(self, **labels):
+        """Сумма по сериям, у которых совпадают переданные метки."""
+        return sum(
+            value for key, value in self.values().items()
+            if all(key[self.labelnames.index(name)] == str(wanted) for name, wanted in labels.items())
+        )
+
+    def render(self):
+        lines = []
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class _Series:
+    __slots__ = ('buckets', 'count', 'sum', 'reservoir')
+
+    def __init__(self, bucket_count):
+        self.buckets = [0] * bucket_count
+        self.count = 0
+        self.sum = 0.0
+        self.reservoir = []
+
+
+class Histogram:
+    """Гистограмма с корзинами Prometheus и резервуарной выборкой для процентилей."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, reservoir_size=RESERVOIR_SIZE):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self.reservoir_size = reservoir_size
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(len(self.bounds))
+            for i, bound in enumerate(self.bounds):
+                if value <= bound:
+                    series.buckets[i] += 1
+                    break
+            series.count += 1
+            series.sum += value
+            # Резервуарная выборка (алгоритм R): равномерная выборка из всех наблюдений серии
+            if len(series.reservoir) < self.reservoir_size:
+                series.reservoir.append(value)
+            else:
+                slot = random.randrange(series.count)
+                if slot < self.reservoir_size:
+                    series.reservoir[slot] = value
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def summary(self, group_by):
+        """
+        Сводка по значению метки group_by: {значение: {'count', 'sum', 'p50', 'p95'}}.
+        Процентили считаются по объединённым резервуарам серий (приближённо).
+        """
+        index = self.labelnames.index(group_by)
+        groups = {}
+        with self._lock:
+            for key, series in self._series.items():
+                group = groups.setdefault(key[index], {'count': 0, 'sum': 0.0, 'values': []})
+                group['count'] += series.count
+                group['sum'] += series.sum
+                group['values'].extend(series.reservoir)
+        result = {}
+        for name, group in groups.items():
+            values = sorted(group['values'])
+            result[name] = {
+                'count': group['count'],
+                'sum': group['sum'],
+                'p50': percentile(values, 0.5),
+                'p95': percentile(values, 0.95),
+            }
+        return result
+
+    def render(self):
+        lines = []
+        with self._lock:
+            items = sorted((key, list(s.buckets), s.count, s.sum) for key, s in self._series.items())
+        for key, buckets, count, total in items:
+            cumulative = 0
+            for bound, bucket in zip(self.bounds, buckets):
+                cumulative += bucket
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), **kwargs):
+        metric = Histogram(name, documentation, labelnames, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def reset(self):
+        """Обнуляет все метрики (например, между прогонами бенчмарка)."""
+        for metric in self._metrics:
+            metric.reset()
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'bot_stage_duration_seconds', 'Длительность этапов конвейера',
+    ('stage', 'mode', 'domain', 'outcome')
+)
+AI_CACHE_LOOKUPS = registry.counter(
+    'bot_ai_cache_lookups_total', 'Обращения к кэшу GPT/DALL-E', ('kind', 'result')
+)
+OPENAI_TOKENS = registry.counter(
+    'bot_openai_tokens_total', 'Токены OpenAI по моделям', ('model', 'type')
+)
+FETCHED_BYTES = registry.counter(
+    'bot_fetched_bytes_total', 'Загружено байтов с сайтов-источников', ('kind',)
+)
+
+
+def domain_label(domain):
+    """Метка домена: первые MAX_DOMAINS разных доменов как есть, остальные — 'other'."""
+    if domain and domain not in _known_domains:
+        if len(_known_domains) >= MAX_DOMAINS:
+            return 'other'
+        _known_domains.add(domain)
+    return domain
+
+
+def set_request_labels(mode, domain=''):
+    """Задаёт метки текущего запроса (и всех задач, запущенных из него после вызова)."""
+    _request_labels.set({'mode': mode, 'domain': domain_label(domain)})
+
+
+def request_labels():
+    return _request_labels.get() or {'mode': 'other', 'domain': ''}
+
+
+class span:
+    """
+    Замер этапа: `with span("gpt") as s:` или `async with`. При исключении исход — error,
+    иначе ok; исход можно задать вручную (s.outcome = "cache"). Метки запроса берутся
+    из set_request_labels, их можно переопределить аргументами (domain ограничивается
+    так же, как в set_request_labels).
+    """
+
+    def __init__(self, stage, **labels):
+        self.stage = stage
+        self.labels = labels
+        self.outcome = None
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        labels = {**request_labels(), **self.labels}
+        if 'domain' in self.labels:
+            labels['domain'] = domain_label(labels['domain'])
+        outcome = self.outcome or ('error' if exc_type is not None else 'ok')
+        STAGE_SECONDS.observe(elapsed, stage=self.stage, outcome=outcome, **labels)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def record_usage(model, usage):
+    """Учитывает объект usage из ответа OpenAI (prompt/completion tokens)."""
+    if usage is None:
+        return
+    OPENAI_TOKENS.inc(getattr(usage, 'prompt_tokens', 0) or 0, model=model, type='prompt')
+    OPENAI_TOKENS.inc(getattr(usage, 'completion_tokens', 0) or 0, model=model, type='completion')
+
+
+def stage_summary():
+    """{этап: {'count', 'sum', 'p50', 'p95'}} по всем режимам, доменам и исходам."""
+    return STAGE_SECONDS.summary('stage')
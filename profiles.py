@@ -0,0 +1,168 @@
+"""
+Профили доменов для извлечения статей.
+
+Для каждого сайта запоминается, какой селектор контейнера статьи и какой
+способ поиска картинки сработали, какой User-Agent не получил отказа, а также
+средняя задержка загрузки и доля ответов 403. При следующей ссылке с того же
+сайта сначала пробуются уже проверенные варианты.
+
+Профили хранятся в локальном JSON-файле и сохраняются не чаще раза в
+SAVE_INTERVAL секунд (и при остановке бота).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+SAVE_INTERVAL = 30
+# Вес нового замера в скользящем среднем задержки
+LATENCY_EWMA_ALPHA = 0.3
+
+
+def domain_of(url):
+    """Домен сайта для ключа профиля: нижний регистр, без www. и порта."""
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def _best(counter):
+    if not counter:
+        return None
+    return max(counter.items(), key=lambda item: item[1])[0]
+
+
+class DomainProfileStore:
+    """Статистика извлечения по доменам с сохранением в JSON-файл."""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = 0.0
+        self._profiles = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self._profiles = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Не удалось прочитать профили доменов {path}: {e}")
+
+    def _profile(self, domain):
+        return self._profiles.setdefault(domain, {
+            'container': {},
+            'image': {},
+            'user_agent': {},
+            'fetches': 0,
+            'errors_403': 0,
+            'failures': 0,
+            'latency_ms': None,
+            'updated_at': None,
+        })
+
+    def hints(self, domain):
+        """Проверенные варианты для домена: {'container', 'image', 'user_agent'} (None — нет данных)."""
+        with self._lock:
+            profile = self._profiles.get(domain)
+            if not profile:
+                return {'container': None, 'image': None, 'user_agent': None}
+            user_agent = _best(profile['user_agent'])
+            return {
+                'container': _best(profile['container']),
+                'image': _best(profile['image']),
+                'user_agent': int(user_agent) if user_agent is not None else None,
+            }
+
+    def record_fetch(self, domain, latency_ms, status, user_agent=None):
+        """Учитывает одну загрузку: задержку, код ответа (None — сетевая ошибка) и User-Agent."""
+        with self._lock:
+            profile = self._profile(domain)
+            profile['fetches'] += 1
+            if status == 403:
+                profile['errors_403'] += 1
+            elif status is None or status >= 400:
+                profile['failures'] += 1
+            elif user_agent is not None:
+                key = str(user_agent)
+                profile['user_agent'][key] = profile['user_agent'].get(key, 0) + 1
+            if status is not None and status < 400:
+                previous = profile['latency_ms']
+                profile['latency_ms'] = round(
+                    latency_ms if previous is None
+                    else previous + LATENCY_EWMA_ALPHA * (latency_ms - previous), 1
+                )
+            profile['updated_at'] = time.time()
+            self._dirty = True
+        self.save_if_due()
+
+    def record_extraction(self, domain, container_selector, image_selector):
+        """Учитывает, какие селекторы сработали на странице домена."""
+        with self._lock:
+            profile = self._profile(domain)
+            if container_selector:
+                profile['container'][container_selector] = profile['container'].get(container_selector, 0) + 1
+            if image_selector:
+                profile['image'][image_selector] = profile['image'].get(image_selector, 0) + 1
+            profile['updated_at'] = time.time()
+            self._dirty = True
+        self.save_if_due()
+
+    def forbidden_rate(self, domain):
+        """Доля ответов 403 среди загрузок домена."""
+        with self._lock:
+            profile = self._profiles.get(domain)
+            if not profile or not profile['fetches']:
+                return 0.0
+            return profile['errors_403'] / profile['fetches']
+
+    def get(self, domain):
+        with self._lock:
+            profile = self._profiles.get(domain)
+            return json.loads(json.dumps(profile)) if profile else None
+
+    def summary(self):
+        """Список (домен, загрузок, доля 403, задержка) по убыванию числа загрузок."""
+        with self._lock:
+            rows = [
+                (domain, p['fetches'], p['errors_403'] / p['fetches'] if p['fetches'] else 0.0, p['latency_ms'])
+                for domain, p in self._profiles.items()
+            ]
+        return sorted(rows, key=lambda row: row[1], reverse=True)
+
+    def reset(self, domain=None):
+        """Сбрасывает профиль одного домена или все профили. Возвращает число удалённых."""
+        with self._lock:
+            if domain:
+                removed = 1 if self._profiles.pop(domain, None) is not None else 0
+            else:
+                removed = len(self._profiles)
+                self._profiles.clear()
+            self._dirty = True
+        self.save()
+        return removed
+
+    def save_if_due(self):
+        if self._dirty and time.monotonic() - self._last_save >= SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        """Атомарно записывает профили в файл."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._profiles, ensure_ascii=False, indent=1)
+            self._dirty = False
+            self._last_save = time.monotonic()
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить профили доменов: {e}")
@@ -0,0 +1,210 @@
+"""
+Общий слой устойчивости для внешних вызовов (OpenAI, Telegram, сайты-источники).
+
+- TokenBucket — ограничитель частоты запросов к одному сервису;
+- retry_async — повтор с экспоненциальной задержкой и джиттером, учитывающий Retry-After;
+- CircuitBreaker / CircuitBreakerRegistry — размыкатель цепи по хостам: после серии
+  ошибок запросы к сайту какое-то время сразу отклоняются, не тратя время на таймауты;
+- hedged — «страхующий» второй запрос, если первый отвечает слишком долго.
+"""
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Цепь разомкнута: сервис недавно много раз подряд отвечал ошибкой."""
+
+
+def parse_retry_after(value):
+    """Разбирает заголовок Retry-After (секунды или HTTP-дата) в секунды. None, если не удалось."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Ведро токенов: не больше rate запросов в секунду в среднем, всплеск до capacity."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens=1.0):
+        """Ждёт, пока в ведре наберётся нужное число токенов, и забирает их."""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Опустошает ведро на seconds секунд (сервис сам попросил подождать)."""
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class CircuitBreaker:
+    """
+    Размыкатель цепи: после failure_threshold ошибок подряд вызовы отклоняются
+    reset_timeout секунд, затем пропускается одна пробная попытка.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        """Бросает CircuitOpenError, если вызов сейчас не разрешён."""
+        state = self.state
+        if state == 'open':
+            raise CircuitOpenError(f"{self.name}: цепь разомкнута после {self.failures} ошибок подряд")
+        if state == 'half-open':
+            if self._probe_in_flight:
+                raise CircuitOpenError(f"{self.name}: идёт пробный запрос")
+            self._probe_in_flight = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_cancelled(self):
+        """Вызов отменён до ответа: ни успех, ни ошибка, но пробный слот нужно освободить."""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None or self.state != 'open':
+                logger.warning(f"Размыкаю цепь для {self.name} на {self.reset_timeout:.0f} с")
+            self.opened_at = time.monotonic()
+
+
+class CircuitBreakerRegistry:
+    """Размыкатели по ключу (например, по хосту), создаются по требованию."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+
+    def get(self, key):
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(key, self.failure_threshold, self.reset_timeout)
+            self._breakers[key] = breaker
+        return breaker
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """Экспоненциальная задержка с полным джиттером для попытки attempt (с 1)."""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+
+
+async def retry_async(operation, *, name, is_retryable, retry_after=None, attempts=4,
+                      base_delay=1.0, max_delay=30.0, limiter=None, breaker=None):
+    """
+    Выполняет operation() (фабрику корутины) с повторами.
+
+    is_retryable(exc) решает, стоит ли повторять; retry_after(exc) может вернуть
+    задержку, которую попросил сервис (она важнее расчётной). Перед каждой попыткой
+    берётся токен из limiter, а breaker учитывает успехи и ошибки.
+    """
+    for attempt in range(1, attempts + 1):
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            if limiter is not None:
+                await limiter.acquire()
+            result = await operation()
+        except asyncio.CancelledError:
+            # Иначе отменённая пробная попытка навсегда оставила бы цепь в состоянии «идёт пробный запрос»
+            if breaker is not None:
+                breaker.record_cancelled()
+            raise
+        except Exception as e:
+            retryable = is_retryable(e)
+            if breaker is not None:
+                if retryable:
+                    breaker.record_failure()
+                else:
+                    # Неповторяемая ошибка (например, 404) означает, что сервис отвечает
+                    breaker.record_success()
+            if not retryable or attempt == attempts:
+                raise
+            delay = retry_after(e) if retry_after else None
+            if delay is not None and limiter is not None:
+                limiter.pause(delay)
+            if delay is None:
+                delay = backoff_delay(attempt, base_delay, max_delay)
+            logger.warning(f"{name}: попытка {attempt}/{attempts} не удалась ({e}), повтор через {delay:.1f} с")
+            await asyncio.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+
+async def hedged(operation, delay):
+    """
+    Запускает operation(); если за delay секунд ответа нет, запускает второй такой же
+    запрос. Возвращается первый успешный результат, второй запрос отменяется.
+    """
+    tasks = {asyncio.ensure_future(operation())}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            logger.info(f"Запрос идёт дольше {delay:.0f} с, запускаю страхующий второй")
+            tasks.add(asyncio.ensure_future(operation()))
+
+        error = None
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        leftover = [task for task in tasks if not task.done()]
+        for task in leftover:
+            task.cancel()
+        if leftover:
+            await asyncio.gather(*leftover, return_exceptions=True)
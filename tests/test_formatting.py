@@ -0,0 +1,92 @@
+"""
+Свойства formatting.format_post на случайных текстах (hypothesis).
+
+Проверки те же, что в benchmarks/bench_formatting.py (problems, visible):
+- теги только <b>/<i>, корректно вложены и закрыты, вне тегов нет сырых < > &;
+- видимая длина в единицах UTF-16 не больше лимита и совпадает с FormattedPost.length;
+- без обрезки видимый текст равен исходному (без разрешённых тегов);
+- при split подпись и продолжение вместе дают весь исходный текст.
+
+Запуск:
+    python -m pytest -q tests
+"""
+import os
+import re
+import sys
+
+from hypothesis import given, settings, strategies as st
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import formatting  # noqa: E402
+from bench_formatting import ALLOWED_TAG_RE, FRAGMENTS, LIMIT, SUFFIX, problems, visible  # noqa: E402
+
+# Фрагменты бенчмарка (эмодзи, &, <, >, лишние и перекрёстные теги) вперемешку с произвольным текстом
+texts = st.lists(
+    st.one_of(st.sampled_from(FRAGMENTS), st.text(max_size=20)), max_size=300
+).map("".join)
+# Лимит не меньше длины суффикса: иначе суффикс не помещается сам
+limits = st.integers(min_value=formatting.visible_length(SUFFIX), max_value=formatting.MESSAGE_LIMIT)
+
+
+def expected_visible(text):
+    return ALLOWED_TAG_RE.sub("", text)
+
+
+def without_spaces(text):
+    return re.sub(r"\s", "", text)
+
+
+@settings(max_examples=500, deadline=None)
+@given(texts, limits)
+def test_markup_is_balanced_and_fits(text, limit):
+    post = formatting.format_post(text, limit=limit, suffix=SUFFIX)
+    assert problems(post.text, limit) == []
+    assert post.length == formatting.telegram_length(visible(post.text))
+
+
+@settings(max_examples=500, deadline=None)
+@given(texts, limits)
+def test_text_unchanged_without_truncation(text, limit):
+    post = formatting.format_post(text, limit=limit, suffix=SUFFIX)
+    if not post.truncated:
+        assert visible(post.text) == expected_visible(text)
+
+
+@given(texts)
+def test_short_text_is_not_truncated(text):
+    post = formatting.format_post(text, limit=formatting.MESSAGE_LIMIT * 2, suffix=SUFFIX)
+    assert not post.truncated
+    assert visible(post.text) == expected_visible(text)
+
+
+@settings(max_examples=500, deadline=None)
+@given(texts, st.integers(min_value=1, max_value=formatting.CAPTION_LIMIT))
+def test_split_caption_and_overflow_give_whole_text(text, limit):
+    post = formatting.format_post(text, limit=limit, split=True)
+    assert problems(post.text, limit) == []
+    if post.overflow is None:
+        assert visible(post.text) == expected_visible(text)
+        return
+    assert problems(post.overflow, formatting.MESSAGE_LIMIT) == []
+    if not post.truncated:
+        # На месте разреза пробелы срезаются: сравнение без пробельных символов
+        joined = visible(post.text) + visible(post.overflow)
+        assert without_spaces(joined) == without_spaces(expected_visible(text))
+
+
+def test_caption_limit_counts_utf16_units():
+    text = "🚀" * 600
+    post = formatting.format_post(text, limit=formatting.CAPTION_LIMIT)
+    assert post.truncated
+    assert formatting.telegram_length(visible(post.text)) <= formatting.CAPTION_LIMIT
+    assert post.length == 2 * len(visible(post.text))
+
+
+def test_default_bot_limit():
+    post = formatting.format_post("Предложение. " * 200, limit=LIMIT, suffix=SUFFIX)
+    assert post.truncated
+    assert post.length <= LIMIT
+    assert post.text.endswith(formatting.format_post(SUFFIX).text)
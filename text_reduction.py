@@ -0,0 +1,127 @@
+"""
+Сокращение текста статьи до бюджета токенов перед отправкой в GPT-4o.
+
+Для поста на ~850 символов не нужен весь лонгрид с комментариями и блоками
+«читайте также». Абзацы оцениваются по значимости (лид, пересечение со словами
+заголовка, плотность чисел и имён собственных), и сохраняются лучшие из них
+в пределах бюджета — в исходном порядке.
+
+Токены считаются быстрой локальной оценкой без токенизатора: для GPT-4o
+латиница даёт около 4 символов на токен, кириллица и прочие символы — около 3.
+"""
+import math
+import re
+
+# Символов на токен для ASCII и для остальных символов
+ASCII_CHARS_PER_TOKEN = 4.0
+OTHER_CHARS_PER_TOKEN = 3.0
+
+PARAGRAPH_SPLIT_RE = re.compile(r"\n\s*\n")
+LINE_SPLIT_RE = re.compile(r"\n+")
+NON_ASCII_RE = re.compile(r"[^\x00-\x7f]")
+WORD_RE = re.compile(r"[^\W\d_]{4,}", re.UNICODE)
+NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+# Слово с заглавной буквы не в начале предложения — грубый признак имени или названия
+PROPER_NOUN_RE = re.compile(r"(?<![.!?]\s)(?<!^)\b[A-ZА-ЯЁ][a-zа-яё]{2,}")
+BOILERPLATE_RE = re.compile(
+    r"(cookie|subscribe|newsletter|sign up|read more|related|comments?|advertis|all rights reserved|"
+    r"подпис|реклам|читайте также|комментари|все права защищены|поделиться)",
+    re.IGNORECASE
+)
+
+# Короткие абзацы (подписи, кнопки) почти никогда не несут сути
+MIN_PARAGRAPH_CHARS = 40
+# Сколько первых абзацев считаются лидом
+LEAD_PARAGRAPHS = 2
+
+
+def estimate_tokens(text):
+    """Быстрая оценка числа токенов GPT-4o без внешнего токенизатора."""
+    if not text:
+        return 0
+    non_ascii = len(NON_ASCII_RE.findall(text))
+    ascii_count = len(text) - non_ascii
+    return math.ceil(ascii_count / ASCII_CHARS_PER_TOKEN + non_ascii / OTHER_CHARS_PER_TOKEN)
+
+
+def _stems(text):
+    # Грубая нормализация словоформ: первые 5 букв слова в нижнем регистре
+    return {word.lower()[:5] for word in WORD_RE.findall(text)}
+
+
+def split_paragraphs(text):
+    """Делит текст на абзацы по пустым строкам, а если их нет — по переводам строк."""
+    paragraphs = [p.strip() for p in PARAGRAPH_SPLIT_RE.split(text) if p.strip()]
+    if len(paragraphs) <= 1:
+        paragraphs = [p.strip() for p in LINE_SPLIT_RE.split(text) if p.strip()]
+    return paragraphs
+
+
+def score_paragraph(paragraph, index, title_stems):
+    """Оценка значимости абзаца: лид, пересечение с заголовком, числа и имена собственные."""
+    length = len(paragraph)
+    if length < MIN_PARAGRAPH_CHARS:
+        return 0.0
+
+    score = 0.0
+    if index < LEAD_PARAGRAPHS:
+        score += 3.0 - index
+    else:
+        score += 1.0 / (1 + index * 0.25)
+
+    if title_stems:
+        overlap = len(_stems(paragraph) & title_stems)
+        score += 2.0 * overlap / len(title_stems)
+
+    words = max(1, len(paragraph.split()))
+    numbers = len(NUMBER_RE.findall(paragraph))
+    proper_nouns = len(PROPER_NOUN_RE.findall(paragraph))
+    score += min(1.5, 10.0 * (numbers + proper_nouns) / words)
+
+    if BOILERPLATE_RE.search(paragraph):
+        score -= 2.0
+    return score
+
+
+def reduce_to_budget(title, text, budget):
+    """
+    Оставляет самые значимые абзацы текста в пределах budget токенов.
+    Возвращает (текст, статистика): tokens_before, tokens_after, paragraphs_kept, paragraphs_total.
+    Текст, который уже укладывается в бюджет, возвращается без изменений.
+    """
+    tokens_before = estimate_tokens(text)
+    paragraphs = split_paragraphs(text)
+    stats = {
+        'tokens_before': tokens_before,
+        'tokens_after': tokens_before,
+        'paragraphs_kept': len(paragraphs),
+        'paragraphs_total': len(paragraphs),
+    }
+    if tokens_before <= budget or not paragraphs:
+        return text, stats
+
+    title_stems = _stems(title or "")
+    costs = [estimate_tokens(p) + 1 for p in paragraphs]
+    ranked = sorted(
+        range(len(paragraphs)),
+        key=lambda i: (score_paragraph(paragraphs[i], i, title_stems), -i),
+        reverse=True
+    )
+
+    kept = set()
+    used = 0
+    for i in ranked:
+        if used + costs[i] <= budget:
+            kept.add(i)
+            used += costs[i]
+
+    if not kept:
+        # Даже лучший абзац не влезает целиком — берём начало текста по бюджету
+        approx_chars = int(budget * OTHER_CHARS_PER_TOKEN)
+        reduced = text[:approx_chars]
+        stats.update(tokens_after=estimate_tokens(reduced), paragraphs_kept=0)
+        return reduced, stats
+
+    reduced = "\n\n".join(paragraphs[i] for i in sorted(kept))
+    stats.update(tokens_after=estimate_tokens(reduced), paragraphs_kept=len(kept))
+    return reduced, stats
@@ -0,0 +1,180 @@
+"""
+Веб-сервер бота: приём обновлений Telegram по webhook, /metrics и /healthz.
+
+Заменяет встроенный Application.run_webhook: его сервер не позволяет добавить
+свои маршруты, а метрики должны отдаваться с того же порта (на Render открыт один).
+Жизненный цикл приложения повторяет run_webhook: initialize -> post_init ->
+start, а при SIGINT/SIGTERM — stop -> post_stop -> shutdown -> post_shutdown.
+
+Для быстрого холодного старта порт открывается до инициализации приложения
+(getMe и прочие сетевые вызовы): пришедшие в это время обновления сразу получают
+ответ 200 и ждут в буфере, а set_webhook выполняется в фоне.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import signal
+import time
+from http import HTTPStatus
+
+import tornado.httpserver
+import tornado.web
+from telegram import Update
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений держать в буфере, пока приложение запускается (дальше — 503, Telegram повторит)
+MAX_PENDING_UPDATES = 1000
+
+
+class WebApp(tornado.web.Application):
+    def log_request(self, handler):
+        # В пути webhook есть токен бота — в лог INFO его не пишем
+        logger.debug(f"{handler.request.method} {type(handler).__name__} {handler.get_status()} "
+                     f"{handler.request.request_time() * 1000:.0f} мс")
+
+
+class UpdateIntake:
+    """
+    Передаёт обновления в очередь приложения. Пока приложение не запущено,
+    сырые обновления копятся в буфере и передаются при вызове ready().
+    """
+
+    def __init__(self, bot_app):
+        self.bot_app = bot_app
+        self.is_ready = False
+        self.pending = []
+
+    def accept(self, data):
+        """Принимает разобранный JSON обновления. False — буфер переполнен."""
+        if self.is_ready:
+            self._enqueue(data)
+            return True
+        if len(self.pending) >= MAX_PENDING_UPDATES:
+            return False
+        self.pending.append(data)
+        return True
+
+    def ready(self):
+        """Приложение запущено: буфер передаётся в очередь, дальше — напрямую. Возвращает размер буфера."""
+        pending, self.pending = self.pending, []
+        for data in pending:
+            self._enqueue(data)
+        self.is_ready = True
+        return len(pending)
+
+    def _enqueue(self, data):
+        try:
+            update = Update.de_json(data, self.bot_app.bot)
+        except Exception as e:
+            logger.error(f"Webhook: не удалось разобрать обновление: {e}")
+            return
+        if update:
+            self.bot_app.update_queue.put_nowait(update)
+
+
+class TelegramWebhookHandler(tornado.web.RequestHandler):
+    """Принимает обновление от Telegram и сразу отвечает 200."""
+
+    def initialize(self, intake):
+        self.intake = intake
+
+    def post(self):
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            logger.warning("Webhook: получено тело, не являющееся JSON")
+            raise tornado.web.HTTPError(HTTPStatus.BAD_REQUEST)
+
+        if not self.intake.accept(data):
+            raise tornado.web.HTTPError(HTTPStatus.SERVICE_UNAVAILABLE)
+        self.set_status(HTTPStatus.OK)
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """Метрики в текстовом формате Prometheus. Если задан токен, нужен Bearer или ?token=."""
+
+    def initialize(self, token=None):
+        self.token = token
+
+    def get(self):
+        if self.token:
+            header = self.request.headers.get('Authorization', '')
+            provided = header[7:] if header.startswith('Bearer ') else self.get_query_argument('token', '')
+            if not hmac.compare_digest(provided, self.token):
+                raise tornado.web.HTTPError(HTTPStatus.UNAUTHORIZED)
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(registry.render())
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write("ok")
+
+
+def make_web_app(intake, url_path, metrics_token=None):
+    return WebApp([
+        (rf"/{url_path.strip('/')}/?", TelegramWebhookHandler, {'intake': intake}),
+        (r"/metrics", MetricsHandler, {'token': metrics_token}),
+        (r"/healthz", HealthHandler),
+    ])
+
+
+async def _set_webhook(bot_app, webhook_url):
+    try:
+        await bot_app.bot.set_webhook(url=webhook_url)
+        logger.info("Webhook зарегистрирован в Telegram.")
+    except Exception as e:
+        logger.error(f"Не удалось зарегистрировать webhook {webhook_url}: {e}")
+
+
+async def serve_webhook(bot_app, listen, port, url_path, webhook_url, metrics_token=None, started_at=None):
+    """
+    Запускает приложение бота за собственным веб-сервером и работает до сигнала остановки.
+    started_at — time.perf_counter() начала запуска процесса, для лога холодного старта.
+    """
+    started_at = started_at if started_at is not None else time.perf_counter()
+
+    def elapsed_ms():
+        return (time.perf_counter() - started_at) * 1000
+
+    loop = asyncio.get_running_loop()
+    stop_event = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    intake = UpdateIntake(bot_app)
+    server = tornado.httpserver.HTTPServer(make_web_app(intake, url_path, metrics_token))
+    server.listen(port, address=listen)
+    listening_ms = elapsed_ms()
+    logger.info(f"Веб-сервер слушает {listen}:{port} (webhook, /metrics, /healthz) через {listening_ms:.0f} мс после запуска")
+    webhook_task = None
+    try:
+        await bot_app.initialize()
+        if bot_app.post_init:
+            await bot_app.post_init(bot_app)
+        await bot_app.start()
+        buffered = intake.ready()
+        logger.info(
+            f"Холодный старт: порт открыт через {listening_ms:.0f} мс, бот готов через {elapsed_ms():.0f} мс "
+            f"(обновлений в буфере: {buffered})"
+        )
+        webhook_task = asyncio.create_task(_set_webhook(bot_app, webhook_url))
+        await stop_event.wait()
+    finally:
+        server.stop()
+        if webhook_task is not None and not webhook_task.done():
+            webhook_task.cancel()
+        if bot_app.running:
+            await bot_app.stop()
+            if bot_app.post_stop:
+                await bot_app.post_stop(bot_app)
+        await bot_app.shutdown()
+        if bot_app.post_shutdown:
+            await bot_app.post_shutdown(bot_app)